@@ -25,16 +25,26 @@ def create_app(config_class=Config):
     jwt.init_app(app)
     CORS(app)
     
+    # tokens revoked by logout are refused here and by the socket service
+    from app.services.token_revocation import is_revoked
+    
+    @jwt.token_in_blocklist_loader
+    def token_revoked(jwt_header, jwt_payload):
+        return is_revoked(jwt_payload['jti'])
+    
     # register blueprints
     from app.api.auth import auth_bp
     from app.api.users import user_bp
     from app.api.listings import listing_bp
     from app.api.chat import chat_bp
+    from app.api.metrics import metrics_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(user_bp, url_prefix='/api/users')
     app.register_blueprint(listing_bp, url_prefix='/api/listings')
     app.register_blueprint(chat_bp, url_prefix='/api/chat')
+    # worker metrics (cache hit ratios)
+    app.register_blueprint(metrics_bp)
     
     # register error handlers
     @app.errorhandler(404)
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt
 from app.models.user import User
 from app.services.user_service import create_user, validate_user
+from app.services.token_revocation import revoke_token
 from app import db
 import email_validator
 
@@ -56,4 +57,16 @@ def login():
     return jsonify({
         "access_token": access_token,
         "user": user.to_dict()
-    }), 200 
\ No newline at end of file
+    }), 200
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    """revoke the current access token, for the API and for socket connects"""
+    token = get_jwt()
+    try:
+        revoke_token(token['jti'], token['exp'])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    return jsonify({"message": "Logged out successfully"}), 200
@@ -1,29 +1,83 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models.message import Message, Conversation, ConversationParticipant
+from app.models.message import Message, Conversation
 from app.models.user import User
+from app.services.chat_service import (direct_messages_query, read_bound, pending_message,
+                                       read_cursor, read_cursor_columns,
+                                       advance_read_cursor, direct_unread_count,
+                                       paginate_messages, message_page, get_inbox,
+                                       conversations_version, conversation_version, thread_version,
+                                       direct_version)
+from app.services.realtime_service import publish_event
+from app.services.membership import is_participant, invalidate_members
+from app.services.contacts import add_contacts
+from app.services import cache
+from app.services.cache import USERS_TAG
+from app.utils.http_cache import make_etag, not_modified, with_validators
+from app.utils.pagination import parse_limit
 from app import db
 from datetime import datetime
+from itertools import combinations
 import uuid
 
 chat_bp = Blueprint('chat', __name__)
 
+def participants_etag(*parts):
+    """etag of a response that shows participant profiles, None while their version is unknown"""
+    versions = cache.tag_versions([USERS_TAG])
+    return make_etag(*parts, versions) if versions is not None else None
+
 @chat_bp.route('/conversations', methods=['GET'])
 @jwt_required()
 def get_conversations():
     """get all conversations for the current user"""
     user_id = get_jwt_identity()
     
+    etag = participants_etag('conversations', user_id, conversations_version(user_id))
+    response = not_modified(etag)
+    if response:
+        return response
+    
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "user not found"}), 404
     
     conversations = user.conversations
     
-    return jsonify({
+    return with_validators((jsonify({
         "success": True,
         "data": [conv.to_dict() for conv in conversations]
-    }), 200
+    }), 200), etag)
+
+@chat_bp.route('/inbox', methods=['GET'])
+@jwt_required()
+def get_inbox_page():
+    """get the current user's conversations with their latest message and unread count"""
+    user_id = get_jwt_identity()
+    
+    try:
+        limit = parse_limit(request.args.get('limit'),
+                            current_app.config['INBOX_PAGE_SIZE'],
+                            current_app.config['INBOX_MAX_PAGE_SIZE'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    cursor = request.args.get('cursor')
+    etag = participants_etag('inbox', user_id, limit, cursor, conversations_version(user_id))
+    response = not_modified(etag)
+    if response:
+        return response
+    
+    try:
+        entries, next_cursor = get_inbox(user_id, limit, cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return with_validators((jsonify({
+        "success": True,
+        "data": entries,
+        "next_cursor": next_cursor
+    }), 200), etag)
 
 @chat_bp.route('/conversations', methods=['POST'])
 @jwt_required()
@@ -56,6 +110,9 @@ def create_conversation():
         conversation.participants.append(user)
     
     db.session.commit()
+    invalidate_members(conversation.conversation_id)
+    # participants now get each other's presence updates
+    add_contacts(combinations(participants, 2))
     
     return jsonify({
         "success": True,
@@ -67,41 +124,59 @@ def create_conversation():
 def get_conversation(conversation_id):
     user_id = get_jwt_identity()
     
-    # validate conversation exists and user is a participant
-    conversation = Conversation.query.get(conversation_id)
-    if not conversation:
-        return jsonify({"error": "conversation not found"}), 404
-    
-    if user_id not in [p.user_id for p in conversation.participants]:
+    # validate user is a participant, then that the conversation exists
+    if not is_participant(conversation_id, user_id):
+        if not Conversation.query.get(conversation_id):
+            return jsonify({"error": "conversation not found"}), 404
         return jsonify({"error": "unauthorized to access this conversation"}), 403
     
-    return jsonify({
+    etag = participants_etag('conversation', conversation_id, conversation_version(conversation_id))
+    response = not_modified(etag)
+    if response:
+        return response
+    
+    conversation = Conversation.query.get(conversation_id)
+    
+    return with_validators((jsonify({
         "success": True,
         "data": conversation.to_dict()
-    }), 200
+    }), 200), etag)
 
 @chat_bp.route('/conversations/<conversation_id>/messages', methods=['GET'])
 @jwt_required()
 def get_messages(conversation_id):
     user_id = get_jwt_identity()
     
-    # validate conversation exists and user is a participant
-    conversation = Conversation.query.get(conversation_id)
-    if not conversation:
-        return jsonify({"error": "conversation not found"}), 404
-    
-    if user_id not in [p.user_id for p in conversation.participants]:
+    # validate user is a participant, a participant implies the conversation exists
+    if not is_participant(conversation_id, user_id):
+        if not Conversation.query.get(conversation_id):
+            return jsonify({"error": "conversation not found"}), 404
         return jsonify({"error": "unauthorized to access this conversation"}), 403
     
-    # get messages, sorted by timestamp
-    messages = Message.query.filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.timestamp.asc()).all()
+    # get one page of messages, sorted by timestamp
+    thread = Message.query.filter(Message.conversation_id == conversation_id)
+    try:
+        limit = parse_limit(request.args.get('limit'),
+                            current_app.config['MESSAGES_PAGE_SIZE'],
+                            current_app.config['MESSAGES_MAX_PAGE_SIZE'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    return jsonify({
-        "success": True,
-        "data": [msg.to_dict() for msg in messages]
-    }), 200
+    before, after = request.args.get('before'), request.args.get('after')
+    # the page shows which messages the user has read, so it changes with their read cursor
+    version = thread_version(thread, *read_cursor_columns(user_id, conversation_id=conversation_id))
+    etag = make_etag('messages', user_id, conversation_id, limit, before, after, version)
+    response = not_modified(etag)
+    if response:
+        return response
+    
+    try:
+        messages, has_more = paginate_messages(thread, limit, before=before, after=after)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    cursor = read_cursor(user_id, conversation_id=conversation_id)
+    return with_validators((jsonify(message_page(messages, has_more, user_id, cursor)), 200), etag)
 
 @chat_bp.route('/messages/direct', methods=['GET'])
 @jwt_required()
@@ -117,15 +192,96 @@ def get_direct_messages():
     if not User.query.get(other_user_id):
         return jsonify({"error": "user not found"}), 404
     
-    # get all messages between the two users
-    messages = Message.query.filter(
-        ((Message.sender_id == user_id) & (Message.recipient_id == other_user_id)) |
-        ((Message.sender_id == other_user_id) & (Message.recipient_id == user_id))
-    ).order_by(Message.timestamp.asc()).all()
+    # get one page of messages between the two users
+    thread = direct_messages_query(user_id, other_user_id)
+    try:
+        limit = parse_limit(request.args.get('limit'),
+                            current_app.config['MESSAGES_PAGE_SIZE'],
+                            current_app.config['MESSAGES_MAX_PAGE_SIZE'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    before, after = request.args.get('before'), request.args.get('after')
+    etag = make_etag('direct', user_id, other_user_id, limit, before, after, direct_version(user_id, other_user_id))
+    response = not_modified(etag)
+    if response:
+        return response
+    
+    try:
+        messages, has_more = paginate_messages(thread, limit, before=before, after=after)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    cursor = read_cursor(user_id, peer_id=other_user_id)
+    result = message_page(messages, has_more, user_id, cursor)
+    result['unread_count'] = direct_unread_count(user_id, other_user_id, cursor)
+    return with_validators((jsonify(result), 200), etag)
+
+@chat_bp.route('/messages/read', methods=['PUT'])
+@jwt_required()
+def mark_thread_as_read():
+    """mark all messages up to a message or timestamp as read in a conversation or direct thread"""
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    
+    if not data or not (data.get('conversation_id') or data.get('user_id')):
+        return jsonify({"error": "missing conversation_id or user_id"}), 400
+    
+    conversation_id = data.get('conversation_id')
+    other_user_id = data.get('user_id')
+    
+    if conversation_id:
+        # validate user is a participant
+        if not is_participant(conversation_id, user_id):
+            return jsonify({"error": "unauthorized to access this conversation"}), 403
+        thread_query = Message.query.filter(Message.conversation_id == conversation_id)
+    else:
+        thread_query = direct_messages_query(user_id, other_user_id)
+    
+    try:
+        timestamp, message_id = read_bound(thread_query, data.get('up_to_message_id'), data.get('up_to_timestamp'),
+                                           user_id, conversation_id=conversation_id, peer_id=other_user_id)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # nothing to read yet
+    if message_id is None:
+        return jsonify({
+            "success": True,
+            "last_read_message_id": None,
+            "last_read_at": None
+        }), 200
+    
+    try:
+        cursor = advance_read_cursor(user_id, timestamp, message_id,
+                                     conversation_id=conversation_id, peer_id=other_user_id)
+        db.session.commit()
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 403
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    
+    # read receipt for the senders, through the socket service
+    receipt = {
+        'reader_id': user_id,
+        'up_to_timestamp': cursor.last_read_at.isoformat(),
+        'up_to_message_id': cursor.last_read_message_id
+    }
+    if conversation_id:
+        receipt['conversation_id'] = conversation_id
+        publish_event('messages_read', receipt, room=conversation_id)
+    else:
+        receipt['user_id'] = user_id
+        publish_event('messages_read', receipt, room=other_user_id)
     
     return jsonify({
         "success": True,
-        "data": [msg.to_dict() for msg in messages]
+        "last_read_message_id": cursor.last_read_message_id,
+        "last_read_at": cursor.last_read_at.isoformat()
     }), 200
 
 @chat_bp.route('/messages/<message_id>/read', methods=['PUT'])
@@ -134,13 +290,19 @@ def mark_as_read(message_id):
     user_id = get_jwt_identity()
     
     message = Message.query.get(message_id)
+    stored = message is not None
+    if not stored:
+        # acked by the socket service but not written yet, the read cursor covers it
+        message = pending_message(message_id)
     if not message:
         return jsonify({"error": "message not found"}), 404
     
     if message.recipient_id != user_id:
         return jsonify({"error": "unauthorized to modify this message"}), 403
     
-    message.is_read = True
+    if stored:
+        message.is_read = True
+    advance_read_cursor(user_id, message.timestamp, message.message_id, peer_id=message.sender_id)
     db.session.commit()
     
     return jsonify({
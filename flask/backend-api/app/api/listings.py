@@ -7,61 +7,144 @@ from werkzeug.utils import secure_filename
 from app.models.listing import Listing
 from app.models.property import Property, Address
 from app.models.user import User
+from app.services.listing_service import parse_listing_filters, search_listings_query, paginate_listings, search_listings_text, listing_facets, get_listing_with_details, related_listing_ids
+from app.services.geocoding import locate
+from app.services.search_index import search_terms, reindex_listings
+from app.services import cache
+from app.services.cache import LISTINGS_TAG, listing_tag
+from app.utils.http_cache import public, not_modified, with_validators
+from app.utils.pagination import parse_limit
 from app import db
 
 listing_bp = Blueprint('listings', __name__)
 
+def cached_response(body, status, etag):
+    """json response from an already serialized body, X-Cache tells whether it came from the cache"""
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers['X-Cache'] = status
+    return with_validators(response, etag, public(current_app.config['LISTINGS_MAX_AGE']))
+
+def unchanged(etag):
+    """304 if the client has the current version of a public listing response"""
+    return not_modified(etag, public(current_app.config['LISTINGS_MAX_AGE']))
+
 @listing_bp.route('', methods=['GET'])
 def get_listings():
-    # get filter parameters
-    price_min = request.args.get('price_min', type=float)
-    price_max = request.args.get('price_max', type=float)
-    bedrooms = request.args.get('bedrooms', type=int)
-    city = request.args.get('city')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
+    try:
+        # get filter parameters
+        filters = parse_listing_filters(request.args)
+        limit = parse_limit(request.args.get('limit'),
+                            current_app.config['LISTINGS_PAGE_SIZE'],
+                            current_app.config['LISTINGS_MAX_PAGE_SIZE'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # build query
-    query = Listing.query.join(Property).join(Address)
+    sort = request.args.get('sort', 'newest')
+    cursor = request.args.get('cursor')
     
-    # apply filter conditions
-    if price_min is not None:
-        query = query.filter(Listing.price >= price_min)
-    if price_max is not None:
-        query = query.filter(Listing.price <= price_max)
-    if bedrooms is not None:
-        query = query.filter(Property.bedrooms == bedrooms)
-    if city:
-        query = query.filter(Address.city == city)
-    if start_date:
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Listing.start_date <= start_date_obj)
-        except ValueError:
-            pass
-    if end_date:
-        try:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Listing.end_date >= end_date_obj)
-        except ValueError:
-            pass
+    # the same normalized filters give the same page, however the query string was written
+    params = dict(filters, sort=sort, limit=limit, cursor=cursor)
+    body, versions, etag = cache.get('listings', params, [LISTINGS_TAG])
+    response = unchanged(etag)
+    if response:
+        return response
+    if body is not None:
+        return cached_response(body, 'HIT', etag)
     
-    # execute query
-    listings = query.all()
+    # build query, property and address are loaded by the same join used for filtering
+    query = search_listings_query(filters)
+    
+    # execute query, one page at a time
+    try:
+        listings, next_cursor = paginate_listings(query, sort, limit, cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # return results
     result = [listing.to_dict(include_property=True, include_address=True) for listing in listings]
-    return jsonify(result), 200
+    body = jsonify({
+        "data": result,
+        "next_cursor": next_cursor
+    }).get_data(as_text=True)
+    cache.put('listings', params, body, versions, etag)
+    return cached_response(body, 'MISS', etag)
+
+@listing_bp.route('/facets', methods=['GET'])
+def get_listing_facets():
+    try:
+        filters = parse_listing_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # facets change with any listing, like the search pages
+    body, versions, etag = cache.get('listing_facets', filters, [LISTINGS_TAG])
+    response = unchanged(etag)
+    if response:
+        return response
+    if body is not None:
+        return cached_response(body, 'HIT', etag)
+    
+    facets = listing_facets(filters, current_app.config['LISTING_PRICE_BUCKETS'])
+    body = jsonify(facets).get_data(as_text=True)
+    cache.put('listing_facets', filters, body, versions, etag)
+    return cached_response(body, 'MISS', etag)
+
+@listing_bp.route('/search', methods=['GET'])
+def search_listings():
+    terms = search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({"error": "q is required"}), 400
+    
+    try:
+        filters = parse_listing_filters(request.args)
+        limit = parse_limit(request.args.get('limit'),
+                            current_app.config['LISTINGS_PAGE_SIZE'],
+                            current_app.config['LISTINGS_MAX_PAGE_SIZE'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    cursor = request.args.get('cursor')
+    params = dict(filters, terms=terms, limit=limit, cursor=cursor)
+    body, versions, etag = cache.get('listing_search', params, [LISTINGS_TAG])
+    response = unchanged(etag)
+    if response:
+        return response
+    if body is not None:
+        return cached_response(body, 'HIT', etag)
+    
+    # ranked matches from the full-text index, best first
+    try:
+        listings, next_cursor = search_listings_text(terms, filters, limit, cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    result = [listing.to_dict(include_property=True, include_address=True) for listing in listings]
+    body = jsonify({
+        "data": result,
+        "next_cursor": next_cursor
+    }).get_data(as_text=True)
+    cache.put('listing_search', params, body, versions, etag)
+    return cached_response(body, 'MISS', etag)
 
 @listing_bp.route('/<listing_id>', methods=['GET'])
 def get_listing(listing_id):
-    listing = Listing.query.get(listing_id)
+    params = {'listing_id': listing_id}
+    body, versions, etag = cache.get('listing', params, [listing_tag(listing_id)])
+    response = unchanged(etag)
+    if response:
+        return response
+    if body is not None:
+        return cached_response(body, 'HIT', etag)
+    
+    listing = get_listing_with_details(listing_id)
     if not listing:
         return jsonify({"error": "Listing not found"}), 404
     
     # return listing with property and address information
     result = listing.to_dict(include_property=True, include_address=True)
-    return jsonify(result), 200
+    body = jsonify(result).get_data(as_text=True)
+    cache.put('listing', params, body, versions, etag)
+    return cached_response(body, 'MISS', etag)
 
 @listing_bp.route('', methods=['POST'])
 @jwt_required()
@@ -97,6 +180,10 @@ def create_listing():
             zip_code=address_data['zip_code'],
             apt_number=address_data.get('apt_number')
         )
+        try:
+            locate(address, address_data.get('latitude'), address_data.get('longitude'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         db.session.add(address)
         db.session.flush()  # get address_id
         
@@ -127,13 +214,17 @@ def create_listing():
             author_id=user_id,
             price=listing_data['price'],
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            description=listing_data.get('description')
         )
         db.session.add(listing)
+        db.session.flush()  # get listing_id
+        reindex_listings([listing.listing_id])
         
         # update user's listing_ids (if implemented)
         
         db.session.commit()
+        cache.invalidate(LISTINGS_TAG)
         
         return jsonify({
             "message": "Listing created successfully",
@@ -162,6 +253,12 @@ def update_listing(listing_id):
         return jsonify({"error": "No data provided"}), 400
     
     try:
+        # cached details of other listings of the property or address change with them too
+        related = [listing.listing_id]
+        if listing.property and ('property' in data or 'address' in data):
+            related = related_listing_ids(listing.property_id, listing.property.address_id)
+        changed = [listing_tag(i) for i in related]
+        
         # update listing information
         if 'listing' in data:
             listing_data = data['listing']
@@ -169,6 +266,9 @@ def update_listing(listing_id):
             if 'price' in listing_data:
                 listing.price = listing_data['price']
             
+            if 'description' in listing_data:
+                listing.description = listing_data['description']
+            
             if 'start_date' in listing_data:
                 try:
                     listing.start_date = datetime.strptime(listing_data['start_date'], '%Y-%m-%d').date()
@@ -200,8 +300,19 @@ def update_listing(listing_id):
             for field in updatable_address_fields:
                 if field in address_data:
                     setattr(address, field, address_data[field])
+            
+            # a new zip code or new coordinates move the address
+            if any(field in address_data for field in ['zip_code', 'latitude', 'longitude']):
+                try:
+                    locate(address, address_data.get('latitude'), address_data.get('longitude'))
+                except ValueError as e:
+                    db.session.rollback()
+                    return jsonify({"error": str(e)}), 400
         
+        # the search index holds the property and address text of every related listing
+        reindex_listings(related)
         db.session.commit()
+        cache.invalidate(LISTINGS_TAG, *changed)
         
         return jsonify({
             "message": "Listing updated successfully",
@@ -227,6 +338,10 @@ def delete_listing(listing_id):
     
     try:
         property_id = listing.property_id
+        related = [listing.listing_id]
+        if listing.property:
+            related = related_listing_ids(property_id, listing.property.address_id)
+        changed = [listing_tag(i) for i in related]
         
         # delete listing
         db.session.delete(listing)
@@ -247,7 +362,9 @@ def delete_listing(listing_id):
                 # delete address
                 db.session.delete(address)
         
+        reindex_listings(related)
         db.session.commit()
+        cache.invalidate(LISTINGS_TAG, *changed)
         
         return jsonify({"message": "Listing deleted successfully"}), 200
     except Exception as e:
@@ -2,6 +2,9 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.user import User, UserInterest
 from app.models.listing import Listing
+from app.services import cache
+from app.services.cache import LISTINGS_TAG, USERS_TAG, user_tag
+from app.utils.http_cache import make_etag, not_modified, with_validators
 from app import db
 
 user_bp = Blueprint('users', __name__)
@@ -13,11 +16,18 @@ def get_user(user_id):
     if current_user_id != user_id:
         return jsonify({"error": "Unauthorized access"}), 403
     
+    # the profile version counter is bumped by every update
+    versions = cache.tag_versions([user_tag(user_id)])
+    etag = make_etag('user', user_id, versions) if versions is not None else None
+    response = not_modified(etag)
+    if response:
+        return response
+    
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    return jsonify(user.to_dict()), 200
+    return with_validators((jsonify(user.to_dict()), 200), etag)
 
 @user_bp.route('/<user_id>', methods=['PUT'])
 @jwt_required()
@@ -43,6 +53,8 @@ def update_user(user_id):
             setattr(user, key, value)
         
         db.session.commit()
+        # profiles are also shown as chat participants
+        cache.invalidate(user_tag(user_id), USERS_TAG)
         return jsonify({
             "message": "User updated successfully",
             "user": user.to_dict()
@@ -58,6 +70,13 @@ def get_user_interests(user_id):
     if current_user_id != user_id:
         return jsonify({"error": "Unauthorized access"}), 403
     
+    # interest changes bump the user's version, listing changes the listings version
+    versions = cache.tag_versions([user_tag(user_id), LISTINGS_TAG])
+    etag = make_etag('interests', user_id, versions) if versions is not None else None
+    response = not_modified(etag)
+    if response:
+        return response
+    
     try:
         # get all interests of the user
         interests = UserInterest.query.filter_by(user_id=user_id).all()
@@ -69,7 +88,7 @@ def get_user_interests(user_id):
         # return listings with property and address information
         result = [listing.to_dict(include_property=True, include_address=True) for listing in listings]
         
-        return jsonify(result), 200
+        return with_validators((jsonify(result), 200), etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -100,6 +119,7 @@ def add_interest(user_id, listing_id):
         interest = UserInterest(user_id=user_id, listing_id=listing_id)
         db.session.add(interest)
         db.session.commit()
+        cache.invalidate(user_tag(user_id))
         
         return jsonify({"message": "Interest added successfully"}), 201
     except Exception as e:
@@ -124,6 +144,7 @@ def remove_interest(user_id, listing_id):
         # delete interest record
         db.session.delete(interest)
         db.session.commit()
+        cache.invalidate(user_tag(user_id))
         
         return jsonify({"message": "Interest removed successfully"}), 200
     except Exception as e:
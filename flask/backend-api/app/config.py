@@ -20,8 +20,47 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
     
+    # listing search pagination
+    LISTINGS_PAGE_SIZE = 20
+    LISTINGS_MAX_PAGE_SIZE = 100
+    
+    # price bucket edges of the listing facets: below 500, 500 to 1000, ..., 3000 and up
+    LISTING_PRICE_BUCKETS = [500, 1000, 1500, 2000, 2500, 3000]
+    
+    # listing location search: addresses are placed by zip code centroid unless the client sends coordinates
+    GEOCODING_TABLE = os.environ.get('GEOCODING_TABLE') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data/zip_centroids.csv')
+    GEOHASH_PRECISION = 9
+    # radius and bounding box searches are at most this many range scans over geohash cells
+    GEO_SEARCH_MAX_RANGES = 32
+    GEO_SEARCH_MAX_RADIUS_KM = 100
+    # full-text listing search, words past the limit are ignored
+    SEARCH_MAX_TERMS = 10
+    
+    # chat history pagination
+    MESSAGES_PAGE_SIZE = 50
+    MESSAGES_MAX_PAGE_SIZE = 200
+    INBOX_PAGE_SIZE = 20
+    INBOX_MAX_PAGE_SIZE = 50
+    
     # CORS configuration
     CORS_HEADERS = 'Content-Type'
     
     # Redis configuration
-    REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
\ No newline at end of file
+    REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    
+    # conversation membership cache, per process (LRU with TTL) in front of a redis set per conversation
+    MEMBERSHIP_CACHE_SIZE = 10000
+    MEMBERSHIP_CACHE_TTL = 60
+    MEMBERSHIP_REDIS_TTL = 3600
+    
+    # contacts of each user (presence updates), a redis set kept up to date by new conversations and messages
+    CONTACTS_REDIS_TTL = 7 * 24 * 3600
+    
+    # listing response cache, per process (LRU with TTL) in front of redis, invalidated by tag
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_SIZE = 1000
+    RESPONSE_CACHE_LOCAL_TTL = 5
+    RESPONSE_CACHE_TTL = 300
+    
+    # Cache-Control max-age of the public listing routes, clients revalidate with the ETag after it
+    LISTINGS_MAX_AGE = 30
\ No newline at end of file
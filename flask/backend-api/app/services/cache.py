@@ -0,0 +1,195 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import redis
+from flask import current_app
+from app.utils.redis_client import get_redis
+from app.utils.http_cache import make_etag
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# cached response bodies, a hash with the body and the versions of its tags when it was stored
+ENTRY_KEY = 'cache:{}:{}'
+# version of a tag, incremented to invalidate every entry tagged with it
+TAG_KEY = 'cache:tag:{}'
+# invalidated tags with their new version, every process drops its local entries of them
+INVALIDATE_CHANNEL = 'cache:invalidate'
+
+# every listing search page, any listing change can move listings between pages
+LISTINGS_TAG = 'listings'
+# every user profile, shown as participants in chat responses
+USERS_TAG = 'users'
+
+def listing_tag(listing_id):
+    return f'listing:{listing_id}'
+
+def user_tag(user_id):
+    """profile and interests of a user"""
+    return f'user:{user_id}'
+
+# (name, digest) -> (body, {tag: version}, etag, expiry time), least recently used first
+_local = OrderedDict()
+# latest tag versions this process knows of, from its own invalidations and the channel
+_tag_versions = {}
+_lock = threading.Lock()
+
+_subscriber = None
+_last_subscribe_attempt = 0
+SUBSCRIBE_RETRY_SECONDS = 30
+
+# after a redis error the cache runs on the local tier alone for a while
+_redis_down_until = 0
+REDIS_RETRY_SECONDS = 5
+
+def _on_invalidate(message):
+    tag, version = message['data'].rsplit(' ', 1)
+    with _lock:
+        _tag_versions[tag] = max(_tag_versions.get(tag, 0), int(version))
+
+def _ensure_subscribed():
+    """listen for invalidations in a background thread, started on first use"""
+    global _subscriber, _last_subscribe_attempt
+    if _subscriber is not None or time.monotonic() - _last_subscribe_attempt < SUBSCRIBE_RETRY_SECONDS:
+        return
+    _last_subscribe_attempt = time.monotonic()
+    try:
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATE_CHANNEL: _on_invalidate})
+        _subscriber = pubsub.run_in_thread(sleep_time=1, daemon=True)
+    except redis.RedisError as e:
+        # local entries then rely on their TTL alone
+        logger.error(f"Error: cache invalidation subscribe failed - {str(e)}")
+
+def _redis_available():
+    return time.monotonic() >= _redis_down_until
+
+def _redis_failed(e):
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+    logger.error(f"Error: response cache unavailable - {str(e)}")
+
+def cache_key(params):
+    """digest of the normalized request parameters"""
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+def _is_current(versions):
+    return all(version >= _tag_versions.get(tag, 0) for tag, version in versions.items())
+
+def _get_local(key):
+    with _lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        body, versions, etag, expires_at = entry
+        if expires_at < time.monotonic() or not _is_current(versions):
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return body, etag
+
+def _set_local(key, body, versions, etag):
+    with _lock:
+        if not _is_current(versions):
+            return
+        _local[key] = (body, versions, etag, time.monotonic() + current_app.config['RESPONSE_CACHE_LOCAL_TTL'])
+        _local.move_to_end(key)
+        while len(_local) > current_app.config['RESPONSE_CACHE_SIZE']:
+            _local.popitem(last=False)
+
+def get(name, params, tags):
+    """(cached body or None, tag versions to store a fresh body with, etag)
+
+    looks in the local tier, then in redis together with the current versions
+    of the tags in one round trip. an entry stored before one of its tags was
+    invalidated is a miss. the etag is derived from the versions, it is None
+    when they are only known to this process (redis unavailable)
+    """
+    if not current_app.config['RESPONSE_CACHE_ENABLED']:
+        return None, {}, None
+    _ensure_subscribed()
+    key = (name, cache_key(params))
+
+    local = _get_local(key)
+    if local is not None:
+        metrics.incr(f'{name}_cache_local_hit')
+        return local[0], None, local[1]
+    metrics.incr(f'{name}_cache_local_miss')
+
+    versions = {tag: _tag_versions.get(tag, 0) for tag in tags}
+    etag = None
+    if _redis_available():
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.hgetall(ENTRY_KEY.format(*key))
+            pipe.mget([TAG_KEY.format(tag) for tag in tags])
+            entry, current = pipe.execute()
+            versions = {tag: int(version or 0) for tag, version in zip(tags, current)}
+            etag = make_etag(*key, versions)
+            # behind this process when an invalidation could not reach redis
+            if entry and json.loads(entry['versions']) == versions and _is_current(versions):
+                metrics.incr(f'{name}_cache_redis_hit')
+                _set_local(key, entry['body'], versions, etag)
+                return entry['body'], None, etag
+        except redis.RedisError as e:
+            _redis_failed(e)
+
+    metrics.incr(f'{name}_cache_redis_miss')
+    return None, versions, etag
+
+def put(name, params, body, versions, etag):
+    """store a body built from the database with the tag versions and etag get returned before building it"""
+    if not current_app.config['RESPONSE_CACHE_ENABLED']:
+        return
+    key = (name, cache_key(params))
+    _set_local(key, body, versions, etag)
+
+    if not _redis_available():
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        entry_key = ENTRY_KEY.format(*key)
+        pipe.hset(entry_key, mapping={'body': body, 'versions': json.dumps(versions)})
+        pipe.expire(entry_key, current_app.config['RESPONSE_CACHE_TTL'])
+        pipe.execute()
+    except redis.RedisError as e:
+        _redis_failed(e)
+
+def tag_versions(tags):
+    """current versions of the tags, None if they are not known (cache disabled or redis unavailable)"""
+    if not current_app.config['RESPONSE_CACHE_ENABLED'] or not _redis_available():
+        return None
+    try:
+        current = get_redis().mget([TAG_KEY.format(tag) for tag in tags])
+    except redis.RedisError as e:
+        _redis_failed(e)
+        return None
+    return {tag: int(version or 0) for tag, version in zip(tags, current)}
+
+def invalidate(*tags):
+    """make every cached entry with one of the tags stale, in every process; call it after the commit"""
+    if not tags or not current_app.config['RESPONSE_CACHE_ENABLED']:
+        return
+    # known at once in this process, even while redis is unavailable
+    with _lock:
+        for tag in tags:
+            _tag_versions[tag] = _tag_versions.get(tag, 0) + 1
+
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(TAG_KEY.format(tag))
+        versions = pipe.execute()
+
+        pipe = get_redis().pipeline(transaction=False)
+        with _lock:
+            for tag, version in zip(tags, versions):
+                _tag_versions[tag] = max(_tag_versions[tag], version)
+                pipe.publish(INVALIDATE_CHANNEL, f'{tag} {version}')
+        pipe.execute()
+    except redis.RedisError as e:
+        # other processes keep their entries until redis is back or the entries expire
+        _redis_failed(e)
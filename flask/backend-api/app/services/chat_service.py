@@ -0,0 +1,363 @@
+import json
+import logging
+from datetime import datetime
+import redis
+from sqlalchemy import or_, and_, func
+from sqlalchemy.orm import aliased
+from app.models.message import Message, Conversation, ConversationParticipant, DirectReadCursor
+from app.models.user import User
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.redis_client import get_redis
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# message id -> message, set by the socket service when it acks a message, before the message is written
+PENDING_MESSAGE_KEY = 'message:dedupe:{}'
+
+def message_cursor(message):
+    """cursor pointing at a message, ordered by (timestamp, message_id)"""
+    return encode_cursor([message.timestamp.isoformat(), message.message_id])
+
+def _decode_message_cursor(cursor):
+    timestamp, message_id = decode_cursor(cursor, 2)
+    try:
+        return datetime.fromisoformat(timestamp), str(message_id)
+    except (TypeError, ValueError):
+        raise ValueError('invalid cursor')
+
+def direct_messages_query(user_id, other_user_id):
+    """all messages between two users, both directions"""
+    return Message.query.filter(
+        ((Message.sender_id == user_id) & (Message.recipient_id == other_user_id)) |
+        ((Message.sender_id == other_user_id) & (Message.recipient_id == user_id))
+    )
+
+def pending_message(message_id):
+    """a message the socket service acked but has not written yet, as an unsaved Message, None if unknown"""
+    try:
+        data = get_redis().get(PENDING_MESSAGE_KEY.format(message_id))
+    except redis.RedisError as e:
+        logger.error(f"Error: pending message lookup failed - {str(e)}")
+        return None
+    if not data:
+        return None
+    data = json.loads(data)
+    return Message(
+        message_id=data['message_id'],
+        sender_id=data['sender_id'],
+        recipient_id=data.get('recipient_id'),
+        conversation_id=data.get('conversation_id'),
+        content=data['content'],
+        timestamp=datetime.fromisoformat(data['timestamp'])
+    )
+
+def in_thread(message, user_id, conversation_id=None, peer_id=None):
+    """True if the message belongs to the conversation, or to the direct thread of user_id and peer_id"""
+    if conversation_id:
+        return message.conversation_id == conversation_id
+    return message.conversation_id is None and {message.sender_id, message.recipient_id} == {user_id, peer_id}
+
+def read_bound(thread_query, up_to_message_id=None, up_to_timestamp=None, user_id=None, conversation_id=None,
+               peer_id=None):
+    """resolve the message up to which a thread is marked as read, as (timestamp, message_id)
+
+    up_to_message_id must belong to the thread, up_to_timestamp is an ISO 8601
+    string and resolves to the latest message at or before it, without either
+    the latest message of the thread is used. (None, None) if there is no such message
+
+    with user_id and the thread, a message id not stored yet is looked up among
+    the pending messages of the thread
+    """
+    if up_to_message_id:
+        message = thread_query.filter(Message.message_id == up_to_message_id).first()
+        if not message and user_id:
+            message = pending_message(up_to_message_id)
+            if message and not in_thread(message, user_id, conversation_id, peer_id):
+                message = None
+        if not message:
+            raise LookupError('message not found in this thread')
+        return message.timestamp, message.message_id
+
+    query = thread_query
+    if up_to_timestamp:
+        try:
+            query = query.filter(Message.timestamp <= datetime.fromisoformat(up_to_timestamp))
+        except (TypeError, ValueError):
+            raise ValueError('invalid up_to_timestamp, use ISO 8601')
+
+    message = query.order_by(Message.timestamp.desc(), Message.message_id.desc()).first()
+    if not message:
+        return None, None
+    return message.timestamp, message.message_id
+
+def _after_cursor(cursor):
+    """filter for messages after a read cursor"""
+    if cursor is None or cursor.last_read_at is None:
+        return True
+    return or_(
+        Message.timestamp > cursor.last_read_at,
+        and_(Message.timestamp == cursor.last_read_at,
+             Message.message_id > (cursor.last_read_message_id or ''))
+    )
+
+def read_cursor(user_id, conversation_id=None, peer_id=None):
+    """the user's read cursor row of a conversation or direct thread, None if there is none yet"""
+    if conversation_id:
+        return ConversationParticipant.query.get((conversation_id, user_id))
+    return DirectReadCursor.query.get((user_id, peer_id))
+
+def read_cursor_columns(user_id, conversation_id=None, peer_id=None):
+    """the user's read cursor of a thread as scalar subqueries, for the version aggregates"""
+    if conversation_id:
+        table = ConversationParticipant
+        condition = and_(table.conversation_id == conversation_id, table.user_id == user_id)
+    else:
+        table = DirectReadCursor
+        condition = and_(table.user_id == user_id, table.peer_id == peer_id)
+    return [db.session.query(column).filter(condition).scalar_subquery()
+            for column in (table.last_read_at, table.last_read_message_id)]
+
+def advance_read_cursor(user_id, timestamp, message_id, conversation_id=None, peer_id=None):
+    """move the user's read cursor of a conversation or direct thread forward
+
+    a single-row upsert, the cursor never moves backwards. returns the cursor row.
+    raises LookupError if the user is not a participant of the conversation
+    """
+    cursor = read_cursor(user_id, conversation_id, peer_id)
+    # participants always have a row, direct cursors are created on the first read
+    if cursor is None and peer_id:
+        cursor = DirectReadCursor(user_id=user_id, peer_id=peer_id)
+        db.session.add(cursor)
+    if cursor is None:
+        # the membership cache can still list a participant whose row was just removed
+        raise LookupError('unauthorized to access this conversation')
+
+    if cursor.last_read_at is None or \
+            (timestamp, message_id) > (cursor.last_read_at, cursor.last_read_message_id or ''):
+        cursor.last_read_at = timestamp
+        cursor.last_read_message_id = message_id
+
+    return cursor
+
+def direct_unread_count(user_id, peer_id, cursor):
+    """number of messages from peer_id the user has not read after their read cursor row, one indexed range count"""
+    return Message.query.filter(
+        Message.sender_id == peer_id,
+        Message.recipient_id == user_id,
+        _after_cursor(cursor)
+    ).count()
+
+def paginate_messages(query, limit, before=None, after=None):
+    """return (messages in ascending order, has_more)
+
+    without a cursor the latest page is returned, `before` pages back
+    through older messages and `after` pages forward through newer ones.
+    has_more tells whether there are more messages in the paging direction.
+    """
+    if before and after:
+        raise ValueError('before and after cannot be used together')
+
+    if after:
+        timestamp, message_id = _decode_message_cursor(after)
+        query = query.filter(or_(
+            Message.timestamp > timestamp,
+            and_(Message.timestamp == timestamp, Message.message_id > message_id)
+        )).order_by(Message.timestamp.asc(), Message.message_id.asc())
+    else:
+        if before:
+            timestamp, message_id = _decode_message_cursor(before)
+            query = query.filter(or_(
+                Message.timestamp < timestamp,
+                and_(Message.timestamp == timestamp, Message.message_id < message_id)
+            ))
+        query = query.order_by(Message.timestamp.desc(), Message.message_id.desc())
+
+    # fetch one extra row to know whether there are more messages
+    messages = query.limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+
+    if not after:
+        messages.reverse()
+
+    return messages, has_more
+
+def message_page(messages, has_more, user_id, cursor):
+    """response body for a page of messages, read by user_id up to their read cursor row"""
+    return {
+        "success": True,
+        "data": [msg.to_dict(msg.is_read_by(user_id, cursor)) for msg in messages],
+        "has_more": has_more,
+        "before_cursor": message_cursor(messages[0]) if messages else None,
+        "after_cursor": message_cursor(messages[-1]) if messages else None
+    }
+
+def _latest_messages(conversation_ids):
+    """latest message of each conversation, one aggregated query"""
+    latest = db.session.query(
+        Message.conversation_id.label('conversation_id'),
+        func.max(Message.timestamp).label('timestamp')
+    ).filter(
+        Message.conversation_id.in_(conversation_ids)
+    ).group_by(Message.conversation_id).subquery()
+
+    messages = Message.query.join(latest, and_(
+        Message.conversation_id == latest.c.conversation_id,
+        Message.timestamp == latest.c.timestamp
+    )).all()
+
+    # messages sharing the latest timestamp are ordered by message_id, like the history pages
+    result = {}
+    for message in messages:
+        current = result.get(message.conversation_id)
+        if current is None or message.message_id > current.message_id:
+            result[message.conversation_id] = message
+    return result
+
+def _unread_counts(conversation_ids, user_id):
+    """number of messages from other participants after the user's read cursor in each conversation"""
+    rows = db.session.query(
+        Message.conversation_id, func.count(Message.message_id)
+    ).join(
+        ConversationParticipant, and_(
+            ConversationParticipant.conversation_id == Message.conversation_id,
+            ConversationParticipant.user_id == user_id
+        )
+    ).filter(
+        Message.conversation_id.in_(conversation_ids),
+        Message.sender_id != user_id,
+        or_(
+            ConversationParticipant.last_read_at.is_(None),
+            Message.timestamp > ConversationParticipant.last_read_at,
+            and_(Message.timestamp == ConversationParticipant.last_read_at,
+                 Message.message_id > func.coalesce(ConversationParticipant.last_read_message_id, ''))
+        )
+    ).group_by(Message.conversation_id).all()
+    return dict(rows)
+
+def _participant_summaries(conversation_ids):
+    """compact participant info for each conversation, without loading full user rows"""
+    rows = db.session.query(
+        ConversationParticipant.conversation_id,
+        User.user_id,
+        User.first_name,
+        User.last_name,
+        User.profile_picture_url
+    ).join(
+        User, User.user_id == ConversationParticipant.user_id
+    ).filter(
+        ConversationParticipant.conversation_id.in_(conversation_ids)
+    ).all()
+
+    result = {}
+    for conversation_id, participant_id, first_name, last_name, picture_url in rows:
+        result.setdefault(conversation_id, []).append({
+            'id': participant_id,
+            'first_name': first_name,
+            'last_name': last_name,
+            'profile_picture_url': picture_url
+        })
+    return result
+
+def get_inbox(user_id, limit, cursor=None):
+    """return (inbox entries, next_cursor) for a user, most recently updated first
+
+    one page costs four queries no matter how many conversations it holds:
+    the conversation page, the latest messages, the unread counts and the participants
+    """
+    query = Conversation.query.join(
+        ConversationParticipant,
+        ConversationParticipant.conversation_id == Conversation.conversation_id
+    ).filter(ConversationParticipant.user_id == user_id)
+
+    if cursor:
+        updated_at, conversation_id = decode_cursor(cursor, 2)
+        try:
+            updated_at = datetime.fromisoformat(updated_at)
+        except (TypeError, ValueError):
+            raise ValueError('invalid cursor')
+        query = query.filter(or_(
+            Conversation.updated_at < updated_at,
+            and_(Conversation.updated_at == updated_at, Conversation.conversation_id < str(conversation_id))
+        ))
+
+    conversations = query.order_by(
+        Conversation.updated_at.desc(), Conversation.conversation_id.desc()
+    ).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        last = conversations[-1]
+        next_cursor = encode_cursor([last.updated_at.isoformat(), last.conversation_id])
+
+    if not conversations:
+        return [], None
+
+    conversation_ids = [conv.conversation_id for conv in conversations]
+    latest_messages = _latest_messages(conversation_ids)
+    unread_counts = _unread_counts(conversation_ids, user_id)
+    participants = _participant_summaries(conversation_ids)
+
+    entries = []
+    for conv in conversations:
+        last_message = latest_messages.get(conv.conversation_id)
+        unread_count = unread_counts.get(conv.conversation_id, 0)
+        # the latest message is unread exactly when another participant sent it and something is unread
+        last_read = last_message is not None and (last_message.sender_id == user_id or unread_count == 0)
+        entries.append({
+            'conversation_id': conv.conversation_id,
+            'title': conv.title,
+            'created_at': conv.created_at.isoformat(),
+            'updated_at': conv.updated_at.isoformat(),
+            'last_message': last_message.to_dict(last_read) if last_message else None,
+            'unread_count': unread_count,
+            'participants': participants.get(conv.conversation_id, [])
+        })
+
+    return entries, next_cursor
+
+def conversations_version(user_id):
+    """(conversations, participants, latest update, latest read) over a user's conversations
+
+    one aggregate query that changes with the conversation list and the inbox:
+    conversations or participants are added, a message is sent (which moves
+    updated_at) or the user reads further
+    """
+    me = aliased(ConversationParticipant)
+    other = aliased(ConversationParticipant)
+    return tuple(db.session.query(
+        func.count(func.distinct(me.conversation_id)),
+        func.count(other.user_id),
+        func.max(Conversation.updated_at),
+        func.max(me.last_read_at)
+    ).select_from(me).join(
+        Conversation, Conversation.conversation_id == me.conversation_id
+    ).join(
+        other, other.conversation_id == me.conversation_id
+    ).filter(me.user_id == user_id).one())
+
+def conversation_version(conversation_id):
+    """(latest update, participants) of a conversation, one aggregate query"""
+    return tuple(db.session.query(
+        func.max(Conversation.updated_at),
+        func.count(ConversationParticipant.user_id)
+    ).select_from(Conversation).join(
+        ConversationParticipant, ConversationParticipant.conversation_id == Conversation.conversation_id
+    ).filter(Conversation.conversation_id == conversation_id).one())
+
+def thread_version(thread_query, *columns):
+    """(messages, latest timestamp, *columns) of a thread, one aggregate query on its index
+
+    columns are the reader's read cursor (read_cursor_columns), which the is_read flags follow
+    """
+    return tuple(thread_query.with_entities(
+        func.count(Message.message_id),
+        func.max(Message.timestamp),
+        *columns
+    ).one())
+
+def direct_version(user_id, peer_id):
+    """thread_version of a direct thread and the user's read cursor, which moves its unread count"""
+    return thread_version(direct_messages_query(user_id, peer_id), *read_cursor_columns(user_id, peer_id=peer_id))
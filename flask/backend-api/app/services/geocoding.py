@@ -0,0 +1,60 @@
+import csv
+import logging
+from flask import current_app
+from app.utils.geohash import encode
+
+logger = logging.getLogger(__name__)
+
+# zip code -> (latitude, longitude), loaded from GEOCODING_TABLE on first use
+_zip_centroids = None
+
+def zip_centroids():
+    """zip code -> (latitude, longitude) of the geocoding table"""
+    global _zip_centroids
+    if _zip_centroids is None:
+        path = current_app.config['GEOCODING_TABLE']
+        table = {}
+        try:
+            with open(path, newline='') as f:
+                for row in csv.DictReader(f):
+                    table[row['zip_code'].strip()] = (float(row['latitude']), float(row['longitude']))
+        except (OSError, KeyError, ValueError) as e:
+            # addresses are then only located from coordinates given by the client
+            logger.error(f"Error: loading geocoding table {path} failed - {str(e)}")
+        _zip_centroids = table
+    return _zip_centroids
+
+def geocode_zip(zip_code):
+    """(latitude, longitude) of the centroid of a zip code, None if it is not in the table"""
+    if not zip_code:
+        return None
+    # ZIP+4 codes are looked up by their five-digit zip
+    return zip_centroids().get(str(zip_code).strip()[:5])
+
+def parse_coordinates(latitude, longitude):
+    """validated (latitude, longitude) floats, raise ValueError if they are missing or out of range"""
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise ValueError('latitude and longitude must be numbers')
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError('latitude must be between -90 and 90, longitude between -180 and 180')
+    return latitude, longitude
+
+def locate(address, latitude=None, longitude=None):
+    """set the coordinates and geohash cell of an address
+
+    coordinates given by the client win, otherwise the address is placed at the
+    centroid of its zip code. an address that cannot be located gets no
+    coordinates and never matches a location search
+    """
+    if latitude is not None or longitude is not None:
+        point = parse_coordinates(latitude, longitude)
+    else:
+        point = geocode_zip(address.zip_code)
+
+    if point is None:
+        address.latitude = address.longitude = address.geohash = None
+        return
+    address.latitude, address.longitude = point
+    address.geohash = encode(*point, current_app.config['GEOHASH_PRECISION'])
@@ -0,0 +1,319 @@
+import math
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from flask import current_app
+from sqlalchemy import or_, and_, select, case, func
+from sqlalchemy.orm import contains_eager, joinedload
+from app.models.listing import Listing
+from app.models.property import Property, Address
+from app.services.geocoding import parse_coordinates
+from app.services.search_index import matching_listings
+from app.utils.geohash import covering_ranges, radius_box, KM_PER_DEGREE
+from app.utils.pagination import encode_cursor, decode_cursor
+
+# supported sort orders: (sort column, descending)
+LISTING_SORTS = {
+    'newest': (Listing.created_at, True),
+    'price_asc': (Listing.price, False),
+    'price_desc': (Listing.price, True)
+}
+
+def _parse_near(args):
+    """(latitude, longitude, radius_km) of a radius search, None without one"""
+    if not any(args.get(field) for field in ['lat', 'lng', 'radius_km']):
+        return None
+    latitude, longitude = parse_coordinates(args.get('lat'), args.get('lng'))
+    radius_km = args.get('radius_km', type=float)
+    if radius_km is None or not 0 < radius_km <= current_app.config['GEO_SEARCH_MAX_RADIUS_KM']:
+        raise ValueError(f"radius_km must be a number between 0 and {current_app.config['GEO_SEARCH_MAX_RADIUS_KM']}")
+    return latitude, longitude, radius_km
+
+def _parse_bbox(value):
+    """(min_lat, min_lng, max_lat, max_lng) of a bounding box search, None without one"""
+    if not value:
+        return None
+    try:
+        min_lat, min_lng, max_lat, max_lng = [float(part) for part in value.split(',')]
+    except ValueError:
+        raise ValueError('bbox must be min_lat,min_lng,max_lat,max_lng')
+    parse_coordinates(min_lat, min_lng)
+    parse_coordinates(max_lat, max_lng)
+    if min_lat > max_lat or min_lng > max_lng:
+        raise ValueError('bbox must be min_lat,min_lng,max_lat,max_lng')
+    return min_lat, min_lng, max_lat, max_lng
+
+def parse_listing_filters(args):
+    """normalize the search filters from the request query string
+
+    raise ValueError for an invalid location search
+    """
+    filters = {
+        'price_min': args.get('price_min', type=float),
+        'price_max': args.get('price_max', type=float),
+        'bedrooms': args.get('bedrooms', type=int),
+        'city': args.get('city') or None,
+        'start_date': None,
+        'end_date': None,
+        'near': _parse_near(args),
+        'bbox': _parse_bbox(args.get('bbox'))
+    }
+
+    # invalid dates are ignored, same as before
+    for field in ['start_date', 'end_date']:
+        value = args.get(field)
+        if value:
+            try:
+                filters[field] = datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                pass
+
+    return filters
+
+def listing_conditions(filters):
+    """{filter name: condition} of the normalized filters that are set, on a query joining Property and Address
+
+    the conditions are plain comparisons on indexed columns, so the planner can
+    start from whichever index its estimates say is selective: the sort order,
+    ix_properties_bedrooms_address_id, or the addresses of a city or area
+    (ix_addresses_city, ix_addresses_geohash) through ix_properties_address_id
+    and ix_listings_property_id
+    """
+    conditions = {}
+    if filters['price_min'] is not None:
+        conditions['price_min'] = Listing.price >= filters['price_min']
+    if filters['price_max'] is not None:
+        conditions['price_max'] = Listing.price <= filters['price_max']
+    if filters['bedrooms'] is not None:
+        conditions['bedrooms'] = Property.bedrooms == filters['bedrooms']
+    if filters['city']:
+        conditions['city'] = Address.city == filters['city']
+    if filters['start_date']:
+        conditions['start_date'] = Listing.start_date <= filters['start_date']
+    if filters['end_date']:
+        conditions['end_date'] = Listing.end_date >= filters['end_date']
+    if filters['near']:
+        conditions['near'] = within_radius(*filters['near'])
+    if filters['bbox']:
+        conditions['bbox'] = within_box(*filters['bbox'])
+    return conditions
+
+def apply_listing_filters(query, filters):
+    """apply the normalized filters to a query that already joins Property and Address"""
+    for condition in listing_conditions(filters).values():
+        query = query.filter(condition)
+    return query
+
+def in_cells(min_lat, min_lng, max_lat, max_lng):
+    """addresses in the geohash cells covering a box, range scans on ix_addresses_geohash"""
+    ranges = covering_ranges(min_lat, min_lng, max_lat, max_lng,
+                             current_app.config['GEO_SEARCH_MAX_RANGES'], current_app.config['GEOHASH_PRECISION'])
+    return or_(*[and_(Address.geohash >= start, Address.geohash < end) for start, end in ranges])
+
+def box_check(min_lat, min_lng, max_lat, max_lng):
+    """exact check of addresses inside a bounding box"""
+    return and_(Address.latitude.between(min_lat, max_lat), Address.longitude.between(min_lng, max_lng))
+
+def radius_check(latitude, longitude, radius_km):
+    """exact check of addresses within radius_km of a point
+
+    the distance is equirectangular, off by well under 1% at search radii, so it
+    is plain arithmetic that runs in SQL on both SQLite and MariaDB
+    """
+    lng_scale = math.cos(math.radians(latitude))
+    lat_delta = Address.latitude - latitude
+    lng_delta = (Address.longitude - longitude) * lng_scale
+    return lat_delta * lat_delta + lng_delta * lng_delta <= (radius_km / KM_PER_DEGREE) ** 2
+
+def within_box(min_lat, min_lng, max_lat, max_lng):
+    """addresses inside a bounding box, pruned by cell before the exact check"""
+    return and_(in_cells(min_lat, min_lng, max_lat, max_lng), box_check(min_lat, min_lng, max_lat, max_lng))
+
+def within_radius(latitude, longitude, radius_km):
+    """addresses within radius_km of a point, pruned by cell before the exact check"""
+    return and_(in_cells(*radius_box(latitude, longitude, radius_km)), radius_check(latitude, longitude, radius_km))
+
+def search_listings_query(filters):
+    """build the listing search query
+
+    property and address are joined once for filtering and the same join
+    populates listing.property and property.address, so serializing the
+    results does not issue any additional queries
+    """
+    query = Listing.query.join(Listing.property).join(Property.address).options(
+        contains_eager(Listing.property).contains_eager(Property.address)
+    )
+    return apply_listing_filters(query, filters)
+
+def _after_search_cursor(hits, last_score, last_id):
+    """search hits after the last one of the previous page"""
+    return or_(
+        hits.c.score < last_score,
+        and_(hits.c.score == last_score, hits.c.listing_id > last_id)
+    )
+
+def search_listings_text(terms, filters, limit, cursor=None):
+    """return one page of the listings matching the search terms, best match first, and the next cursor
+
+    the full-text index picks and scores the matches, the usual filters then
+    narrow them down in the same query. pages are chained by (score, listing_id)
+    like the other listing pages
+    """
+    hits = matching_listings(terms)
+
+    last = None
+    if cursor:
+        last = decode_cursor(cursor, 2)
+        if not isinstance(last[0], (int, float)) or not isinstance(last[1], int):
+            raise ValueError('invalid cursor')
+
+    # without other filters the page is cut from the index alone, before any listing is joined
+    if all(value is None for value in filters.values()):
+        page = select(hits).order_by(hits.c.score.desc(), hits.c.listing_id.asc()).limit(limit + 1)
+        if last:
+            page = page.where(_after_search_cursor(hits, *last))
+        hits = page.subquery('page')
+
+    query = search_listings_query(filters).join(hits, hits.c.listing_id == Listing.listing_id).add_columns(hits.c.score)
+    if last:
+        query = query.filter(_after_search_cursor(hits, *last))
+
+    # fetch one extra row to know whether there is a next page
+    rows = query.order_by(hits.c.score.desc(), Listing.listing_id.asc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_listing, last_score = rows[-1]
+        next_cursor = encode_cursor([last_score, last_listing.listing_id])
+
+    return [listing for listing, _ in rows], next_cursor
+
+def _price_bucket(edges):
+    """index of the price bucket of a listing: bucket i holds prices below edges[i], the last one the rest"""
+    return case(*[(Listing.price < edge, index) for index, edge in enumerate(edges)], else_=len(edges))
+
+def _most_common(counts):
+    """[{value, count}] of a facet, most listings first"""
+    return [{'value': value, 'count': count}
+            for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))]
+
+def listing_facets(filters, price_edges):
+    """listing counts per bedroom number, price bucket, city and property type
+
+    every facet ignores its own filter, so the filter drawer shows how many
+    listings each other choice would give: the bedroom counts of a bedrooms=2
+    search still cover 1, 3 and 4 bedrooms. all facets come from one GROUP BY
+    over the four values, with a column per facet filter telling whether the
+    group passes it, and each facet adds up the groups passing the others
+    """
+    facets = {
+        'bedrooms': (Property.bedrooms, ['bedrooms']),
+        'price': (_price_bucket(price_edges), ['price_min', 'price_max']),
+        'city': (Address.city, ['city']),
+        'property_type': (Property.property_type, [])
+    }
+    own_filters = [field for _, fields in facets.values() for field in fields]
+
+    conditions = listing_conditions(filters)
+    checked = [field for field in conditions if field in own_filters]
+    columns = [column for column, _ in facets.values()] + [case((conditions[field], 1), else_=0) for field in checked]
+    query = Listing.query.join(Listing.property).join(Property.address).with_entities(
+        *columns, func.count(Listing.listing_id)
+    )
+    # the other filters apply to every facet
+    for field, condition in conditions.items():
+        if field not in own_filters:
+            query = query.filter(condition)
+    groups = query.group_by(*columns).all()
+
+    counts = {name: {} for name in facets}
+    total = 0
+    for group in groups:
+        values, count = group[:len(facets)], group[-1]
+        failed = {field for field, passed in zip(checked, group[len(facets):-1]) if not passed}
+        if not failed:
+            total += count
+        for (name, (_, fields)), value in zip(facets.items(), values):
+            if failed <= set(fields):
+                counts[name][value] = counts[name].get(value, 0) + count
+
+    bounds = [None] + list(price_edges) + [None]
+    return {
+        'total': total,
+        'bedrooms': [{'value': value, 'count': count} for value, count in sorted(counts['bedrooms'].items())],
+        'price': [{'min': bounds[index], 'max': bounds[index + 1], 'count': counts['price'].get(index, 0)}
+                  for index in range(len(price_edges) + 1)],
+        'city': _most_common(counts['city']),
+        'property_type': _most_common(counts['property_type'])
+    }
+
+def get_listing_with_details(listing_id):
+    """load a single listing together with its property and address"""
+    return Listing.query.options(
+        joinedload(Listing.property).joinedload(Property.address)
+    ).filter(Listing.listing_id == listing_id).first()
+
+def related_listing_ids(property_id, address_id):
+    """ids of the listings that show a property or an address, their details change with them"""
+    rows = Listing.query.join(Listing.property).filter(or_(
+        Property.property_id == property_id,
+        Property.address_id == address_id
+    )).with_entities(Listing.listing_id).all()
+    return [listing_id for (listing_id,) in rows]
+
+def _cursor_value(sort, value):
+    """convert a sort value to its cursor representation"""
+    if sort == 'newest':
+        return value.isoformat()
+    return str(value)
+
+def _parse_cursor_value(sort, value):
+    if sort == 'newest':
+        return datetime.fromisoformat(value)
+    return Decimal(value)
+
+def paginate_listings(query, sort, limit, cursor=None):
+    """return one page of listings ordered by (sort column, listing_id) and the cursor of the next page
+
+    keyset pagination: the cursor holds the sort value and listing_id of the
+    last row, so every page is a range scan no matter how deep the client goes
+    """
+    if sort not in LISTING_SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(LISTING_SORTS)}")
+
+    column, descending = LISTING_SORTS[sort]
+
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, 2)
+        try:
+            last_value = _parse_cursor_value(sort, last_value)
+            last_id = int(last_id)
+        except (TypeError, ValueError, InvalidOperation):
+            raise ValueError('invalid cursor')
+
+        if descending:
+            query = query.filter(or_(
+                column < last_value,
+                and_(column == last_value, Listing.listing_id < last_id)
+            ))
+        else:
+            query = query.filter(or_(
+                column > last_value,
+                and_(column == last_value, Listing.listing_id > last_id)
+            ))
+
+    if descending:
+        query = query.order_by(column.desc(), Listing.listing_id.desc())
+    else:
+        query = query.order_by(column.asc(), Listing.listing_id.asc())
+
+    # fetch one extra row to know whether there is a next page
+    listings = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(listings) > limit:
+        listings = listings[:limit]
+        last = listings[-1]
+        next_cursor = encode_cursor([_cursor_value(sort, getattr(last, column.key)), last.listing_id])
+
+    return listings, next_cursor
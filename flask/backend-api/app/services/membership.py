@@ -0,0 +1,117 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+import redis
+from flask import current_app
+from app.models.message import ConversationParticipant
+from app.utils.redis_client import get_redis
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# participants of a conversation, shared by every API and socket process
+MEMBERS_KEY = 'conversation:{}:members'
+# conversation ids whose participants changed, every process drops them from its local cache
+INVALIDATE_CHANNEL = 'conversation_members:invalidate'
+
+# conversation_id -> (frozenset of user ids, expiry time), least recently used first
+_local = OrderedDict()
+_lock = threading.Lock()
+
+_subscriber = None
+_last_subscribe_attempt = 0
+SUBSCRIBE_RETRY_SECONDS = 30
+
+def _on_invalidate(message):
+    with _lock:
+        _local.pop(message['data'], None)
+
+def _ensure_subscribed():
+    """listen for invalidations in a background thread, started on first use"""
+    global _subscriber, _last_subscribe_attempt
+    if _subscriber is not None or time.monotonic() - _last_subscribe_attempt < SUBSCRIBE_RETRY_SECONDS:
+        return
+    _last_subscribe_attempt = time.monotonic()
+    try:
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATE_CHANNEL: _on_invalidate})
+        _subscriber = pubsub.run_in_thread(sleep_time=1, daemon=True)
+    except redis.RedisError as e:
+        # the local cache then relies on its TTL alone
+        logger.error(f"Error: membership invalidation subscribe failed - {str(e)}")
+
+def _get_local(conversation_id):
+    with _lock:
+        entry = _local.get(conversation_id)
+        if entry is None:
+            return None
+        members, expires_at = entry
+        if expires_at < time.monotonic():
+            del _local[conversation_id]
+            return None
+        _local.move_to_end(conversation_id)
+        return members
+
+def _set_local(conversation_id, members):
+    with _lock:
+        _local[conversation_id] = (members, time.monotonic() + current_app.config['MEMBERSHIP_CACHE_TTL'])
+        _local.move_to_end(conversation_id)
+        while len(_local) > current_app.config['MEMBERSHIP_CACHE_SIZE']:
+            _local.popitem(last=False)
+
+def _load_members(conversation_id):
+    rows = db.session.query(ConversationParticipant.user_id).filter(
+        ConversationParticipant.conversation_id == conversation_id
+    ).all()
+    return frozenset(user_id for (user_id,) in rows)
+
+def get_members(conversation_id):
+    """user ids of the participants of a conversation, empty if it does not exist
+
+    served from the local LRU, then the redis set, then the database
+    """
+    _ensure_subscribed()
+
+    members = _get_local(conversation_id)
+    if members is not None:
+        return members
+
+    key = MEMBERS_KEY.format(conversation_id)
+    try:
+        members = frozenset(get_redis().smembers(key))
+    except redis.RedisError as e:
+        logger.error(f"Error: membership cache read failed - {str(e)}")
+        members = None
+
+    if not members:
+        members = _load_members(conversation_id)
+        # unknown conversations are not cached, they may be created any moment
+        if not members:
+            return members
+        try:
+            pipe = get_redis().pipeline()
+            pipe.sadd(key, *members)
+            pipe.expire(key, current_app.config['MEMBERSHIP_REDIS_TTL'])
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error: membership cache write failed - {str(e)}")
+
+    _set_local(conversation_id, members)
+    return members
+
+def is_participant(conversation_id, user_id):
+    """True if the user is a participant of the conversation"""
+    return user_id in get_members(conversation_id)
+
+def invalidate_members(conversation_id):
+    """drop a conversation from every membership cache, call it after its participants changed"""
+    with _lock:
+        _local.pop(conversation_id, None)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.delete(MEMBERS_KEY.format(conversation_id))
+        pipe.publish(INVALIDATE_CHANNEL, conversation_id)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error: membership cache invalidation failed - {str(e)}")
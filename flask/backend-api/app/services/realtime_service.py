@@ -0,0 +1,24 @@
+import logging
+from flask import current_app
+from flask_socketio import SocketIO
+
+logger = logging.getLogger(__name__)
+
+# write-only client of the socket service's redis message queue, created on first use
+_emitter = None
+
+def get_emitter():
+    global _emitter
+    if _emitter is None:
+        _emitter = SocketIO(message_queue=current_app.config['REDIS_URL'], async_mode='threading')
+    return _emitter
+
+def publish_event(event, data, room):
+    """push an event to socket clients in a room through the socket service
+
+    failures are only logged, the REST request that triggered the event has already succeeded
+    """
+    try:
+        get_emitter().emit(event, data, room=room)
+    except Exception as e:
+        logger.error(f"Error: publishing {event} to {room} failed - {str(e)}")
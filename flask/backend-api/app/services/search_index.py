@@ -0,0 +1,73 @@
+import re
+from flask import current_app
+from sqlalchemy import select, table, column, func, literal_column, cast, String
+from sqlalchemy.dialects.mysql import match
+from app import db
+from app.models.listing import Listing
+from app.models.property import Property, Address
+
+# the columns of listing_search, see app/models/listing.py
+SEARCH_COLUMNS = ['street_address', 'city', 'details', 'description']
+
+def _dialect():
+    return db.engine.dialect.name
+
+def _search_table():
+    """listing_search, the listing id is the first column: the rowid of the FTS5 table on SQLite"""
+    id_column = 'rowid' if _dialect() == 'sqlite' else 'listing_id'
+    return table('listing_search', column(id_column), *[column(name) for name in SEARCH_COLUMNS])
+
+def document_columns():
+    """the indexed text of a listing, from a query joining Listing, Property and Address
+
+    details makes the property searchable the way people write it, e.g. "apartment 2br 1ba"
+    """
+    details = (Property.property_type + ' ' + cast(Property.bedrooms, String) + 'br '
+               + cast(Property.bathrooms, String) + 'ba')
+    return [Address.street_address, Address.city, details, Listing.description]
+
+def _documents():
+    return select(Listing.listing_id, *document_columns()).join(Listing.property).join(Property.address)
+
+def reindex_listings(listing_ids):
+    """bring the index rows of listings up to date, in the current transaction
+
+    the rows are written again from the listings, property and address as they
+    are now, so listings that were deleted in the meantime drop out of the index
+    """
+    if not listing_ids:
+        return
+    # the listing changes must be visible to the insert
+    db.session.flush()
+    search = _search_table()
+    db.session.execute(search.delete().where(search.c[0].in_(listing_ids)))
+    db.session.execute(search.insert().from_select(
+        list(search.c), _documents().where(Listing.listing_id.in_(listing_ids))
+    ))
+
+def rebuild_search_index():
+    """write the whole index again, for bulk loads that bypass the listing routes"""
+    search = _search_table()
+    db.session.execute(search.delete())
+    db.session.execute(search.insert().from_select(list(search.c), _documents()))
+    db.session.commit()
+
+def search_terms(text):
+    """the lowercase words of a search, at most SEARCH_MAX_TERMS"""
+    return re.findall(r'\w+', text.lower())[:current_app.config['SEARCH_MAX_TERMS']]
+
+def matching_listings(terms):
+    """subquery of (listing_id, score) of the listings matching every term, higher scores rank first
+
+    the last term also matches as a prefix, so results follow the user while they type
+    """
+    search = _search_table()
+    if _dialect() == 'sqlite':
+        expression = ' '.join(f'"{term}"' for term in terms) + '*'
+        matches = literal_column('listing_search').match(expression)
+        # bm25 is lower for better matches
+        score = -func.bm25(literal_column('listing_search'))
+    else:
+        expression = ' '.join(f'+{term}' for term in terms) + '*'
+        matches = score = match(*[search.c[name] for name in SEARCH_COLUMNS], against=expression).in_boolean_mode()
+    return select(search.c[0].label('listing_id'), score.label('score')).where(matches).subquery('hits')
@@ -0,0 +1,21 @@
+import time
+import logging
+import redis
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# present while a revoked token would still be valid, the socket service checks it at connect too
+REVOKED_KEY = 'auth:revoked:{}'
+
+def revoke_token(jti, exp):
+    """reject a token until it expires, raises redis errors"""
+    get_redis().set(REVOKED_KEY.format(jti), '1', ex=max(1, int(exp - time.time())))
+
+def is_revoked(jti):
+    """True if the token was revoked, tokens stay valid while redis is unavailable"""
+    try:
+        return bool(get_redis().exists(REVOKED_KEY.format(jti)))
+    except redis.RedisError as e:
+        logger.error(f"Error: revocation check failed - {str(e)}")
+        return False
@@ -0,0 +1,97 @@
+import math
+
+# geohash cells: every character splits a cell into 32, alternating longitude and latitude bits
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# sorts after every geohash character, prefix <= cell < prefix + END matches the cells inside prefix
+END = '{'
+
+KM_PER_DEGREE = 111.32
+
+def encode(latitude, longitude, precision):
+    """geohash of a point, precision characters long"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        bounds, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+def cell_size(precision):
+    """(latitude, longitude) size in degrees of the cells of a precision"""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def _grid(low, high, size, origin):
+    """indexes of the grid cells of size from origin that overlap [low, high]"""
+    return range(int((low - origin) // size), int((high - origin) // size) + 1)
+
+def _cells(min_lat, min_lng, max_lat, max_lng, precision):
+    """geohashes of the cells of a precision that overlap a box"""
+    lat_size, lng_size = cell_size(precision)
+    cells = set()
+    for row in _grid(min_lat, max_lat, lat_size, -90.0):
+        for column in _grid(min_lng, max_lng, lng_size, -180.0):
+            # the cell center, clamped for boxes touching the poles or the antimeridian
+            latitude = min(max(-90.0 + (row + 0.5) * lat_size, -90.0), 90.0)
+            longitude = min(max(-180.0 + (column + 0.5) * lng_size, -180.0), 180.0)
+            cells.add(encode(latitude, longitude, precision))
+    return cells
+
+def _successor(cell):
+    """next cell of the same precision in sort order, None after the last"""
+    position = BASE32.index(cell[-1])
+    if position + 1 < len(BASE32):
+        return cell[:-1] + BASE32[position + 1]
+    return None
+
+def cell_ranges(cells):
+    """[start, end) string ranges matching the cells, consecutive cells merged into one range"""
+    ranges = []
+    for cell in sorted(cells):
+        if ranges and ranges[-1][2] == cell:
+            ranges[-1] = (ranges[-1][0], cell + END, _successor(cell))
+        else:
+            ranges.append((cell, cell + END, _successor(cell)))
+    return [(start, end) for start, end, _ in ranges]
+
+def covering_ranges(min_lat, min_lng, max_lat, max_lng, max_ranges, max_precision):
+    """geohash ranges whose cells together cover a bounding box
+
+    cells of the finest precision that still merge into at most max_ranges
+    ranges, so the cells stay close to the box while the query has a bounded
+    number of index range scans. the box must not cross the antimeridian
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 180.0)
+
+    ranges = cell_ranges(_cells(min_lat, min_lng, max_lat, max_lng, 1))
+    for precision in range(2, max_precision + 1):
+        lat_size, lng_size = cell_size(precision)
+        count = len(_grid(min_lat, max_lat, lat_size, -90.0)) * len(_grid(min_lng, max_lng, lng_size, -180.0))
+        # consecutive cells merge at most 32 to a range
+        if count > max_ranges * len(BASE32):
+            break
+        finer = cell_ranges(_cells(min_lat, min_lng, max_lat, max_lng, precision))
+        if len(finer) > max_ranges:
+            break
+        ranges = finer
+    return ranges
+
+def radius_box(latitude, longitude, radius_km):
+    """(min_lat, min_lng, max_lat, max_lng) of the box around a circle"""
+    lat_delta = radius_km / KM_PER_DEGREE
+    # longitude degrees shrink towards the poles
+    lng_delta = min(180.0, lat_delta / max(math.cos(math.radians(latitude)), 1e-6))
+    return latitude - lat_delta, longitude - lng_delta, latitude + lat_delta, longitude + lng_delta
@@ -0,0 +1,33 @@
+import json
+import hashlib
+from flask import request, current_app, make_response
+
+# Cache-Control of responses that depend on the user, clients must revalidate them with their ETag
+PRIVATE = 'private, no-cache'
+
+def public(max_age):
+    """Cache-Control of responses that are the same for everyone"""
+    return f'public, max-age={max_age}'
+
+def make_etag(*parts):
+    """weak ETag value from version data (timestamps, counts, version counters), never from the body"""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+def not_modified(etag, cache_control=PRIVATE):
+    """304 response if If-None-Match has the etag, None otherwise or without an etag
+
+    checked before the body is loaded and serialized
+    """
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return with_validators(current_app.response_class(status=304), etag, cache_control)
+
+def with_validators(rv, etag, cache_control=PRIVATE):
+    """response of a view return value with the etag and Cache-Control, errors are left as they are"""
+    response = make_response(rv)
+    if response.status_code not in (200, 304):
+        return response
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = cache_control
+    return response
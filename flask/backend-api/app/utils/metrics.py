@@ -0,0 +1,47 @@
+import threading
+from collections import defaultdict, deque
+
+# in-process metrics, every worker reports its own numbers
+SAMPLE_SIZE = 1000
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_samples = defaultdict(lambda: deque(maxlen=SAMPLE_SIZE))
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+def observe(name, value):
+    """record a latency sample in milliseconds, the latest SAMPLE_SIZE samples are kept"""
+    with _lock:
+        _samples[name].append(value)
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def snapshot():
+    """counters, hit ratios of every <name>_hit/<name>_miss pair, and latency percentiles"""
+    with _lock:
+        counters = dict(_counters)
+        samples = {name: sorted(values) for name, values in _samples.items() if values}
+
+    hit_ratios = {}
+    for name, hits in counters.items():
+        if name.endswith('_hit'):
+            prefix = name[:-len('_hit')]
+            total = hits + counters.get(f'{prefix}_miss', 0)
+            hit_ratios[prefix] = round(hits / total, 4) if total else None
+
+    latencies = {
+        name: {
+            'count': len(ordered),
+            'p50': round(_percentile(ordered, 0.50), 2),
+            'p95': round(_percentile(ordered, 0.95), 2),
+            'p99': round(_percentile(ordered, 0.99), 2),
+            'max': round(ordered[-1], 2)
+        }
+        for name, ordered in samples.items()
+    }
+
+    return {'counters': counters, 'hit_ratios': hit_ratios, 'latency_ms': latencies}
@@ -0,0 +1,35 @@
+import base64
+import json
+
+def encode_cursor(values):
+    """encode a list of keyset values into an opaque url-safe cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, length):
+    """decode a cursor created by encode_cursor, raise ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('invalid cursor')
+
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError('invalid cursor')
+
+    return values
+
+def parse_limit(value, default, maximum):
+    """parse a page size, falling back to the default and capping at the maximum"""
+    if value is None:
+        return default
+
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+
+    if limit < 1:
+        raise ValueError('limit must be positive')
+
+    return min(limit, maximum)
@@ -0,0 +1,11 @@
+import redis
+from flask import current_app
+
+# client for caches and pub/sub, created on first use
+_redis = None
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(current_app.config['REDIS_URL'], decode_responses=True)
+    return _redis
@@ -0,0 +1,80 @@
+"""add read cursors
+
+Adds a read cursor to conversation_participants and a direct_read_cursors
+table for direct threads. Cursors are backfilled from is_read: a user has
+read a thread up to the latest message they sent in it or received with
+is_read set.
+
+Revision ID: 1e62545f6af9
+Revises: e480f430909b
+Create Date: 2026-10-18 11:26:08.447120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e62545f6af9'
+down_revision = 'e480f430909b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('conversation_participants', sa.Column('last_read_message_id', sa.String(length=36), nullable=True))
+    op.add_column('conversation_participants', sa.Column('last_read_at', sa.DateTime(), nullable=True))
+    op.create_table('direct_read_cursors',
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('peer_id', sa.String(length=36), nullable=False),
+    sa.Column('last_read_message_id', sa.String(length=36), nullable=True),
+    sa.Column('last_read_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['peer_id'], ['users.user_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'peer_id')
+    )
+
+    # backfill conversation cursors
+    op.execute("""
+        UPDATE conversation_participants SET last_read_at = (
+            SELECT MAX(m.timestamp) FROM messages m
+            WHERE m.conversation_id = conversation_participants.conversation_id
+            AND (m.sender_id = conversation_participants.user_id OR m.is_read = 1)
+        )
+    """)
+    op.execute("""
+        UPDATE conversation_participants SET last_read_message_id = (
+            SELECT MAX(m.message_id) FROM messages m
+            WHERE m.conversation_id = conversation_participants.conversation_id
+            AND m.timestamp = conversation_participants.last_read_at
+        )
+        WHERE last_read_at IS NOT NULL
+    """)
+
+    # backfill direct thread cursors
+    op.execute("""
+        INSERT INTO direct_read_cursors (user_id, peer_id, last_read_at)
+        SELECT t.user_id, t.peer_id, MAX(t.timestamp) FROM (
+            SELECT recipient_id AS user_id, sender_id AS peer_id, timestamp FROM messages
+            WHERE recipient_id IS NOT NULL AND is_read = 1
+            UNION ALL
+            SELECT sender_id AS user_id, recipient_id AS peer_id, timestamp FROM messages
+            WHERE recipient_id IS NOT NULL
+        ) t
+        GROUP BY t.user_id, t.peer_id
+    """)
+    op.execute("""
+        UPDATE direct_read_cursors SET last_read_message_id = (
+            SELECT MAX(m.message_id) FROM messages m
+            WHERE m.timestamp = direct_read_cursors.last_read_at
+            AND ((m.sender_id = direct_read_cursors.peer_id AND m.recipient_id = direct_read_cursors.user_id)
+                OR (m.sender_id = direct_read_cursors.user_id AND m.recipient_id = direct_read_cursors.peer_id))
+        )
+    """)
+
+
+def downgrade():
+    op.drop_table('direct_read_cursors')
+    with op.batch_alter_table('conversation_participants') as batch_op:
+        batch_op.drop_column('last_read_at')
+        batch_op.drop_column('last_read_message_id')
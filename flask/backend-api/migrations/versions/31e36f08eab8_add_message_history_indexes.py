@@ -0,0 +1,35 @@
+"""add message history indexes
+
+Revision ID: 31e36f08eab8
+Revises: 3e7d714f80e2
+Create Date: 2026-10-18 10:03:27.114592
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '31e36f08eab8'
+down_revision = '3e7d714f80e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # conversation history, paged by (timestamp, message_id)
+    op.create_index('ix_messages_conversation_id_timestamp', 'messages',
+                    ['conversation_id', 'timestamp', 'message_id'], unique=False)
+    # direct history, each direction of the thread is one range on this index
+    op.create_index('ix_messages_sender_id_recipient_id_timestamp', 'messages',
+                    ['sender_id', 'recipient_id', 'timestamp', 'message_id'], unique=False)
+
+
+def downgrade():
+    # InnoDB uses these for the conversation_id and sender_id foreign keys
+    # and dropped its implicit ones when they were created
+    if op.get_bind().dialect.name == 'mysql':
+        return
+
+    op.drop_index('ix_messages_sender_id_recipient_id_timestamp', table_name='messages')
+    op.drop_index('ix_messages_conversation_id_timestamp', table_name='messages')
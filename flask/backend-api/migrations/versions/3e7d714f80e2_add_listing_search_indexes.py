@@ -0,0 +1,65 @@
+"""add listing search indexes
+
+Revision ID: 3e7d714f80e2
+Revises: f805228cec50
+Create Date: 2026-10-18 09:12:41.520318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e7d714f80e2'
+down_revision = 'f805228cec50'
+branch_labels = None
+depends_on = None
+
+
+def create_fk_index(name, table, columns):
+    # the MariaDB downgrade keeps the foreign key indexes, an upgrade after it finds them in place
+    if name not in {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}:
+        op.create_index(name, table, columns, unique=False)
+
+
+def upgrade():
+    # listings: keyset pagination orders by (created_at, listing_id) or (price, listing_id)
+    op.create_index('ix_listings_created_at_listing_id', 'listings', ['created_at', 'listing_id'], unique=False)
+    # price_min/price_max are range scans on this index, the date and property columns are
+    # included so the other listing filters are checked without reading the table row
+    op.create_index('ix_listings_price_search', 'listings',
+                    ['price', 'listing_id', 'start_date', 'end_date', 'property_id'], unique=False)
+    # start_date <= :start_date and end_date >= :end_date
+    op.create_index('ix_listings_start_date_end_date', 'listings', ['start_date', 'end_date'], unique=False)
+    # per-author lookups
+    create_fk_index('ix_listings_author_id', 'listings', ['author_id'])
+    # listings.property_id is indexed by d2a7c4e81f03
+
+    # properties: bedrooms filter, then the address join
+    op.create_index('ix_properties_bedrooms_address_id', 'properties', ['bedrooms', 'address_id'], unique=False)
+    create_fk_index('ix_properties_address_id', 'properties', ['address_id'])
+    create_fk_index('ix_properties_owner_id', 'properties', ['owner_id'])
+
+    # addresses: exact city match, for cities selective enough to drive the join
+    op.create_index('ix_addresses_city', 'addresses', ['city'], unique=False)
+
+    # user_interests: the primary key starts with user_id, listing deletes look up by listing_id
+    create_fk_index('ix_user_interests_listing_id', 'user_interests', ['listing_id'])
+
+
+def downgrade():
+    op.drop_index('ix_addresses_city', table_name='addresses')
+    op.drop_index('ix_properties_bedrooms_address_id', table_name='properties')
+    op.drop_index('ix_listings_start_date_end_date', table_name='listings')
+    op.drop_index('ix_listings_price_search', table_name='listings')
+    op.drop_index('ix_listings_created_at_listing_id', table_name='listings')
+
+    # InnoDB requires an index on every foreign key column and dropped its implicit
+    # ones when these were created, so they are kept on MariaDB
+    if op.get_bind().dialect.name == 'mysql':
+        return
+
+    op.drop_index('ix_user_interests_listing_id', table_name='user_interests')
+    op.drop_index('ix_properties_owner_id', table_name='properties')
+    op.drop_index('ix_properties_address_id', table_name='properties')
+    op.drop_index('ix_listings_author_id', table_name='listings')
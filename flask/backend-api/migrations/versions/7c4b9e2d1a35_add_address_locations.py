@@ -0,0 +1,92 @@
+"""add address locations
+
+Adds latitude, longitude and a geohash cell to addresses for location search,
+with an index on the geohash that also covers the coordinates. Existing
+addresses are placed at the centroid of their zip code from the geocoding
+table (GEOCODING_TABLE); addresses whose zip code is not in it stay without a
+location. The geohash encoder and the table read are copied here rather than
+imported from the app, so later changes to the app do not change what this
+revision does.
+
+Revision ID: 7c4b9e2d1a35
+Revises: 1e62545f6af9
+Create Date: 2026-10-18 14:02:37.815204
+
+"""
+import os
+import csv
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4b9e2d1a35'
+down_revision = '1e62545f6af9'
+branch_labels = None
+depends_on = None
+
+# GEOHASH_PRECISION when this revision was written
+PRECISION = 9
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# the table shipped with the app, GEOCODING_TABLE overrides it as in app/config.py
+TABLE = os.environ.get('GEOCODING_TABLE') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'app', 'data', 'zip_centroids.csv')
+
+
+def encode(latitude, longitude):
+    """geohash of a point, PRECISION characters long"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < PRECISION:
+        bounds, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def zip_centroids():
+    """zip code -> (latitude, longitude) of the geocoding table, empty without one"""
+    if not os.path.exists(TABLE):
+        return {}
+    with open(TABLE, newline='') as f:
+        return {row['zip_code'].strip(): (float(row['latitude']), float(row['longitude']))
+                for row in csv.DictReader(f)}
+
+
+def upgrade():
+    op.add_column('addresses', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('addresses', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('addresses', sa.Column('geohash', sa.String(length=12), nullable=True))
+    # radius and bounding box searches are range scans over the geohash cells covering the area,
+    # the coordinates in the index let the exact check run without reading the rows
+    op.create_index('ix_addresses_geohash', 'addresses', ['geohash', 'latitude', 'longitude'], unique=False)
+
+    # backfill, one update per zip code of the table; ZIP+4 codes start with their zip
+    update = sa.text(
+        'UPDATE addresses SET latitude = :latitude, longitude = :longitude, geohash = :geohash '
+        'WHERE zip_code LIKE :zip_code AND latitude IS NULL'
+    )
+    for zip_code, (latitude, longitude) in zip_centroids().items():
+        op.get_bind().execute(update, {
+            'latitude': latitude,
+            'longitude': longitude,
+            'geohash': encode(latitude, longitude),
+            'zip_code': f'{zip_code}%'
+        })
+
+
+def downgrade():
+    op.drop_index('ix_addresses_geohash', table_name='addresses')
+    op.drop_column('addresses', 'geohash')
+    op.drop_column('addresses', 'longitude')
+    op.drop_column('addresses', 'latitude')
@@ -0,0 +1,63 @@
+"""add listing search
+
+Adds a description to listings and the listing_search full-text index over
+the listing description and the street, city and property details of its
+property and address: an FTS5 table on SQLite, where the rowid is the
+listing_id, and a table with a FULLTEXT index on MariaDB. The index is
+filled from the existing listings.
+
+Revision ID: b3f1d8a6c927
+Revises: 7c4b9e2d1a35
+Create Date: 2026-10-18 15:10:42.530981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f1d8a6c927'
+down_revision = '7c4b9e2d1a35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('listings', sa.Column('description', sa.Text(), nullable=True))
+
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE listing_search USING fts5(street_address, city, details, description)")
+        op.execute("""
+            INSERT INTO listing_search (rowid, street_address, city, details, description)
+            SELECT l.listing_id, a.street_address, a.city,
+                p.property_type || ' ' || p.bedrooms || 'br ' || p.bathrooms || 'ba', l.description
+            FROM listings l
+            JOIN properties p ON p.property_id = l.property_id
+            JOIN addresses a ON a.address_id = p.address_id
+        """)
+    else:
+        op.execute("""
+            CREATE TABLE listing_search (
+                listing_id INTEGER NOT NULL PRIMARY KEY,
+                street_address VARCHAR(200),
+                city VARCHAR(100),
+                details VARCHAR(100),
+                description TEXT
+            ) ENGINE=InnoDB
+        """)
+        op.execute("""
+            INSERT INTO listing_search (listing_id, street_address, city, details, description)
+            SELECT l.listing_id, a.street_address, a.city,
+                CONCAT(p.property_type, ' ', p.bedrooms, 'br ', p.bathrooms, 'ba'), l.description
+            FROM listings l
+            JOIN properties p ON p.property_id = l.property_id
+            JOIN addresses a ON a.address_id = p.address_id
+        """)
+        # building the FULLTEXT index once after the load is much faster than filling an indexed table
+        op.execute("ALTER TABLE listing_search ADD FULLTEXT KEY ft_listing_search (street_address, city, details, description)")
+
+
+def downgrade():
+    op.execute("DROP TABLE listing_search")
+    with op.batch_alter_table('listings') as batch_op:
+        batch_op.drop_column('description')
@@ -0,0 +1,36 @@
+"""add listing property index
+
+Indexes listings.property_id, so searches with a selective city or location
+filter can go from the matching addresses to their listings instead of
+walking every listing in sort order. Broad searches keep walking the
+ordering index, the planner picks between the two from its estimates.
+
+Revision ID: d2a7c4e81f03
+Revises: b3f1d8a6c927
+Create Date: 2026-10-18 16:21:09.114562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c4e81f03'
+down_revision = 'b3f1d8a6c927'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the MariaDB downgrade keeps the index, an upgrade after it finds it in place
+    indexes = sa.inspect(op.get_bind()).get_indexes('listings')
+    if 'ix_listings_property_id' not in {index['name'] for index in indexes}:
+        op.create_index('ix_listings_property_id', 'listings', ['property_id'], unique=False)
+
+
+def downgrade():
+    # InnoDB requires an index on the foreign key column and dropped its implicit
+    # one when this was created, so it is kept on MariaDB
+    if op.get_bind().dialect.name == 'mysql':
+        return
+    op.drop_index('ix_listings_property_id', table_name='listings')
@@ -0,0 +1,29 @@
+"""add conversation participant user index
+
+Revision ID: e480f430909b
+Revises: 31e36f08eab8
+Create Date: 2026-10-18 10:41:55.308716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e480f430909b'
+down_revision = '31e36f08eab8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the inbox lists a user's conversations, the primary key starts with conversation_id
+    op.create_index('ix_conversation_participants_user_id', 'conversation_participants', ['user_id'], unique=False)
+
+
+def downgrade():
+    # InnoDB uses this for the user_id foreign key and dropped its implicit one when it was created
+    if op.get_bind().dialect.name == 'mysql':
+        return
+
+    op.drop_index('ix_conversation_participants_user_id', table_name='conversation_participants')
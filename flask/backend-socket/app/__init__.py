@@ -36,8 +36,16 @@ def create_app(config_class=None):
     jwt.init_app(app)
     CORS(app)
 
-    # use redis as message queue
-    socketio.init_app(app, message_queue=app.config['REDIS_URL'])
+    # use redis as message queue, with a client manager that encodes each event once for all recipients
+    from app.utils.fanout import FanoutRedisManager
+    socketio.init_app(app, client_manager=FanoutRedisManager(app.config['REDIS_URL'], channel='flask-socketio'))
+
+    # presence is shared by all socket workers through redis
+    from app.utils.redis_client import init_redis
+    from app.services.presence import init_presence, run_heartbeat
+    init_redis(app)
+    init_presence(app)
+    socketio.start_background_task(run_heartbeat, socketio)
     
     # Import models - important to do this before events
     # to ensure all models are registered with SQLAlchemy
@@ -48,5 +56,18 @@ def create_app(config_class=None):
     
     # Import events after models are loaded
     from app import events
+    events.init_typing(app)
+
+    # worker metrics (cache hit ratios, connect latency)
+    from app.api.metrics import metrics_bp
+    app.register_blueprint(metrics_bp)
+
+    # presence changes are sent to contacts in batches
+    from app.services.presence_updates import run_presence_updates
+    socketio.start_background_task(run_presence_updates, app, socketio)
+
+    # chat messages are written to the database in batches from a redis stream
+    from app.services.message_writer import run_message_writer
+    socketio.start_background_task(run_message_writer, app, socketio)
     
     return app
\ No newline at end of file
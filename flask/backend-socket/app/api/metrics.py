@@ -0,0 +1,9 @@
+from flask import Blueprint, jsonify
+from app.utils.metrics import snapshot
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """cache hit ratios and latency percentiles of this worker"""
+    return jsonify(snapshot()), 200
@@ -24,5 +24,54 @@ class Config:
     REDIS_IP = os.environ.get('REDIS_IP')
     REDIS_URL = f'redis://{REDIS_IP}:6379/0'
     
+    # connect authentication cache: verified tokens per process, user existence in redis
+    AUTH_TOKEN_CACHE_SIZE = 50000
+    AUTH_USER_CACHE_TTL = 3600
+    AUTH_USER_MISSING_TTL = 300
+    
+    # conversation membership cache, per process (LRU with TTL) in front of a redis set per conversation
+    MEMBERSHIP_CACHE_SIZE = 10000
+    MEMBERSHIP_CACHE_TTL = 60
+    MEMBERSHIP_REDIS_TTL = 3600
+    
+    # contacts of each user (presence updates), a redis set kept up to date by new conversations and messages
+    CONTACTS_REDIS_TTL = 7 * 24 * 3600
+    
+    # presence: a socket is considered gone if it misses heartbeats for PRESENCE_TTL seconds
+    PRESENCE_TTL = 60
+    PRESENCE_HEARTBEAT_INTERVAL = 20
+    # presence changes are coalesced and sent to contacts every PRESENCE_BATCH_INTERVAL seconds
+    PRESENCE_BATCH_INTERVAL = 0.5
+    ONLINE_USERS_PAGE_SIZE = 100
+    ONLINE_USERS_MAX_PAGE_SIZE = 500
+    
+    # typing indicators: a restart within TYPING_MIN_INTERVAL of stopping is dropped, ongoing typing is
+    # relayed once per TYPING_REFRESH_INTERVAL, and ends after TYPING_TIMEOUT seconds without typing events;
+    # at most TYPING_MAX_TYPERS users are shown typing in one conversation
+    TYPING_MIN_INTERVAL = 1.0
+    TYPING_REFRESH_INTERVAL = 3.0
+    TYPING_TIMEOUT = 5.0
+    TYPING_MAX_TYPERS = 5
+    
+    # write-behind of chat messages: batch size, how long a read waits for new messages,
+    # and after how long entries of a dead writer are taken over
+    MESSAGE_WRITER_BATCH_SIZE = 500
+    MESSAGE_WRITER_BLOCK_MS = 200
+    MESSAGE_WRITER_CLAIM_IDLE_MS = 30000
+    # a message id sent again within this many seconds is a retry and is acked without storing it twice
+    MESSAGE_DEDUPE_TTL = 600
+    # most messages accepted in one batch_message event
+    MESSAGE_BATCH_MAX_SIZE = 500
+    
+    # clients may ask for message events in the compact MessagePack format at connect (?format=compact),
+    # which costs one more encode per message event, both formats share its publish
+    WIRE_COMPACT_ENABLED = True
+    
+    # offline inbox per user and reconnect sync
+    OFFLINE_INBOX_SIZE = 1000
+    OFFLINE_INBOX_TTL = 7 * 24 * 3600
+    SYNC_BATCH_SIZE = 200
+    SYNC_MAX_THREADS = 100
+    
     # Debug mode
     DEBUG = True
\ No newline at end of file
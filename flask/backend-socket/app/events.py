@@ -1,21 +1,32 @@
-from flask import request
-from flask_socketio import emit, join_room, leave_room
-from flask_jwt_extended import decode_token
-from app.models.user import User
-from app.models.message import Message, Conversation
-from app import socketio, db
+from flask import request, session, current_app
+from flask_socketio import emit
+from app.models.message import Conversation
+from app.services.presence import add_connection, remove_connection, is_online, filter_online
+from app.services.presence_updates import queue_status, online_peers_page
+from app.services.message_writer import enqueue_message, enqueue_messages
+from app.services.membership import is_participant, get_members
+from app.services.sync import (push_offline, push_offline_batch, read_offline, clear_offline, thread_key, thread_query,
+                               read_cursor, set_read_state, parse_thread_cursor, is_after, iter_delta)
+from app.services.auth_cache import authenticate, user_exists
+from app.services.contacts import add_contacts
+from app.services.typing_throttle import TypingThrottle
+from app.utils import metrics, wire
+from app.utils.session import get_session_user_id
+from app import socketio
 import uuid
+import time
 from datetime import datetime
 import logging
-import pymysql
+import redis
 
 logger = logging.getLogger(__name__)
 
-# mapping of online users and their socket ids
-online_users = {}
+# typing events of the sockets on this worker, configured by init_typing
+typing_throttle = TypingThrottle()
 
 @socketio.on('connect')
 def handle_connect():
+    start = time.perf_counter()
     try:
         logger.info("WebSocket connection received")
         # get token from query parameters
@@ -25,52 +36,76 @@ def handle_connect():
             logger.error("Error: WebSocket connection without token")
             return False
         
-        # parse JWT token
+        # verify the token and the user, both cached so reconnect storms skip the database
         try:
-            decoded_token = decode_token(token)
-            user_id = decoded_token['sub']
-            logger.info(f"Token decoded, user_id: {user_id}")
+            user_id = authenticate(token)
         except Exception as e:
             logger.error(f"Error: Token parsing error - {str(e)}")
             return False
         
-        # validate user
-        try:
-            user = User.query.get(user_id)
-            if not user:
-                logger.error(f"Error: User {user_id} does not exist")
-                return False  # reject connection
-        except pymysql.err.OperationalError as e:
-            logger.error(f"Error: Database connection error - {str(e)}")
-        except Exception as e:
-            logger.error(f"Error: User query error - {str(e)}")
-            return False
+        if not user_id:
+            logger.error("Error: User does not exist or token was revoked")
+            return False  # reject connection
         
-        # mark user as online
-        online_users[user_id] = request.sid
+        # bind the user to the socket, events read it from the session instead of their payload
+        session['user_id'] = user_id
+        # message events are sent as JSON, or in the compact binary format if the client asked for it
+        session['wire_format'] = wire.negotiate(request.args.get('format'))
         
-        # join user's own room (for receiving private messages)
-        join_room(user_id)
+        # mark user as online, only the first device announces it
+        came_online = add_connection(user_id, request.sid)
         
-        # broadcast user online message to all connected clients
-        emit('user_online', {'user_id': user_id}, broadcast=True)
+        # join user's own room (for receiving private messages and presence updates)
+        wire.join_room(user_id)
+        if request.args.get('format'):
+            emit('wire_format', {'format': session['wire_format']})
         
-        # send current online users list to user
-        emit('online_users', {'users': list(online_users.keys())})
+        # contacts learn about it in the next presence_diff batch
+        if came_online:
+            queue_status(user_id, 'online')
+        
+        # send the first page of online contacts to user
+        users, next_cursor = online_peers_page(user_id, limit=current_app.config['ONLINE_USERS_PAGE_SIZE'])
+        emit('online_users', {'users': users, 'next_cursor': next_cursor})
         
         return True
     except Exception as e:
         logger.error(f"Error: WebSocket connection failed - {str(e)}")
         return False
+    finally:
+        metrics.observe('connect', (time.perf_counter() - start) * 1000)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    for user_id, sid in list(online_users.items()):
-        if sid == request.sid:
-            del online_users[user_id]
-            logger.info(f"user {user_id} disconnected")
-            emit('user_offline', {'user_id': user_id}, broadcast=True)
-            break
+    user_id, went_offline = remove_connection(request.sid)
+    if not user_id:
+        return
+    
+    logger.info(f"user {user_id} disconnected")
+    # the user stays online until their last device disconnects
+    if went_offline:
+        queue_status(user_id, 'offline')
+
+@socketio.on('get_online_users')
+def handle_get_online_users(data=None):
+    user_id = get_session_user_id()
+    if not user_id:
+        emit('error', {'message': 'unauthorized'})
+        return
+    
+    data = data or {}
+    try:
+        limit = min(int(data.get('limit', current_app.config['ONLINE_USERS_PAGE_SIZE'])),
+                    current_app.config['ONLINE_USERS_MAX_PAGE_SIZE'])
+    except (TypeError, ValueError):
+        emit('error', {'message': 'invalid limit'})
+        return
+    if limit < 1:
+        emit('error', {'message': 'invalid limit'})
+        return
+    
+    users, next_cursor = online_peers_page(user_id, data.get('cursor'), limit)
+    emit('online_users', {'users': users, 'next_cursor': next_cursor})
 
 @socketio.on('join_conversation')
 def handle_join_conversation(data):
@@ -78,7 +113,12 @@ def handle_join_conversation(data):
     if not conversation_id:
         return
     
-    join_room(conversation_id)
+    # only participants receive the conversation's messages
+    if not is_participant(conversation_id, get_session_user_id()):
+        emit('error', {'message': 'unauthorized to access this conversation'})
+        return
+    
+    wire.join_room(conversation_id)
     logger.info(f"user {request.sid} joined conversation {conversation_id}")
 
 @socketio.on('leave_conversation')
@@ -87,121 +127,335 @@ def handle_leave_conversation(data):
     if not conversation_id:
         return
     
-    leave_room(conversation_id)
+    wire.leave_room(conversation_id)
     logger.info(f"user {request.sid} left conversation {conversation_id}")
 
+def new_message(sender_id, content, message_id=None, recipient_id=None, conversation_id=None):
+    """message payload in the format of Message.to_dict, the id is the client's if it sent one
+
+    raises ValueError if the client's message id is not a UUID
+    """
+    message_data = {
+        'message_id': str(uuid.UUID(message_id)) if message_id else str(uuid.uuid4()),
+        'sender_id': sender_id,
+        'content': content,
+        'timestamp': datetime.utcnow().isoformat(),
+        'is_read': False
+    }
+    
+    if recipient_id:
+        message_data['recipient_id'] = recipient_id
+    
+    if conversation_id:
+        message_data['conversation_id'] = conversation_id
+    
+    return message_data
+
+def send_error(message):
+    """report an error to the socket, both as an error event and as the event's ack"""
+    emit('error', {'message': message})
+    return {'success': False, 'error': message}
+
+def store_message(message_data):
+    """append a message to the stream, return (ack, is_new), a retried message id is acked again without storing"""
+    try:
+        message_data, is_new = enqueue_message(message_data)
+    except (ValueError, redis.RedisError) as e:
+        return send_error(str(e)), False
+    
+    # acked once the message is in the stream, which redis keeps in its append-only file
+    return {'success': True, 'data': message_data}, is_new
+
 @socketio.on('private_message')
 def handle_private_message(data):
-    sender_id = data.get('sender_id')
+    # the sender is the user authenticated at connect
+    sender_id = get_session_user_id()
     recipient_id = data.get('recipient_id')
     content = data.get('content')
     
-    if not all([sender_id, recipient_id, content]):
-        emit('error', {'message': 'missing required fields'})
-        return
+    if not sender_id:
+        return send_error('unauthorized')
     
-    # confirm sender is the user who is connected
-    sender_sid = online_users.get(sender_id)
-    if sender_sid != request.sid:
-        emit('error', {'message': 'unauthorized'})
-        return
+    if not all([recipient_id, content]):
+        return send_error('missing required fields')
+    
+    # the background writer could not store a message to a user that does not exist
+    if not user_exists(recipient_id):
+        return send_error('recipient not found')
     
-    # create new message and save it
+    # create new message, the database write happens in the background
     try:
-        message = Message(
-            message_id=str(uuid.uuid4()),
-            sender_id=sender_id,
-            recipient_id=recipient_id,
-            content=content
-        )
-        db.session.add(message)
-        db.session.commit()
-        
-        # format message
-        message_data = message.to_dict()
-        
-        # send message to recipient (if online)
-        if recipient_id in online_users:
-            emit('private_message', message_data, room=recipient_id)
-        
-        # confirm message delivered
-        emit('message_delivered', message_data, room=sender_id)
+        message_data = new_message(sender_id, content, message_id=data.get('message_id'), recipient_id=recipient_id)
+    except (TypeError, ValueError):
+        return send_error('invalid message_id, use a UUID')
     
-    except Exception as e:
-        db.session.rollback()
-        emit('error', {'message': str(e)})
+    ack, is_new = store_message(message_data)
+    if not is_new:
+        return ack
+    
+    # both now get each other's presence updates
+    add_contacts([(sender_id, recipient_id)])
+    
+    # send message to recipient if online, queue it in their offline inbox otherwise,
+    # and send it to the sender's other devices
+    if is_online(recipient_id):
+        wire.emit('private_message', message_data, room=recipient_id)
+    else:
+        push_offline([recipient_id], message_data)
+    wire.emit('private_message', message_data, room=sender_id, skip_sid=request.sid)
+    
+    return ack
 
 @socketio.on('conversation_message')
 def handle_conversation_message(data):
-    sender_id = data.get('sender_id')
+    # the sender is the user authenticated at connect
+    sender_id = get_session_user_id()
     conversation_id = data.get('conversation_id')
     content = data.get('content')
     
-    if not all([sender_id, conversation_id, content]):
-        emit('error', {'message': 'missing required fields'})
-        return
+    if not sender_id:
+        return send_error('unauthorized')
     
-    # confirm sender is the user who is connected
-    sender_sid = online_users.get(sender_id)
-    if sender_sid != request.sid:
-        emit('error', {'message': 'unauthorized'})
-        return
+    if not all([conversation_id, content]):
+        return send_error('missing required fields')
     
-    # validate conversation exists and user is a participant
-    conversation = Conversation.query.get(conversation_id)
-    if not conversation:
-        emit('error', {'message': 'conversation not found'})
-        return
+    # validate user is a participant, the database is only hit on a cache miss or a refusal
+    if not is_participant(conversation_id, sender_id):
+        if not Conversation.query.get(conversation_id):
+            return send_error('conversation not found')
+        return send_error('unauthorized to send message in this conversation')
     
-    participant_ids = [p.user_id for p in conversation.participants]
-    if sender_id not in participant_ids:
-        emit('error', {'message': 'unauthorized to send message in this conversation'})
-        return
+    # create new message, the database write (and the conversation updated time) happens in the background
+    try:
+        message_data = new_message(sender_id, content, message_id=data.get('message_id'),
+                                   conversation_id=conversation_id)
+    except (TypeError, ValueError):
+        return send_error('invalid message_id, use a UUID')
+    
+    ack, is_new = store_message(message_data)
+    if not is_new:
+        return ack
+    
+    # send message to all members of the conversation, offline members get it in their offline inbox
+    wire.emit('conversation_message', message_data, room=conversation_id)
+    members = get_members(conversation_id) - {sender_id}
+    push_offline(members - filter_online(members), message_data)
+    
+    return ack
+
+def validate_batch(sender_id, items):
+    """message payloads of a batch_message batch and the errors per index, no message is sent if there are any"""
+    messages, errors = [], []
+    seen = set()
+    conversations, recipients = {}, {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': 'invalid message'})
+            continue
+        recipient_id = item.get('recipient_id')
+        conversation_id = item.get('conversation_id')
+        if not item.get('content') or bool(recipient_id) == bool(conversation_id):
+            errors.append({'index': index, 'error': 'missing required fields'})
+            continue
+        
+        # the membership check runs once per conversation of the batch
+        if conversation_id:
+            if conversation_id not in conversations:
+                if is_participant(conversation_id, sender_id):
+                    conversations[conversation_id] = None
+                elif not Conversation.query.get(conversation_id):
+                    conversations[conversation_id] = 'conversation not found'
+                else:
+                    conversations[conversation_id] = 'unauthorized to send message in this conversation'
+            if conversations[conversation_id]:
+                errors.append({'index': index, 'error': conversations[conversation_id]})
+                continue
+        
+        # and the recipient check once per recipient
+        if recipient_id:
+            if recipient_id not in recipients:
+                recipients[recipient_id] = user_exists(recipient_id)
+            if not recipients[recipient_id]:
+                errors.append({'index': index, 'error': 'recipient not found'})
+                continue
+        
+        try:
+            message_data = new_message(sender_id, item['content'], message_id=item.get('message_id'),
+                                       recipient_id=recipient_id, conversation_id=conversation_id)
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'invalid message_id, use a UUID'})
+            continue
+        if message_data['message_id'] in seen:
+            errors.append({'index': index, 'error': 'duplicate message_id in batch'})
+            continue
+        seen.add(message_data['message_id'])
+        messages.append(message_data)
+    return messages, errors
+
+@socketio.on('batch_message')
+def handle_batch_message(data):
+    """send many messages across threads at once, stored together and delivered as one event per room"""
+    sender_id = get_session_user_id()
+    if not sender_id:
+        return send_error('unauthorized')
     
-    # create new message and save it
+    items = (data or {}).get('messages')
+    max_size = current_app.config['MESSAGE_BATCH_MAX_SIZE']
+    if not items or not isinstance(items, list):
+        return send_error('missing required fields')
+    if len(items) > max_size:
+        return send_error(f"too many messages, at most {max_size}")
+    
+    messages, errors = validate_batch(sender_id, items)
+    if errors:
+        ack = send_error('invalid messages')
+        ack['errors'] = errors
+        return ack
+    
+    # one script call appends the whole batch as one stream entry, the writer stores it with one INSERT
     try:
-        message = Message(
-            message_id=str(uuid.uuid4()),
-            sender_id=sender_id,
-            conversation_id=conversation_id,
-            content=content
-        )
-        db.session.add(message)
+        results = enqueue_messages(messages)
+    except redis.RedisError as e:
+        return send_error(str(e))
+    
+    acked, errors = [], []
+    private, conversations = {}, {}
+    for index, (message_data, is_new) in enumerate(results):
+        if message_data is None:
+            errors.append({'index': index, 'error': 'message id already in use'})
+            continue
+        acked.append(message_data)
+        if not is_new:
+            continue
+        if message_data.get('conversation_id'):
+            conversations.setdefault(message_data['conversation_id'], []).append(message_data)
+        else:
+            private.setdefault(message_data['recipient_id'], []).append(message_data)
+    
+    add_contacts((sender_id, recipient_id) for recipient_id in private)
+    
+    # one message_batch per room, offline recipients get the messages in their offline inbox
+    inboxes = {}
+    online = filter_online(set(private))
+    for recipient_id, batch in private.items():
+        if recipient_id in online:
+            wire.emit('message_batch', {'messages': batch}, room=recipient_id)
+        else:
+            inboxes.setdefault(recipient_id, []).extend(batch)
+    
+    for conversation_id, batch in conversations.items():
+        wire.emit('message_batch', {'conversation_id': conversation_id, 'messages': batch}, room=conversation_id)
+        members = get_members(conversation_id) - {sender_id}
+        for member_id in members - filter_online(members):
+            inboxes.setdefault(member_id, []).extend(batch)
+    
+    push_offline_batch(inboxes)
+    
+    sent = [message_data for batch in private.values() for message_data in batch]
+    if sent:
+        wire.emit('message_batch', {'messages': sent}, room=sender_id, skip_sid=request.sid)
+    
+    ack = {'success': True, 'data': acked}
+    if errors:
+        ack['errors'] = errors
+    return ack
+
+@socketio.on('sync')
+def handle_sync(data=None):
+    """stream the messages a reconnecting client missed, per thread after its last seen message"""
+    user_id = get_session_user_id()
+    if not user_id:
+        return send_error('unauthorized')
+    
+    threads = (data or {}).get('threads') or []
+    if len(threads) > current_app.config['SYNC_MAX_THREADS']:
+        return send_error(f"too many threads, at most {current_app.config['SYNC_MAX_THREADS']}")
+    batch_size = current_app.config['SYNC_BATCH_SIZE']
+    
+    # the offline inbox also has the latest messages the background writer has not stored yet
+    inbox = read_offline(user_id)
+    pending = {}
+    for message_data in inbox:
+        pending.setdefault(thread_key(message_data, user_id), []).append(message_data)
+    
+    total = 0
+    for thread in threads:
+        key, query = thread_query(user_id, thread)
+        if not key:
+            continue
         
-        # update conversation updated time
-        conversation.updated_at = datetime.utcnow()
+        if key[0] == 'conversation_id' and not is_participant(key[1], user_id):
+            wire.emit('sync_batch', {key[0]: key[1], 'messages': [], 'error': 'unauthorized to access this conversation'})
+            continue
         
-        db.session.commit()
+        try:
+            cursor = parse_thread_cursor(thread, query)
+        except (ValueError, LookupError) as e:
+            wire.emit('sync_batch', {key[0]: key[1], 'messages': [], 'error': str(e)})
+            continue
         
-        # format message
-        message_data = message.to_dict()
+        # is_read follows the user's read cursor of the thread
+        read_at = read_cursor(user_id, key)
+        synced = set()
+        for batch in iter_delta(query, cursor[0], cursor[1], batch_size):
+            wire.emit('sync_batch', {key[0]: key[1], 'messages': set_read_state(batch, user_id, read_at)})
+            synced.update(message_data['message_id'] for message_data in batch)
+            total += len(batch)
+            # let other sockets of this worker run between batches
+            socketio.sleep(0)
         
-        # send message to all members of the conversation
-        emit('conversation_message', message_data, room=conversation_id)
+        unstored = [message_data for message_data in pending.pop(key, [])
+                    if message_data['message_id'] not in synced and is_after(message_data, cursor)]
+        if unstored:
+            wire.emit('sync_batch', {key[0]: key[1], 'messages': set_read_state(unstored, user_id, read_at)})
+            total += len(unstored)
     
-    except Exception as e:
-        db.session.rollback()
-        emit('error', {'message': str(e)})
+    # threads the client has no cursor for, e.g. new conversations, only get their offline messages
+    for key, messages in pending.items():
+        set_read_state(messages, user_id, read_cursor(user_id, key))
+        for start in range(0, len(messages), batch_size):
+            wire.emit('sync_batch', {key[0]: key[1], 'messages': messages[start:start + batch_size]})
+        total += len(messages)
+    
+    clear_offline(user_id, [message_data['message_id'] for message_data in inbox])
+    emit('sync_complete', {'messages': total})
+    return {'success': True, 'messages': total}
 
 @socketio.on('typing')
 def handle_typing(data):
-    user_id = data.get('user_id')
+    user_id = get_session_user_id()
     recipient_id = data.get('recipient_id')
     conversation_id = data.get('conversation_id')
-    is_typing = data.get('is_typing', False)
+    is_typing = bool(data.get('is_typing', False))
     
     if not user_id:
         return
     
-    typing_data = {
-        'user_id': user_id,
-        'is_typing': is_typing
-    }
-    
-    # private chat typing status
+    # private chat typing status goes to the user's room, group chat typing status to the conversation's
     if recipient_id:
-        emit('user_typing', typing_data, room=recipient_id)
+        target = recipient_id
+    elif conversation_id and is_participant(conversation_id, user_id):
+        target = conversation_id
+    else:
+        return
     
-    # group chat typing status
-    elif conversation_id:
-        emit('user_typing', typing_data, room=conversation_id) 
\ No newline at end of file
+    # coalesce repeated states and rate limit, most keystroke events stop here
+    if not typing_throttle.update(user_id, target, is_typing):
+        return
+    
+    emit('user_typing', {'user_id': user_id, 'is_typing': is_typing}, room=target)
+
+def init_typing(app):
+    """apply the typing settings and start relaying typing timeouts"""
+    typing_throttle.min_interval = app.config['TYPING_MIN_INTERVAL']
+    typing_throttle.refresh_interval = app.config['TYPING_REFRESH_INTERVAL']
+    typing_throttle.timeout = app.config['TYPING_TIMEOUT']
+    typing_throttle.max_typers = app.config['TYPING_MAX_TYPERS']
+    socketio.start_background_task(run_typing_expiry)
+
+def run_typing_expiry():
+    """background task relaying the end of typing for users who stopped sending typing events"""
+    while True:
+        socketio.sleep(1)
+        for user_id, target in typing_throttle.expire():
+            socketio.emit('user_typing', {'user_id': user_id, 'is_typing': False}, room=target)
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import DDL, event
 from app import db
 
 class Listing(db.Model):
@@ -10,18 +11,29 @@ class Listing(db.Model):
     price = db.Column(db.Numeric(10, 2), nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
+    description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
+    # indexes for the listing search filters and keyset pagination
+    __table_args__ = (
+        db.Index('ix_listings_created_at_listing_id', 'created_at', 'listing_id'),
+        db.Index('ix_listings_price_search', 'price', 'listing_id', 'start_date', 'end_date', 'property_id'),
+        db.Index('ix_listings_start_date_end_date', 'start_date', 'end_date'),
+        db.Index('ix_listings_author_id', 'author_id'),
+        db.Index('ix_listings_property_id', 'property_id'),
+    )
+    
     # relationships
     # delete-orphan is used to delete the interests when the listing is deleted
     interests = db.relationship('UserInterest', backref='listing', lazy='dynamic', cascade='all, delete-orphan')
     
-    def __init__(self, property_id, author_id, price, start_date, end_date):
+    def __init__(self, property_id, author_id, price, start_date, end_date, description=None):
         self.property_id = property_id
         self.author_id = author_id
         self.price = price
         self.start_date = start_date
         self.end_date = end_date
+        self.description = description
     
     def to_dict(self, include_property=False, include_address=False):
         result = {
@@ -31,6 +43,7 @@ class Listing(db.Model):
             'price': float(self.price),
             'start_date': self.start_date.isoformat() if self.start_date else None,
             'end_date': self.end_date.isoformat() if self.end_date else None,
+            'description': self.description,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
         
@@ -40,4 +53,18 @@ class Listing(db.Model):
             if include_address and hasattr(self.property, 'address'):
                 result['address'] = self.property.address.to_dict()
         
-        return result 
\ No newline at end of file
+        return result
+
+# full-text index of listings with their property and address, kept up to date by
+# app/services/search_index.py: FTS5 on SQLite, where the rowid is the listing_id,
+# and a FULLTEXT index on MariaDB
+event.listen(Listing.__table__, 'after_create', DDL(
+    "CREATE VIRTUAL TABLE listing_search USING fts5(street_address, city, details, description)"
+).execute_if(dialect='sqlite'))
+event.listen(Listing.__table__, 'after_create', DDL(
+    "CREATE TABLE listing_search ("
+    "listing_id INTEGER NOT NULL PRIMARY KEY, street_address VARCHAR(200), city VARCHAR(100), "
+    "details VARCHAR(100), description TEXT, "
+    "FULLTEXT KEY ft_listing_search (street_address, city, details, description)) ENGINE=InnoDB"
+).execute_if(dialect='mysql'))
+event.listen(Listing.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS listing_search"))
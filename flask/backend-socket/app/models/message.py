@@ -13,18 +13,37 @@ class Message(db.Model):
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     is_read = db.Column(db.Boolean, default=False)
     
+    # indexes for paging through conversation and direct message history
+    __table_args__ = (
+        db.Index('ix_messages_conversation_id_timestamp', 'conversation_id', 'timestamp', 'message_id'),
+        db.Index('ix_messages_sender_id_recipient_id_timestamp', 'sender_id', 'recipient_id', 'timestamp', 'message_id'),
+    )
+    
     # relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     recipient = db.relationship('User', foreign_keys=[recipient_id], backref='received_messages')
     conversation = db.relationship('Conversation', backref='messages')
     
-    def to_dict(self):
+    def is_read_by(self, user_id, cursor):
+        """True if user_id sent the message or it is at or before their read cursor of its thread
+
+        cursor is the user's ConversationParticipant or DirectReadCursor row, None if they have none
+        """
+        if self.sender_id == user_id:
+            return True
+        if cursor is None or cursor.last_read_at is None:
+            return False
+        return (self.timestamp, self.message_id) <= (cursor.last_read_at, cursor.last_read_message_id or '')
+    
+    def to_dict(self, is_read=False):
+        # the is_read column only follows the single-message read route, the read cursors are
+        # authoritative: callers pass the reader's state (is_read_by)
         result = {
             'message_id': self.message_id,
             'sender_id': self.sender_id,
             'content': self.content,
             'timestamp': self.timestamp.isoformat(),
-            'is_read': self.is_read
+            'is_read': is_read
         }
         
         if self.recipient_id:
@@ -60,4 +79,22 @@ class ConversationParticipant(db.Model):
     
     conversation_id = db.Column(db.String(36), db.ForeignKey('conversations.conversation_id'), primary_key=True)
     user_id = db.Column(db.String(36), db.ForeignKey('users.user_id'), primary_key=True)
-    joined_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) 
\ No newline at end of file
+    joined_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # read cursor, the participant has read every message up to (last_read_at, last_read_message_id)
+    last_read_message_id = db.Column(db.String(36), nullable=True)
+    last_read_at = db.Column(db.DateTime, nullable=True)
+    
+    # the primary key starts with conversation_id, the inbox looks up by user_id
+    __table_args__ = (
+        db.Index('ix_conversation_participants_user_id', 'user_id'),
+    )
+
+class DirectReadCursor(db.Model):
+    __tablename__ = 'direct_read_cursors'
+    
+    # user_id has read every message from peer_id up to (last_read_at, last_read_message_id)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.user_id'), primary_key=True)
+    peer_id = db.Column(db.String(36), db.ForeignKey('users.user_id'), primary_key=True)
+    last_read_message_id = db.Column(db.String(36), nullable=True)
+    last_read_at = db.Column(db.DateTime, nullable=True) 
\ No newline at end of file
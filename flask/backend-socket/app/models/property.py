@@ -10,6 +10,16 @@ class Address(db.Model):
     state = db.Column(db.String(50), nullable=False)
     zip_code = db.Column(db.String(20), nullable=False)
     
+    # location, from the client or the zip code centroid, and its geohash cell for location search
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    
+    __table_args__ = (
+        db.Index('ix_addresses_city', 'city'),
+        db.Index('ix_addresses_geohash', 'geohash', 'latitude', 'longitude'),
+    )
+    
     # relationships
     properties = db.relationship('Property', backref='address', lazy='dynamic')
     
@@ -28,6 +38,8 @@ class Address(db.Model):
             'city': self.city,
             'state': self.state,
             'zip_code': self.zip_code,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
             'full_address': self.get_full_address()
         }
     
@@ -50,6 +62,12 @@ class Property(db.Model):
     owner_id = db.Column(db.String(36), db.ForeignKey('users.user_id'), nullable=False)
     property_type = db.Column(db.String(50), nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_properties_bedrooms_address_id', 'bedrooms', 'address_id'),
+        db.Index('ix_properties_address_id', 'address_id'),
+        db.Index('ix_properties_owner_id', 'owner_id'),
+    )
+    
     # relationships
     listings = db.relationship('Listing', backref='property', lazy='dynamic')
     
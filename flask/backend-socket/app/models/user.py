@@ -57,6 +57,10 @@ class UserInterest(db.Model):
     listing_id = db.Column(db.Integer, db.ForeignKey('listings.listing_id'), primary_key=True)
     interest_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_user_interests_listing_id', 'listing_id'),
+    )
+    
     def __init__(self, user_id, listing_id):
         self.user_id = user_id
         self.listing_id = listing_id
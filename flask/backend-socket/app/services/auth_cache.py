@@ -0,0 +1,146 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import redis
+from flask import current_app
+from flask_jwt_extended import decode_token
+from sqlalchemy.exc import OperationalError
+from app.models.user import User
+from app.utils.redis_client import get_redis
+from app.utils import metrics
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# sha256 of a verified token -> "user_id jti", expires with the token
+TOKEN_KEY = 'auth:token:{}'
+# '1' if the user exists, '0' if not
+USER_KEY = 'auth:user:{}'
+# present while a revoked token would still be valid, written by the API's logout (POST /api/auth/logout)
+REVOKED_KEY = 'auth:revoked:{}'
+
+# digest -> (user_id, jti, exp) of tokens verified by this process, least recently used first
+_tokens = OrderedDict()
+_lock = threading.Lock()
+
+def _digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _get_local(digest):
+    with _lock:
+        entry = _tokens.get(digest)
+        if entry is None:
+            return None
+        if entry[2] <= time.time():
+            del _tokens[digest]
+            return None
+        _tokens.move_to_end(digest)
+        return entry
+
+def _set_local(digest, entry):
+    with _lock:
+        _tokens[digest] = entry
+        while len(_tokens) > current_app.config['AUTH_TOKEN_CACHE_SIZE']:
+            _tokens.popitem(last=False)
+
+def _verify(token):
+    """(user_id, jti, exp) of a token, from the caches or by decoding it, raises if the token is invalid"""
+    digest = _digest(token)
+    entry = _get_local(digest)
+    if entry:
+        metrics.incr('auth_token_cache_hit')
+        return entry
+
+    client = get_redis()
+    try:
+        cached = client.get(TOKEN_KEY.format(digest))
+        if cached:
+            user_id, jti, exp = cached.split(' ')
+            entry = (user_id, jti, float(exp))
+            if entry[2] > time.time():
+                _set_local(digest, entry)
+                metrics.incr('auth_token_cache_hit')
+                return entry
+    except redis.RedisError as e:
+        logger.error(f"Error: token cache read failed - {str(e)}")
+
+    metrics.incr('auth_token_cache_miss')
+    decoded = decode_token(token)
+    entry = (decoded['sub'], decoded['jti'], float(decoded['exp']))
+    _set_local(digest, entry)
+    try:
+        client.set(TOKEN_KEY.format(digest), f'{entry[0]} {entry[1]} {entry[2]}',
+                   ex=max(1, int(entry[2] - time.time())))
+    except redis.RedisError as e:
+        logger.error(f"Error: token cache write failed - {str(e)}")
+    return entry
+
+def _user_exists(user_id):
+    """look up only the primary key instead of loading the user row"""
+    return db.session.query(User.user_id).filter(User.user_id == user_id).first() is not None
+
+def _load_user(client, user_id):
+    """whether a user exists, from the database, cached for the next lookups
+
+    counts the user as existing while the database is unavailable
+    """
+    metrics.incr('auth_user_cache_miss')
+    try:
+        exists = _user_exists(user_id)
+    except OperationalError as e:
+        # do not lock everyone out while the database is unavailable
+        logger.error(f"Error: Database connection error - {str(e)}")
+        return True
+
+    try:
+        if exists:
+            client.set(USER_KEY.format(user_id), '1', ex=current_app.config['AUTH_USER_CACHE_TTL'])
+        else:
+            client.set(USER_KEY.format(user_id), '0', ex=current_app.config['AUTH_USER_MISSING_TTL'])
+    except redis.RedisError as e:
+        logger.error(f"Error: user cache write failed - {str(e)}")
+    return exists
+
+def authenticate(token):
+    """user id of a valid token whose user exists and that was not revoked, None otherwise
+
+    raises the JWT errors of decode_token for invalid or expired tokens
+    """
+    user_id, jti, exp = _verify(token)
+
+    client = get_redis()
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.exists(REVOKED_KEY.format(jti))
+        pipe.get(USER_KEY.format(user_id))
+        revoked, exists = pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error: user cache read failed - {str(e)}")
+        revoked, exists = False, None
+
+    if revoked:
+        logger.info(f"Token of user {user_id} was revoked")
+        return None
+
+    if exists is not None:
+        metrics.incr('auth_user_cache_hit')
+        return user_id if exists == '1' else None
+
+    return user_id if _load_user(client, user_id) else None
+
+def user_exists(user_id):
+    """whether a user exists, from the same cache as authenticate, e.g. for message recipients"""
+    client = get_redis()
+    try:
+        exists = client.get(USER_KEY.format(user_id))
+    except redis.RedisError as e:
+        logger.error(f"Error: user cache read failed - {str(e)}")
+        exists = None
+
+    if exists is not None:
+        metrics.incr('auth_user_cache_hit')
+        return exists == '1'
+
+    return _load_user(client, user_id)
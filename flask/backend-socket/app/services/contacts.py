@@ -0,0 +1,96 @@
+import logging
+import redis
+from flask import current_app
+from sqlalchemy.orm import aliased
+from app.models.message import Message, ConversationParticipant
+from app.utils.redis_client import get_redis
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# users who share a conversation or have exchanged direct messages with a user, shared by every process
+CONTACTS_KEY = 'user:{}:contacts'
+# member of a contact set loaded from the database, sets without it only hold the contacts added since
+LOADED = ''
+
+def _load_contacts(user_ids):
+    """user_id -> set of contact ids, from the conversations and the direct messages of the users"""
+    contacts = {user_id: set() for user_id in user_ids}
+    other = aliased(ConversationParticipant)
+    rows = db.session.query(
+        ConversationParticipant.user_id, other.user_id
+    ).join(
+        other, other.conversation_id == ConversationParticipant.conversation_id
+    ).filter(
+        ConversationParticipant.user_id.in_(user_ids),
+        other.user_id != ConversationParticipant.user_id
+    ).distinct().all()
+    rows += db.session.query(Message.sender_id, Message.recipient_id).filter(
+        Message.sender_id.in_(user_ids),
+        Message.recipient_id.isnot(None)
+    ).distinct().all()
+    rows += db.session.query(Message.recipient_id, Message.sender_id).filter(
+        Message.recipient_id.in_(user_ids)
+    ).distinct().all()
+    for user_id, contact_id in rows:
+        contacts[user_id].add(contact_id)
+    return contacts
+
+def get_contacts(user_ids):
+    """user_id -> frozenset of contact ids of each user
+
+    served from the redis sets, the database is only read for users whose set
+    is not loaded, which then stays up to date through add_contacts
+    """
+    user_ids = list(user_ids)
+    cached = [None] * len(user_ids)
+    client = get_redis()
+    try:
+        pipe = client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.smembers(CONTACTS_KEY.format(user_id))
+        cached = pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error: contacts cache read failed - {str(e)}")
+
+    contacts = {}
+    missing = []
+    for user_id, members in zip(user_ids, cached):
+        if members and LOADED in members:
+            contacts[user_id] = frozenset(members - {LOADED})
+        else:
+            missing.append(user_id)
+    if not missing:
+        return contacts
+
+    loaded = _load_contacts(missing)
+    try:
+        # a union, contacts added while the database was read (or not stored yet by the writer) are kept
+        pipe = client.pipeline(transaction=False)
+        for user_id, contact_ids in loaded.items():
+            pipe.sadd(CONTACTS_KEY.format(user_id), LOADED, *contact_ids)
+            pipe.expire(CONTACTS_KEY.format(user_id), current_app.config['CONTACTS_REDIS_TTL'])
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error: contacts cache write failed - {str(e)}")
+
+    for user_id, contact_ids in loaded.items():
+        contacts[user_id] = frozenset(contact_ids)
+    return contacts
+
+def add_contacts(pairs):
+    """record that each (user_id, other_id) pair are now contacts of each other, e.g. after a first message"""
+    pairs = {(user_id, other_id) for user_id, other_id in pairs if user_id != other_id}
+    if not pairs:
+        return
+    ttl = current_app.config['CONTACTS_REDIS_TTL']
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id, other_id in pairs:
+            for key, contact_id in [(CONTACTS_KEY.format(user_id), other_id), (CONTACTS_KEY.format(other_id), user_id)]:
+                pipe.sadd(key, contact_id)
+                pipe.expire(key, ttl)
+        pipe.execute()
+    except redis.RedisError as e:
+        # peers miss presence updates until the set expires
+        logger.error(f"Error: contacts cache write failed - {str(e)}")
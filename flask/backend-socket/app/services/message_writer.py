@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import socket
+import logging
+from datetime import datetime
+import redis
+from flask import current_app
+from sqlalchemy import insert, update, and_
+from sqlalchemy.exc import IntegrityError
+from app.models.message import Message, Conversation
+from app.utils.redis_client import get_redis
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# messages are appended here by the socket handlers and written to the database in batches
+STREAM_KEY = 'messages:stream'
+GROUP = 'message_writers'
+# message id -> message, for recognizing client retries
+DEDUPE_KEY = 'message:dedupe:{}'
+# acked messages the database refused, kept with the error to be inspected and replayed instead of dropped
+DEAD_LETTER_KEY = 'messages:dead'
+
+# append the message unless its id was seen recently, atomically; returns the first message for a retry
+ENQUEUE_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    redis.call('XADD', KEYS[2], '*', 'message', ARGV[1])
+    return false
+end
+return redis.call('GET', KEYS[1])
+"""
+_enqueue = None
+
+# the same for a batch: the new messages are appended as one entry, so they are stored in one transaction.
+# KEYS are the dedupe keys then the stream, ARGV the TTL then the messages; returns the first message of
+# each retried id and false for the new ones
+ENQUEUE_BATCH_SCRIPT = """
+local count = #KEYS - 1
+local result = {}
+local added = {}
+for i = 1, count do
+    if redis.call('SET', KEYS[i], ARGV[i + 1], 'NX', 'EX', ARGV[1]) then
+        added[#added + 1] = ARGV[i + 1]
+        result[i] = false
+    else
+        result[i] = redis.call('GET', KEYS[i])
+    end
+end
+if #added > 0 then
+    redis.call('XADD', KEYS[count + 1], '*', 'messages', '[' .. table.concat(added, ',') .. ']')
+end
+return result
+"""
+_enqueue_batch = None
+
+MESSAGE_COLUMNS = ('message_id', 'sender_id', 'recipient_id', 'conversation_id', 'content', 'timestamp', 'is_read')
+
+def enqueue_message(message_data):
+    """append a message to the stream, kept in redis's append-only file, once this returns it will be stored
+
+    returns (message_data, is_new). a message id seen in the last MESSAGE_DEDUPE_TTL
+    seconds is a retry: nothing is appended and the first message is returned.
+    raises ValueError if another sender used the id
+    """
+    global _enqueue
+    if _enqueue is None:
+        _enqueue = get_redis().register_script(ENQUEUE_SCRIPT)
+
+    existing = _enqueue(keys=[DEDUPE_KEY.format(message_data['message_id']), STREAM_KEY],
+                        args=[json.dumps(message_data), current_app.config['MESSAGE_DEDUPE_TTL']])
+    if not existing:
+        return message_data, True
+
+    existing = json.loads(existing)
+    if existing['sender_id'] != message_data['sender_id']:
+        raise ValueError('message id already in use')
+    return existing, False
+
+def enqueue_messages(messages):
+    """append a batch of messages to the stream with one script call, they are stored together
+
+    returns (message_data, is_new) per message like enqueue_message, with
+    (None, False) for a message id another sender already used
+    """
+    global _enqueue_batch
+    if _enqueue_batch is None:
+        _enqueue_batch = get_redis().register_script(ENQUEUE_BATCH_SCRIPT)
+
+    keys = [DEDUPE_KEY.format(message_data['message_id']) for message_data in messages] + [STREAM_KEY]
+    args = [current_app.config['MESSAGE_DEDUPE_TTL']] + [json.dumps(message_data) for message_data in messages]
+    results = []
+    for message_data, existing in zip(messages, _enqueue_batch(keys=keys, args=args)):
+        if not existing:
+            results.append((message_data, True))
+            continue
+        existing = json.loads(existing)
+        if existing['sender_id'] != message_data['sender_id']:
+            results.append((None, False))
+        else:
+            results.append((existing, False))
+    return results
+
+def _to_row(message_data):
+    row = {column: message_data.get(column) for column in MESSAGE_COLUMNS}
+    row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+    row['is_read'] = bool(row['is_read'])
+    return row
+
+def _insert_rows(rows):
+    """insert the rows not stored yet with one multi-row INSERT, a batch can be delivered twice after a crash"""
+    existing = {message_id for (message_id,) in db.session.query(Message.message_id).filter(
+        Message.message_id.in_([row['message_id'] for row in rows])
+    )}
+    rows = [row for row in rows if row['message_id'] not in existing]
+    if not rows:
+        return
+
+    db.session.execute(insert(Message.__table__).values(rows))
+
+    # latest message per conversation, so the inbox order follows the messages
+    latest = {}
+    for row in rows:
+        conversation_id = row['conversation_id']
+        if conversation_id and (conversation_id not in latest or row['timestamp'] > latest[conversation_id]):
+            latest[conversation_id] = row['timestamp']
+    for conversation_id, timestamp in latest.items():
+        db.session.execute(update(Conversation.__table__).where(and_(
+            Conversation.conversation_id == conversation_id,
+            Conversation.updated_at < timestamp
+        )).values(updated_at=timestamp))
+
+def _entry_rows(fields):
+    """rows of a stream entry, a single message or a batch_message batch"""
+    if 'messages' in fields:
+        return [_to_row(message_data) for message_data in json.loads(fields['messages'])]
+    return [_to_row(json.loads(fields['message']))]
+
+def write_batch(entries):
+    """store a batch of stream entries, return the entry ids that can be acknowledged"""
+    # entries deleted from the stream come back without fields, there is nothing left to write
+    done = [entry_id for entry_id, fields in entries if not fields]
+    entries = [(entry_id, _entry_rows(fields)) for entry_id, fields in entries if fields]
+    rows = [row for _, entry_rows in entries for row in entry_rows]
+    if not rows:
+        return done
+
+    try:
+        _insert_rows(rows)
+        db.session.commit()
+        return done + [entry_id for entry_id, _ in entries]
+    except IntegrityError:
+        db.session.rollback()
+
+    # one bad row (e.g. a deleted conversation) must not block the whole batch, retry one by one
+    for entry_id, entry_rows in entries:
+        for row in entry_rows:
+            try:
+                _insert_rows([row])
+                db.session.commit()
+            except IntegrityError as e:
+                db.session.rollback()
+                _dead_letter(row, e)
+        done.append(entry_id)
+    return done
+
+def _dead_letter(row, error):
+    """keep a message the database refused in the dead-letter stream, the sender was already acked"""
+    message_data = dict(row, timestamp=row['timestamp'].isoformat())
+    # a redis error propagates, the stream entry then stays pending and is written again
+    get_redis().xadd(DEAD_LETTER_KEY, {'message': json.dumps(message_data), 'error': str(error.orig)})
+    logger.error(f"Error: message {row['message_id']} moved to {DEAD_LETTER_KEY} - {str(error)}")
+
+def _claim_stale_entries(client, consumer, min_idle_ms, count):
+    """take over entries left pending by writers that died before acknowledging them, return how many"""
+    pending = client.xpending_range(STREAM_KEY, GROUP, '-', '+', count)
+    stale = [entry['message_id'] for entry in pending
+             if entry['consumer'] != consumer and entry['time_since_delivered'] >= min_idle_ms]
+    if stale:
+        client.xclaim(STREAM_KEY, GROUP, consumer, min_idle_ms, stale)
+    return len(stale)
+
+def _read(client, consumer, read_id, count, block=None):
+    response = client.xreadgroup(GROUP, consumer, {STREAM_KEY: read_id}, count=count, block=block)
+    return response[0][1] if response else []
+
+def run_message_writer(app, socketio):
+    """background task moving messages from the stream into the database"""
+    client = get_redis()
+    consumer = f'{socket.gethostname()}-{os.getpid()}'
+    batch_size = app.config['MESSAGE_WRITER_BATCH_SIZE']
+    block_ms = app.config['MESSAGE_WRITER_BLOCK_MS']
+    claim_idle_ms = app.config['MESSAGE_WRITER_CLAIM_IDLE_MS']
+
+    try:
+        client.xgroup_create(STREAM_KEY, GROUP, id='0', mkstream=True)
+    except redis.ResponseError:
+        # the group already exists
+        pass
+
+    # entries this consumer read but did not acknowledge, e.g. before a restart, come first
+    recovering = True
+    last_claim = 0
+    while True:
+        try:
+            now = time.monotonic()
+            if now - last_claim >= claim_idle_ms / 1000:
+                last_claim = now
+                recovering = _claim_stale_entries(client, consumer, claim_idle_ms, batch_size) > 0 or recovering
+
+            entries = _read(client, consumer, '0', batch_size) if recovering else []
+            if not entries:
+                recovering = False
+                entries = _read(client, consumer, '>', batch_size, block_ms)
+            if not entries:
+                continue
+
+            with app.app_context():
+                written = write_batch(entries)
+
+            pipe = client.pipeline()
+            pipe.xack(STREAM_KEY, GROUP, *written)
+            pipe.xdel(STREAM_KEY, *written)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Error: message writer failed - {str(e)}")
+            # the entries stay pending and are read again
+            recovering = True
+            socketio.sleep(1)
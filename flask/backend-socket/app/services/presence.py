@@ -0,0 +1,141 @@
+import time
+import logging
+import redis
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# key layout
+#   presence:sid:{sid}        -> user_id, expires after PRESENCE_TTL without a heartbeat
+#   presence:user:{user_id}   -> sorted set of the user's sids, scored by their expiry time
+#   presence:online           -> sorted set of online user ids, scored by their latest sid expiry
+SID_KEY = 'presence:sid:{}'
+USER_KEY = 'presence:user:{}'
+ONLINE_KEY = 'presence:online'
+
+# unregister a sid and take the user offline if it was their last live one, atomically so that
+# a connect of the same user on another worker cannot slip in between
+REMOVE_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+local remaining = redis.call('ZCARD', KEYS[2])
+if remaining == 0 then
+    redis.call('ZREM', KEYS[3], ARGV[3])
+end
+return remaining
+"""
+_remove = None
+
+# take the users whose sockets all expired off the online set and return them, atomically so that
+# each one is reported by a single worker
+EXPIRE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+end
+return expired
+"""
+_expire = None
+
+_ttl = 60
+_heartbeat_interval = 20
+
+# sids connected to this worker, refreshed by the heartbeat task
+_local_sids = {}
+
+def init_presence(app):
+    """read the presence settings, the registry uses the shared redis client"""
+    global _ttl, _heartbeat_interval
+    _ttl = app.config['PRESENCE_TTL']
+    _heartbeat_interval = app.config['PRESENCE_HEARTBEAT_INTERVAL']
+
+def add_connection(user_id, sid):
+    """register a socket of a user, return True if the user just came online"""
+    now = time.time()
+    expires_at = now + _ttl
+    _local_sids[sid] = user_id
+
+    pipe = get_redis().pipeline()
+    pipe.set(SID_KEY.format(sid), user_id, ex=_ttl)
+    pipe.zremrangebyscore(USER_KEY.format(user_id), '-inf', now)
+    pipe.zcard(USER_KEY.format(user_id))
+    pipe.zadd(USER_KEY.format(user_id), {sid: expires_at})
+    pipe.expire(USER_KEY.format(user_id), _ttl)
+    pipe.zadd(ONLINE_KEY, {user_id: expires_at})
+    results = pipe.execute()
+
+    # no live socket before this one
+    return results[2] == 0
+
+def remove_connection(sid):
+    """unregister a socket, return (user_id, went_offline)
+
+    user_id is None if the sid is unknown. went_offline is True when it
+    was the last live socket of the user, on any worker
+    """
+    global _remove
+    user_id = _local_sids.pop(sid, None) or get_redis().get(SID_KEY.format(sid))
+    if not user_id:
+        return None, False
+
+    if _remove is None:
+        _remove = get_redis().register_script(REMOVE_SCRIPT)
+    remaining = _remove(keys=[SID_KEY.format(sid), USER_KEY.format(user_id), ONLINE_KEY],
+                        args=[sid, time.time(), user_id])
+    return user_id, remaining == 0
+
+def is_online(user_id):
+    """True if the user has at least one live socket"""
+    return get_redis().zcount(USER_KEY.format(user_id), time.time(), '+inf') > 0
+
+def filter_online(user_ids):
+    """the subset of user_ids that are online, one round trip"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return set()
+
+    pipe = get_redis().pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.zscore(ONLINE_KEY, user_id)
+    now = time.time()
+    return {user_id for user_id, expires_at in zip(user_ids, pipe.execute())
+            if expires_at is not None and expires_at > now}
+
+def heartbeat():
+    """extend the TTL of every socket connected to this worker and drop users whose sockets all expired
+
+    returns the resulting status changes, user_id -> 'online' or 'offline'
+    """
+    global _expire
+    changes = {}
+    if _local_sids:
+        expires_at = time.time() + _ttl
+        users = list(_local_sids.items())
+        pipe = get_redis().pipeline(transaction=False)
+        for sid, user_id in users:
+            pipe.set(SID_KEY.format(sid), user_id, ex=_ttl)
+            pipe.zadd(USER_KEY.format(user_id), {sid: expires_at})
+            pipe.expire(USER_KEY.format(user_id), _ttl)
+            pipe.zadd(ONLINE_KEY, {user_id: expires_at})
+        added = pipe.execute()[3::4]
+        # a late heartbeat finds its users dropped as expired, they are back online
+        changes.update((user_id, 'online') for (_, user_id), was_added in zip(users, added) if was_added)
+
+    # users whose sockets all expired, e.g. after a worker crash, on any worker
+    if _expire is None:
+        _expire = get_redis().register_script(EXPIRE_SCRIPT)
+    changes.update((user_id, 'offline') for user_id in _expire(keys=[ONLINE_KEY], args=[time.time()]))
+    return changes
+
+def run_heartbeat(socketio):
+    """background task refreshing this worker's sockets every PRESENCE_HEARTBEAT_INTERVAL seconds"""
+    # presence_updates imports this module
+    from app.services.presence_updates import queue_status
+    while True:
+        socketio.sleep(_heartbeat_interval)
+        try:
+            for user_id, status in heartbeat().items():
+                queue_status(user_id, status)
+        except redis.RedisError as e:
+            logger.error(f"Error: presence heartbeat failed - {str(e)}")
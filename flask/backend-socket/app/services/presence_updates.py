@@ -0,0 +1,74 @@
+import logging
+from app.services.contacts import get_contacts
+from app.services.presence import filter_online
+
+logger = logging.getLogger(__name__)
+
+# status changes of users on this worker not broadcast yet, user_id -> 'online' or 'offline'
+_pending = {}
+
+def queue_status(user_id, status):
+    """queue a status change for the next presence_diff batch"""
+    previous = _pending.pop(user_id, None)
+    # online and back offline (or the reverse) within one batch, peers never saw the change
+    if previous is not None and previous != status:
+        return
+    _pending[user_id] = status
+
+def peer_pairs(user_ids):
+    """(user_id, peer_id) pairs of users who share a conversation or have exchanged direct messages"""
+    return {(user_id, peer_id) for user_id, peers in get_contacts(user_ids).items() for peer_id in peers}
+
+def online_peers_page(user_id, cursor=None, limit=100):
+    """(online peer ids ordered by id, next_cursor), the cursor is the last id of the previous page"""
+    peers = sorted(peer_id for _, peer_id in peer_pairs([user_id]))
+    if cursor:
+        peers = [peer_id for peer_id in peers if peer_id > cursor]
+
+    page = []
+    # check online status a page at a time, so large contact lists stop early
+    for start in range(0, len(peers), limit):
+        chunk = peers[start:start + limit]
+        online = filter_online(chunk)
+        page.extend(peer_id for peer_id in chunk if peer_id in online)
+        if len(page) > limit:
+            break
+
+    next_cursor = page[limit - 1] if len(page) > limit else None
+    return page[:limit], next_cursor
+
+def flush(socketio):
+    """send each online peer one presence_diff with all the changes queued since the last flush"""
+    if not _pending:
+        return
+
+    changes = dict(_pending)
+    _pending.clear()
+
+    # with several workers another one may have queued a later change of the same user (e.g. from
+    # another device) and flushed it first, so send the user's current state rather than the queued one
+    online = filter_online(changes)
+    changes = {user_id: 'online' if user_id in online else 'offline' for user_id in changes}
+
+    pairs = peer_pairs(list(changes))
+    recipients = filter_online({peer_id for _, peer_id in pairs})
+
+    diffs = {}
+    for user_id, peer_id in pairs:
+        if peer_id in recipients:
+            diff = diffs.setdefault(peer_id, {'online': [], 'offline': []})
+            diff[changes[user_id]].append(user_id)
+
+    for peer_id, diff in diffs.items():
+        socketio.emit('presence_diff', diff, room=peer_id)
+
+def run_presence_updates(app, socketio):
+    """background task flushing presence changes every PRESENCE_BATCH_INTERVAL seconds"""
+    interval = app.config['PRESENCE_BATCH_INTERVAL']
+    while True:
+        socketio.sleep(interval)
+        try:
+            with app.app_context():
+                flush(socketio)
+        except Exception as e:
+            logger.error(f"Error: presence broadcast failed - {str(e)}")
@@ -0,0 +1,160 @@
+import json
+import logging
+from datetime import datetime
+import redis
+from flask import current_app
+from sqlalchemy import or_, and_
+from app.models.message import Message, ConversationParticipant, DirectReadCursor
+from app.utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# messages received while the user was offline, oldest first, bounded by OFFLINE_INBOX_SIZE
+INBOX_KEY = 'inbox:{}'
+
+# pop the delivered messages off the head of the inbox. a push since the read may have evicted some
+# of them and appended new ones, so the head is checked by message id rather than trimmed by count
+CLEAR_SCRIPT = """
+local delivered = {}
+for _, message_id in ipairs(ARGV) do
+    delivered[message_id] = true
+end
+local removed = 0
+while true do
+    local head = redis.call('LINDEX', KEYS[1], 0)
+    if not head or not delivered[cjson.decode(head)['message_id']] then
+        break
+    end
+    redis.call('LPOP', KEYS[1])
+    removed = removed + 1
+end
+return removed
+"""
+_clear = None
+
+def push_offline(user_ids, message_data):
+    """queue a message in the offline inbox of each user, one round trip"""
+    push_offline_batch({user_id: [message_data] for user_id in user_ids})
+
+def push_offline_batch(inboxes):
+    """queue messages in offline inboxes, {user_id: [message, ...]}, one round trip"""
+    if not inboxes:
+        return
+    size = current_app.config['OFFLINE_INBOX_SIZE']
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id, messages in inboxes.items():
+            key = INBOX_KEY.format(user_id)
+            pipe.rpush(key, *[json.dumps(message_data) for message_data in messages])
+            pipe.ltrim(key, -size, -1)
+            pipe.expire(key, current_app.config['OFFLINE_INBOX_TTL'])
+        pipe.execute()
+    except redis.RedisError as e:
+        # the messages are still in the database for the sync range queries
+        logger.error(f"Error: offline inbox write failed - {str(e)}")
+
+def read_offline(user_id):
+    """messages in the user's offline inbox, the inbox is kept until clear_offline"""
+    try:
+        return [json.loads(payload) for payload in get_redis().lrange(INBOX_KEY.format(user_id), 0, -1)]
+    except redis.RedisError as e:
+        logger.error(f"Error: offline inbox read failed - {str(e)}")
+        return []
+
+def clear_offline(user_id, message_ids):
+    """drop the messages a sync has delivered from the head of the inbox, messages pushed since stay"""
+    global _clear
+    if not message_ids:
+        return
+    try:
+        if _clear is None:
+            _clear = get_redis().register_script(CLEAR_SCRIPT)
+        _clear(keys=[INBOX_KEY.format(user_id)], args=list(message_ids))
+    except redis.RedisError as e:
+        logger.error(f"Error: offline inbox trim failed - {str(e)}")
+
+def thread_key(message_data, user_id):
+    """('conversation_id', id) or ('user_id', other user) of the thread a message belongs to"""
+    if message_data.get('conversation_id'):
+        return 'conversation_id', message_data['conversation_id']
+    if message_data['sender_id'] == user_id:
+        return 'user_id', message_data.get('recipient_id')
+    return 'user_id', message_data['sender_id']
+
+def thread_query(user_id, thread):
+    """(thread key, query of its messages) for a thread of the sync request, (None, None) if it names none"""
+    if thread.get('conversation_id'):
+        return ('conversation_id', thread['conversation_id']), \
+            Message.query.filter(Message.conversation_id == thread['conversation_id'])
+    if thread.get('user_id'):
+        other_user_id = thread['user_id']
+        return ('user_id', other_user_id), Message.query.filter(or_(
+            and_(Message.sender_id == user_id, Message.recipient_id == other_user_id),
+            and_(Message.sender_id == other_user_id, Message.recipient_id == user_id)
+        ))
+    return None, None
+
+def read_cursor(user_id, key):
+    """(last_read_at, last_read_message_id) of the user's read cursor of a thread, None if they have read nothing"""
+    if key[0] == 'conversation_id':
+        row = ConversationParticipant.query.get((key[1], user_id))
+    else:
+        row = DirectReadCursor.query.get((user_id, key[1]))
+    if row is None or row.last_read_at is None:
+        return None
+    return row.last_read_at, row.last_read_message_id or ''
+
+def set_read_state(messages, user_id, cursor):
+    """set is_read of message payloads for the user: they sent them or they are at or before their read cursor"""
+    for message_data in messages:
+        message_data['is_read'] = message_data['sender_id'] == user_id or (
+            cursor is not None and
+            (datetime.fromisoformat(message_data['timestamp']), message_data['message_id']) <= cursor
+        )
+    return messages
+
+def parse_thread_cursor(thread, query):
+    """(timestamp, message_id) after which the client is missing messages, (None, None) for the whole thread
+
+    the client sends after_timestamp with after_message_id, or either one alone.
+    raises ValueError for a bad timestamp and LookupError for an unknown message id
+    """
+    after_timestamp = thread.get('after_timestamp')
+    after_message_id = thread.get('after_message_id')
+
+    if after_timestamp:
+        try:
+            return datetime.fromisoformat(after_timestamp), after_message_id or ''
+        except (TypeError, ValueError):
+            raise ValueError('invalid after_timestamp, use ISO 8601')
+
+    if after_message_id:
+        message = query.filter(Message.message_id == after_message_id).first()
+        if not message:
+            raise LookupError('message not found in this thread')
+        return message.timestamp, message.message_id
+
+    return None, None
+
+def is_after(message_data, cursor):
+    """True if a message payload comes after a (timestamp, message_id) cursor"""
+    if cursor[0] is None:
+        return True
+    return (datetime.fromisoformat(message_data['timestamp']), message_data['message_id']) > cursor
+
+def iter_delta(query, after_timestamp, after_message_id, batch_size):
+    """messages of a thread after the cursor in (timestamp, message_id) order, one indexed range query per batch"""
+    while True:
+        batch_query = query
+        if after_timestamp is not None:
+            batch_query = query.filter(or_(
+                Message.timestamp > after_timestamp,
+                and_(Message.timestamp == after_timestamp, Message.message_id > after_message_id)
+            ))
+        messages = batch_query.order_by(Message.timestamp.asc(), Message.message_id.asc()).limit(batch_size).all()
+        if not messages:
+            return
+        yield [message.to_dict() for message in messages]
+        if len(messages) < batch_size:
+            return
+        after_timestamp, after_message_id = messages[-1].timestamp, messages[-1].message_id
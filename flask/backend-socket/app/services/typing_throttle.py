@@ -0,0 +1,73 @@
+import time
+
+class TypingThrottle:
+    """decides which typing events are worth relaying, per (user, target)
+
+    repeated states are coalesced: while a user keeps typing only one event is
+    relayed every refresh_interval seconds. typing again less than min_interval
+    after stopping is dropped, and a user who stops sending typing events is
+    reported as stopped after timeout seconds (see expire). at most max_typers
+    users are relayed as typing per target, so large groups stay bounded.
+
+    holds no app state, so the worker-local instance can be driven by a fake clock in tests
+    """
+
+    def __init__(self, min_interval=1.0, refresh_interval=3.0, timeout=5.0, max_typers=5, clock=time.monotonic):
+        self.min_interval = min_interval
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.max_typers = max_typers
+        self.clock = clock
+        # (user_id, target) -> [is_typing, last relayed at, last typing event at]
+        self._entries = {}
+        # target -> number of users relayed as typing
+        self._typers = {}
+
+    def _stopped(self, target):
+        self._typers[target] -= 1
+        if not self._typers[target]:
+            del self._typers[target]
+
+    def update(self, user_id, target, is_typing):
+        """record a typing event, return True if it should be relayed"""
+        now = self.clock()
+        key = (user_id, target)
+        entry = self._entries.get(key)
+
+        if is_typing:
+            if entry and entry[0]:
+                entry[2] = now
+                if now - entry[1] < self.refresh_interval:
+                    return False
+                entry[1] = now
+                return True
+            if entry and now - entry[1] < self.min_interval:
+                return False
+            # enough typers shown already, the next keystroke tries again
+            if self._typers.get(target, 0) >= self.max_typers:
+                return False
+            self._entries[key] = [True, now, now]
+            self._typers[target] = self._typers.get(target, 0) + 1
+            return True
+
+        # stopping is relayed once, and only if starting was
+        if not entry or not entry[0]:
+            return False
+        entry[0] = False
+        entry[1] = now
+        self._stopped(target)
+        return True
+
+    def expire(self):
+        """(user_id, target) pairs whose typing timed out, to be relayed as stopped"""
+        now = self.clock()
+        expired = []
+        for key, entry in list(self._entries.items()):
+            if entry[0] and now - entry[2] >= self.timeout:
+                entry[0] = False
+                entry[1] = now
+                self._stopped(key[1])
+                expired.append(key)
+            elif not entry[0] and now - entry[1] >= self.min_interval:
+                del self._entries[key]
+        return expired
@@ -0,0 +1,110 @@
+from importlib.metadata import version
+
+import socketio
+from socketio import packet
+from engineio import packet as eio_packet
+
+# FanoutRedisManager relies on internals of this release (get_participants and the engine.io socket
+# lookup), later releases also encode an emit once per room themselves, pinned in requirements.txt
+SUPPORTED_VERSION = '5.3.0'
+
+def fanout_supported():
+    """whether the installed python-socketio is the release FanoutRedisManager was written for"""
+    return version('python-socketio') == SUPPORTED_VERSION
+
+class SharedPacket(eio_packet.Packet):
+    """engine.io packet that is encoded once and queued on many sockets"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encoded = {}
+
+    def encode(self, b64=False):
+        if b64 not in self._encoded:
+            self._encoded[b64] = super().encode(b64)
+        return self._encoded[b64]
+
+def encode_event(event, data, namespace):
+    """the encoded Socket.IO event packet, a string or a list of a string and binary attachments"""
+    # arguments as Server._emit_internal sends them: a tuple is several arguments, anything else one
+    if isinstance(data, tuple):
+        data = list(data)
+    elif data is not None:
+        data = [data]
+    else:
+        data = []
+    return packet.Packet(packet.EVENT, namespace=namespace, data=[event] + data).encode()
+
+class FanoutRedisManager(socketio.RedisManager):
+    """redis client manager that encodes each emitted event once
+
+    python-socketio publishes the event data and every worker encodes the packet
+    again for each recipient socket, so a message to a large room costs one JSON
+    encode per member. here the emitting worker encodes the packet and publishes it,
+    and each worker queues one shared engine.io packet on all its recipient sockets.
+
+    events with a callback, and events published by write-only emitters such as
+    the API service, take the regular path. every socket worker must use this
+    manager, the regular one cannot handle the pre-encoded messages. a worker on
+    another python-socketio release refuses to start rather than fall back to the
+    regular manager next to workers publishing pre-encoded messages
+    """
+    name = 'redis-fanout'
+
+    def __init__(self, *args, **kwargs):
+        if not fanout_supported():
+            raise RuntimeError(f"FanoutRedisManager needs python-socketio {SUPPORTED_VERSION}, "
+                               f"found {version('python-socketio')}")
+        super().__init__(*args, **kwargs)
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, **kwargs):
+        if callback is not None or kwargs.get('ignore_queue'):
+            return super().emit(event, data, namespace=namespace, room=room, skip_sid=skip_sid,
+                                callback=callback, **kwargs)
+
+        namespace = namespace or '/'
+        self._publish({'method': 'emit', 'event': event, 'packet': encode_event(event, data, namespace),
+                       'namespace': namespace, 'room': room, 'skip_sid': skip_sid,
+                       'host_id': self.host_id})
+
+    def emit_variants(self, event, variants, namespace=None, skip_sid=None):
+        """emit an event with different data to several rooms in a single publish
+
+        variants is a list of (room, data), e.g. one room per wire format. every
+        variant is encoded once here and each worker queues it on its sockets in that room
+        """
+        namespace = namespace or '/'
+        self._publish({'method': 'emit', 'event': event, 'namespace': namespace, 'skip_sid': skip_sid,
+                       'variants': [(room, encode_event(event, data, namespace)) for room, data in variants],
+                       'host_id': self.host_id})
+
+    def _handle_emit(self, message):
+        if 'packet' in message:
+            variants = [(message.get('room'), message['packet'])]
+        elif 'variants' in message:
+            variants = message['variants']
+        else:
+            return super()._handle_emit(message)
+
+        namespace = message['namespace']
+        if namespace not in self.rooms:
+            return
+        skip_sid = message.get('skip_sid')
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        for room, encoded in variants:
+            packets = None
+            for sid, eio_sid in self.get_participants(namespace, room):
+                if sid in skip_sid:
+                    continue
+                try:
+                    eio_socket = self.server.eio._get_socket(eio_sid)
+                except KeyError:
+                    # disconnected meanwhile
+                    continue
+                if packets is None:
+                    packets = [SharedPacket(eio_packet.MESSAGE, data=part)
+                               for part in (encoded if isinstance(encoded, list) else [encoded])]
+                for pkt in packets:
+                    eio_socket.send(pkt)
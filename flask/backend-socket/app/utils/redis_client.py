@@ -0,0 +1,11 @@
+import redis
+
+_redis = None
+
+def init_redis(app):
+    """create the client shared by the socket services, on the redis used for the message queue"""
+    global _redis
+    _redis = redis.Redis.from_url(app.config['REDIS_URL'], decode_responses=True)
+
+def get_redis():
+    return _redis
@@ -0,0 +1,8 @@
+from flask import session
+
+def get_session_user_id():
+    """id of the user authenticated when the socket connected, None for an unauthenticated socket
+
+    flask-socketio keeps one session per socket, so this is a local lookup on every event
+    """
+    return session.get('user_id')
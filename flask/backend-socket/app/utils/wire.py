@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+import msgpack
+from flask import request, session, current_app
+from flask_socketio import emit as socketio_emit, join_room as socketio_join_room, leave_room as socketio_leave_room
+
+# wire formats of the message events, chosen by the client at connect with ?format=
+JSON = 'json'
+COMPACT = 'compact'
+
+# short keys of the compact format, for messages and the envelopes of message_batch and sync_batch
+KEYS = {
+    'message_id': 'i',
+    'sender_id': 's',
+    'recipient_id': 'r',
+    'conversation_id': 'g',
+    'user_id': 'u',
+    'content': 'c',
+    'timestamp': 't',
+    'is_read': 'rd',
+    'messages': 'm',
+    'error': 'e'
+}
+# sent as the 16 bytes of the UUID instead of its 36 character string
+UUID_KEYS = {'message_id', 'sender_id', 'recipient_id', 'conversation_id', 'user_id'}
+
+# message timestamps are naive UTC
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+def _uuid_bytes(value):
+    # cheaper than uuid.UUID(value).bytes, this runs for every id of every message
+    if isinstance(value, str) and len(value) == 36:
+        try:
+            return bytes.fromhex(value.replace('-', ''))
+        except ValueError:
+            pass
+    # not every id is a UUID (e.g. in tests), those stay strings
+    return value
+
+def _epoch_ms(value):
+    return (datetime.fromisoformat(value) - EPOCH) // MILLISECOND
+
+def compact(payload):
+    """the compact form of a message event payload: short keys, binary UUIDs, epoch millisecond timestamps"""
+    result = {}
+    for key, value in payload.items():
+        if key in UUID_KEYS:
+            value = _uuid_bytes(value)
+        elif key == 'timestamp':
+            value = _epoch_ms(value)
+        elif key == 'messages':
+            value = [compact(message_data) for message_data in value]
+        result[KEYS.get(key, key)] = value
+    return result
+
+def encode(payload):
+    """MessagePack bytes of the compact form, sent as a binary Socket.IO attachment"""
+    return msgpack.packb(compact(payload))
+
+def negotiate(requested):
+    """wire format of a connecting socket, compact only if asked for and enabled"""
+    if requested == COMPACT and current_app.config['WIRE_COMPACT_ENABLED']:
+        return COMPACT
+    return JSON
+
+def format_room(room, wire_format):
+    """room of the sockets of one wire format, message events are emitted to these"""
+    return f'{room}:{wire_format}'
+
+def join_room(room):
+    """join a room, and its variant for the socket's wire format"""
+    socketio_join_room(room)
+    socketio_join_room(format_room(room, session.get('wire_format', JSON)))
+
+def leave_room(room):
+    socketio_leave_room(room)
+    socketio_leave_room(format_room(room, session.get('wire_format', JSON)))
+
+def emit(event, payload, room=None, skip_sid=None):
+    """emit a message event, serialized once per wire format
+
+    without a room the event goes to the current socket in its own format
+    """
+    if room is None:
+        if session.get('wire_format') == COMPACT:
+            socketio_emit(event, encode(payload))
+        else:
+            socketio_emit(event, payload)
+        return
+
+    variants = [(format_room(room, JSON), payload)]
+    if current_app.config['WIRE_COMPACT_ENABLED']:
+        variants.append((format_room(room, COMPACT), encode(payload)))
+    # both formats go out in one publish, each worker sends its sockets the variant of their format
+    manager = current_app.extensions['socketio'].server.manager
+    manager.emit_variants(event, variants, namespace=request.namespace, skip_sid=skip_sid)
@@ -0,0 +1,175 @@
+"""Runs the socket service as several worker processes behind a sticky proxy
+
+gunicorn workers share one listening socket, so the requests of one Socket.IO
+session (HTTP long-polling before the websocket upgrade) can land on different
+workers, which only know their own sessions. Here every worker is a separate
+single-worker gunicorn on its own local port, and a small proxy on the public
+port keeps each session on its worker: it routes by the Engine.IO sid of the
+request, learnt from the handshake responses, and sends new sessions to the
+worker with the fewest open connections.
+
+All shared state (presence, membership, offline inboxes, the message stream and
+the Socket.IO message queue) is in Redis, so workers can also run on several
+nodes: start them with --backends to proxy to workers on other hosts.
+
+The proxy routes whole TCP connections. Clients that reuse one keep-alive
+connection for several sessions should go through a load balancer with
+sticky sessions instead (e.g. nginx ip_hash or a cookie), like in production.
+"""
+import os
+import sys
+import signal
+import asyncio
+import logging
+import argparse
+import subprocess
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# sessions remembered per proxy, the oldest are forgotten first
+MAX_SESSIONS = 200000
+# the handshake response carries the sid near its start
+SID_MARKER = b'"sid":"'
+SID_SCAN_BYTES = 8192
+BUFFER_SIZE = 65536
+
+class StickyProxy:
+    """TCP proxy keeping each Engine.IO session on the backend that created it"""
+
+    def __init__(self, backends):
+        self.backends = backends
+        # sid -> backend, least recently used first
+        self.sessions = OrderedDict()
+        # backend -> open client connections
+        self.connections = {backend: 0 for backend in backends}
+
+    def _remember(self, sid, backend):
+        self.sessions[sid] = backend
+        self.sessions.move_to_end(sid)
+        while len(self.sessions) > MAX_SESSIONS:
+            self.sessions.popitem(last=False)
+
+    def route(self, head):
+        """(backend, sid) of a request, by its sid or to the least loaded backend for new sessions"""
+        try:
+            target = head.split(b'\r\n', 1)[0].split(b' ')[1].decode('latin-1')
+            sid = parse_qs(urlsplit(target).query).get('sid', [None])[0]
+        except IndexError:
+            sid = None
+        if sid and sid in self.sessions:
+            self.sessions.move_to_end(sid)
+            return self.sessions[sid], sid
+        return min(self.backends, key=lambda backend: self.connections[backend]), sid
+
+    async def _pipe(self, reader, writer, backend=None):
+        """copy one direction until EOF, learning the sid from a handshake response if backend is set"""
+        scanned = b''
+        try:
+            while True:
+                data = await reader.read(BUFFER_SIZE)
+                if not data:
+                    break
+                if backend is not None:
+                    scanned += data
+                    start = scanned.find(SID_MARKER)
+                    end = scanned.find(b'"', start + len(SID_MARKER)) if start >= 0 else -1
+                    if end >= 0:
+                        self._remember(scanned[start + len(SID_MARKER):end].decode('latin-1'), backend)
+                    if end >= 0 or len(scanned) > SID_SCAN_BYTES:
+                        backend = None
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, client_reader, client_writer):
+        try:
+            head = await client_reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_writer.close()
+            return
+
+        backend, sid = self.route(head)
+        try:
+            host, port = backend.rsplit(':', 1)
+            backend_reader, backend_writer = await asyncio.open_connection(host, int(port))
+        except OSError as e:
+            logger.error(f"Error: backend {backend} unavailable - {str(e)}")
+            client_writer.close()
+            return
+
+        self.connections[backend] += 1
+        try:
+            backend_writer.write(head)
+            # only responses to requests without a known sid can start a new session
+            learn = backend if sid not in self.sessions else None
+            await asyncio.gather(
+                self._pipe(client_reader, backend_writer),
+                self._pipe(backend_reader, client_writer, learn)
+            )
+        finally:
+            self.connections[backend] -= 1
+
+def spawn_workers(count, first_port):
+    """start count single-worker gunicorn processes on local ports, return (processes, backends)"""
+    processes, backends = [], []
+    for i in range(count):
+        port = first_port + i
+        processes.append(subprocess.Popen([
+            sys.executable, '-m', 'gunicorn', '--worker-class', 'eventlet', '-w', '1',
+            '--bind', f'127.0.0.1:{port}', 'run:app'
+        ], cwd=os.path.dirname(os.path.abspath(__file__))))
+        backends.append(f'127.0.0.1:{port}')
+    return processes, backends
+
+async def serve(proxy, port, processes):
+    server = await asyncio.start_server(proxy.handle, '0.0.0.0', port)
+    logger.info(f"Sticky proxy on port {port} for {', '.join(proxy.backends)}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    async with server:
+        while not stop.is_set():
+            # a dead worker takes its sessions with it, exit so the container restarts as a whole
+            if any(process.poll() is not None for process in processes):
+                logger.error("Error: a socket worker exited, stopping")
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SOCKET_PORT', 5000)), help='public port')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SOCKET_WORKERS', 2)),
+                        help='local worker processes to start')
+    parser.add_argument('--worker-port', type=int, default=5100, help='port of the first local worker')
+    parser.add_argument('--backends', nargs='+', help='host:port of running workers, instead of starting local ones')
+    args = parser.parse_args()
+
+    processes = []
+    if args.backends:
+        backends = args.backends
+    else:
+        processes, backends = spawn_workers(args.workers, args.worker_port)
+
+    try:
+        asyncio.run(serve(StickyProxy(backends), args.port, processes))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,15 @@
 #!/bin/sh
 
-echo "Starting SocketIO application on port 5000..."
+SOCKET_WORKERS=${SOCKET_WORKERS:-1}
+SOCKET_PORT=${SOCKET_PORT:-5000}
 
-exec gunicorn --worker-class eventlet -w 1 --bind 0.0.0.0:5000 'run:app'
\ No newline at end of file
+# gunicorn workers share one listening socket and would split the requests of a Socket.IO session,
+# so several workers run as separate processes behind a sticky proxy (see cluster.py)
+if [ "$SOCKET_WORKERS" -gt 1 ]; then
+    echo "Starting $SOCKET_WORKERS SocketIO workers behind a sticky proxy on port $SOCKET_PORT..."
+    exec python cluster.py --workers "$SOCKET_WORKERS" --port "$SOCKET_PORT"
+fi
+
+echo "Starting SocketIO application on port $SOCKET_PORT..."
+
+exec gunicorn --worker-class eventlet -w 1 --bind 0.0.0.0:$SOCKET_PORT 'run:app'
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Helpers for running the backend-api app in-process against SQLite"""
+import os
+import sys
+import random
+import importlib.util
+import tempfile
+import datetime
+
+from sqlalchemy import event
+
+# make the backend-api package importable
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask', 'backend-api')
+sys.path.insert(0, os.path.abspath(API_DIR))
+
+from app import create_app, db  # noqa: E402
+from app.config import Config  # noqa: E402
+
+CITIES = ['Isla Vista', 'Goleta', 'Santa Barbara', 'Carpinteria', 'Montecito']
+PROPERTY_TYPES = ['apartment', 'house', 'studio', 'condo']
+
+class TestConfig(Config):
+    """In-memory SQLite configuration"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), 'homelette-test-uploads')
+    TESTING = True
+    # the scripts measure the database path, listing_cache_test.py turns the cache on
+    RESPONSE_CACHE_ENABLED = False
+
+def create_test_app(config_class=TestConfig):
+    """Create the API app and its tables"""
+    app = create_app(config_class)
+    with app.app_context():
+        # register all models before creating tables
+        from app.models import user, property, listing, message  # noqa: F401
+        db.create_all()
+    return app
+
+def seed_listings(count, seed=42, chunk_size=10000, points=None, descriptions=None):
+    """Insert `count` listings (with property, address and a shared author), return the author id
+
+    points, if given, holds a (latitude, longitude) for each address and
+    descriptions a description for each listing. The bulk inserts bypass the
+    search index, call rebuild_search_index() to search the listings
+    """
+    from flask import current_app
+    from app.models.user import User
+    from app.models.property import Address, Property
+    from app.models.listing import Listing
+    from app.utils.geohash import encode
+
+    rng = random.Random(seed)
+    author = User(email=f'seed_{seed}@example.com', password='password123',
+                  first_name='Seed', last_name='User')
+    db.session.add(author)
+    db.session.flush()
+
+    created_at = datetime.datetime(2025, 1, 1)
+    for chunk_start in range(1, count + 1, chunk_size):
+        addresses, properties, listings = [], [], []
+        for i in range(chunk_start, min(chunk_start + chunk_size, count + 1)):
+            addresses.append({
+                'address_id': i,
+                'street_address': f'{rng.randint(1, 9999)} Seed St',
+                'city': rng.choice(CITIES),
+                'state': 'CA',
+                'zip_code': '93117'
+            })
+            if points:
+                latitude, longitude = points[i - 1]
+                addresses[-1].update(latitude=latitude, longitude=longitude,
+                                     geohash=encode(latitude, longitude, current_app.config['GEOHASH_PRECISION']))
+            properties.append({
+                'property_id': i,
+                'address_id': i,
+                'area': rng.randint(300, 2000),
+                'bathrooms': rng.randint(1, 3),
+                'bedrooms': rng.randint(1, 5),
+                'owner_id': author.user_id,
+                'property_type': rng.choice(PROPERTY_TYPES)
+            })
+            start_date = datetime.date(2025, 1, 1) + datetime.timedelta(days=rng.randint(0, 300))
+            listings.append({
+                'listing_id': i,
+                'property_id': i,
+                'author_id': author.user_id,
+                'price': rng.randint(500, 3500),
+                'start_date': start_date,
+                'end_date': start_date + datetime.timedelta(days=rng.randint(30, 365)),
+                'created_at': created_at + datetime.timedelta(minutes=i)
+            })
+            if descriptions:
+                listings[-1]['description'] = descriptions[i - 1]
+
+        # bulk inserts, so seeding stays fast for large counts
+        db.session.execute(Address.__table__.insert(), addresses)
+        db.session.execute(Property.__table__.insert(), properties)
+        db.session.execute(Listing.__table__.insert(), listings)
+        db.session.commit()
+
+    return author.user_id
+
+def run_migration(revision, direction='upgrade'):
+    """Run a single backend-api migration script against the app database"""
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    versions_dir = os.path.join(API_DIR, 'migrations', 'versions')
+    filename = next(f for f in os.listdir(versions_dir) if f.startswith(revision) and f.endswith('.py'))
+    spec = importlib.util.spec_from_file_location(f'migration_{revision}', os.path.join(versions_dir, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    with db.engine.begin() as connection:
+        context = MigrationContext.configure(connection)
+        with Operations.context(context):
+            getattr(module, direction)()
+
+class QueryCounter:
+    """Context manager counting the SQL statements executed on an engine"""
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.parameters = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+
+    @property
+    def count(self):
+        return len(self.statements)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Conditional GET test for the listing, user and chat endpoints
+
+Runs the API in-process against an in-memory SQLite database and a Redis
+database (db 15 of the local Redis unless --redis-url is given, it is flushed
+first), and checks that GET responses carry a weak ETag and Cache-Control,
+that repeating a request with If-None-Match is answered with 304 without
+loading or serializing the body, and that every change to the underlying
+data changes the ETag.
+"""
+import sys
+import logging
+import json
+import uuid
+import argparse
+import datetime
+
+from flask_jwt_extended import create_access_token
+
+from api_harness import TestConfig, create_test_app, seed_listings, QueryCounter, db
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# queries allowed for a 304: the version lookup, not the body
+MAX_NOT_MODIFIED_QUERIES = 2
+
+class Checker:
+    """Issues conditional requests and records failed expectations"""
+    def __init__(self, client):
+        self.client = client
+        self.failures = 0
+
+    def expect(self, condition, message):
+        if not condition:
+            logger.error(message)
+            self.failures += 1
+
+    def fetch(self, url, token, cache_control='private, no-cache'):
+        """GET url, check its validators and that a revalidation is a cheap 304, return the etag"""
+        headers = {'Authorization': f'Bearer {token}'}
+        response = self.client.get(url, headers=headers)
+        etag = response.headers.get('ETag')
+        self.expect(response.status_code == 200, f"{url} returned {response.status_code}")
+        self.expect(etag and etag.startswith('W/'), f"{url} has no weak ETag: {etag}")
+        self.expect(response.headers.get('Cache-Control') == cache_control,
+                    f"{url} has Cache-Control {response.headers.get('Cache-Control')}, expected {cache_control}")
+
+        with QueryCounter(db.engine) as counter:
+            revalidated = self.client.get(url, headers=dict(headers, **{'If-None-Match': etag}))
+        logger.info(f"{url}: {etag}, revalidated with {revalidated.status_code} after {counter.count} queries")
+        self.expect(revalidated.status_code == 304, f"{url} revalidated with {revalidated.status_code}")
+        self.expect(not revalidated.get_data(), f"{url} 304 has a body")
+        self.expect(counter.count <= MAX_NOT_MODIFIED_QUERIES,
+                    f"{url} 304 executed {counter.count} queries, expected at most {MAX_NOT_MODIFIED_QUERIES}")
+        return etag
+
+    def changed(self, url, token, etag, change, cache_control='private, no-cache'):
+        """check the etag of url changes after change"""
+        self.expect(self.fetch(url, token, cache_control) == etag, f"{url} changed on its own")
+        change()
+        self.expect(self.fetch(url, token, cache_control) != etag, f"{url} kept its ETag after the change")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--listings', type=int, default=500, help='number of listings to seed')
+    parser.add_argument('--redis-url', default='redis://localhost:6379/15', help='redis database to use, flushed first')
+    args = parser.parse_args()
+
+    class CacheConfig(TestConfig):
+        RESPONSE_CACHE_ENABLED = True
+        REDIS_URL = args.redis_url
+
+    from app.models.user import User
+    from app.models.message import Message, Conversation, ConversationParticipant
+    from app.utils.redis_client import get_redis
+
+    app = create_test_app(CacheConfig)
+    public = f"public, max-age={app.config['LISTINGS_MAX_AGE']}"
+    with app.app_context():
+        get_redis().flushdb()
+        logger.info(f"Seeding {args.listings} listings...")
+        author_id = seed_listings(args.listings)
+        author = create_access_token(identity=author_id)
+        check = Checker(app.test_client())
+
+        # listings: public, versioned by the cache tags
+        page = '/api/listings?sort=price_asc&limit=20'
+        etag = check.fetch(page, author, public)
+        check.changed(page, author, etag, lambda: check.client.put(
+            '/api/listings/1', headers={'Authorization': f'Bearer {author}'}, json={'listing': {'price': 1}}), public)
+        facets = '/api/listings/facets?bedrooms=2'
+        etag = check.fetch(facets, author, public)
+        check.changed(facets, author, etag, lambda: check.client.put(
+            '/api/listings/3', headers={'Authorization': f'Bearer {author}'}, json={'listing': {'price': 4000}}), public)
+        etag = check.fetch('/api/listings/2', author, public)
+        check.changed('/api/listings/2', author, etag, lambda: check.client.put(
+            '/api/listings/2', headers={'Authorization': f'Bearer {author}'}, json={'property': {'bedrooms': 9}}), public)
+        missing = check.client.get('/api/listings/999999999')
+        check.expect('ETag' not in missing.headers and 'Cache-Control' not in missing.headers,
+                     "a 404 carries validators")
+
+        # user profile and interests: versioned by the user tag
+        user_url = f'/api/users/{author_id}'
+        etag = check.fetch(user_url, author)
+        check.changed(user_url, author, etag, lambda: check.client.put(
+            user_url, headers={'Authorization': f'Bearer {author}'}, json={'major': 'Physics'}))
+        interests_url = f'/api/users/{author_id}/interests'
+        etag = check.fetch(interests_url, author)
+        check.changed(interests_url, author, etag, lambda: check.client.post(
+            f'{interests_url}/3', headers={'Authorization': f'Bearer {author}'}))
+
+        # chat: versioned by aggregates over the conversation rows and messages
+        peer = User(email='peer@example.com', password='password123', first_name='Peer', last_name='User')
+        db.session.add(peer)
+        db.session.commit()
+        peer_token = create_access_token(identity=peer.user_id)
+        response = check.client.post('/api/chat/conversations', headers={'Authorization': f'Bearer {author}'},
+                                     json={'participants': [peer.user_id], 'title': 'Sublet'})
+        conversation_id = response.get_json()['data']['conversation_id']
+
+        def send(**target):
+            # messages are written by the socket service, which also moves the conversation's updated_at
+            timestamp = datetime.datetime.utcnow()
+            db.session.add(Message(sender_id=author_id, content='hello', timestamp=timestamp, **target))
+            if 'conversation_id' in target:
+                Conversation.query.get(target['conversation_id']).updated_at = timestamp
+            db.session.commit()
+
+        for url in ['/api/chat/conversations', '/api/chat/inbox', f'/api/chat/conversations/{conversation_id}',
+                    f'/api/chat/conversations/{conversation_id}/messages']:
+            etag = check.fetch(url, peer_token)
+            check.changed(url, peer_token, etag, lambda: send(conversation_id=conversation_id))
+
+        inbox = check.fetch('/api/chat/inbox', peer_token)
+        check.changed('/api/chat/inbox', peer_token, inbox, lambda: check.client.put(
+            '/api/chat/messages/read', headers={'Authorization': f'Bearer {peer_token}'},
+            json={'conversation_id': conversation_id}))
+        # is_read follows the reader's cursor, so reading also changes the history page
+        messages_url = f'/api/chat/conversations/{conversation_id}/messages'
+        send(conversation_id=conversation_id)
+
+        def read_flags():
+            response = check.client.get(messages_url, headers={'Authorization': f'Bearer {peer_token}'})
+            return [message['is_read'] for message in response.get_json()['data']]
+
+        check.expect(read_flags()[-1] is False, "a new message is shown as read")
+        etag = check.fetch(messages_url, peer_token)
+        check.changed(messages_url, peer_token, etag, lambda: check.client.put(
+            '/api/chat/messages/read', headers={'Authorization': f'Bearer {peer_token}'},
+            json={'conversation_id': conversation_id}))
+        check.expect(all(read_flags()), "read messages are shown as unread")
+        check.expect(check.fetch(messages_url, author) != check.fetch(messages_url, peer_token),
+                     "participants share the ETag of a page showing their own read state")
+        
+        conversations = check.fetch('/api/chat/conversations', peer_token)
+        check.changed('/api/chat/conversations', peer_token, conversations, lambda: check.client.put(
+            user_url, headers={'Authorization': f'Bearer {author}'}, json={'first_name': 'Renamed'}))
+
+        direct_url = f'/api/chat/messages/direct?user_id={author_id}'
+        etag = check.fetch(direct_url, peer_token)
+        check.changed(direct_url, peer_token, etag, lambda: send(recipient_id=peer.user_id))
+        etag = check.fetch(direct_url, peer_token)
+        check.changed(direct_url, peer_token, etag, lambda: check.client.put(
+            '/api/chat/messages/read', headers={'Authorization': f'Bearer {peer_token}'},
+            json={'user_id': author_id}))
+
+        def pending(**target):
+            # acked by the socket service, which keeps the message under its dedupe key until it is written
+            message_id = str(uuid.uuid4())
+            get_redis().set(f'message:dedupe:{message_id}', json.dumps(dict(
+                message_id=message_id, sender_id=author_id, content='hello',
+                timestamp=datetime.datetime.utcnow().isoformat(), is_read=False, **target)))
+            return message_id
+
+        for url, body in [(f'/api/chat/messages/{pending(recipient_id=peer.user_id)}/read', None),
+                          ('/api/chat/messages/read', {'user_id': author_id,
+                                                       'up_to_message_id': pending(recipient_id=peer.user_id)}),
+                          ('/api/chat/messages/read', {'conversation_id': conversation_id,
+                                                       'up_to_message_id': pending(conversation_id=conversation_id)})]:
+            response = check.client.put(url, headers={'Authorization': f'Bearer {peer_token}'}, json=body)
+            check.expect(response.status_code == 200,
+                         f"{url} returned {response.status_code} for a message not written yet")
+        response = check.client.put('/api/chat/messages/read', headers={'Authorization': f'Bearer {peer_token}'},
+                                    json={'user_id': author_id,
+                                          'up_to_message_id': pending(conversation_id=conversation_id)})
+        check.expect(response.status_code == 404, "a pending message of another thread was accepted")
+
+        # a participant row removed while the membership cache still lists the user
+        ConversationParticipant.query.filter_by(conversation_id=conversation_id, user_id=peer.user_id).delete()
+        db.session.commit()
+        response = check.client.put('/api/chat/messages/read', headers={'Authorization': f'Bearer {peer_token}'},
+                                    json={'conversation_id': conversation_id})
+        check.expect(response.status_code == 403,
+                     f"reading a conversation without a participant row returned {response.status_code}")
+
+    if check.failures:
+        logger.error(f"{check.failures} check(s) failed")
+        sys.exit(1)
+    logger.info("All conditional GET checks passed")
+
+if __name__ == "__main__":
+    main()
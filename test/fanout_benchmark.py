@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Room fan-out benchmark
+
+Emits conversation messages to rooms of 10 to 10k sockets through the regular
+python-socketio RedisManager and through the socket service's
+FanoutRedisManager, and counts the JSON encodes and measures the CPU time per
+message. The Redis pub/sub round trip is replaced by a loopback and the
+engine.io sockets by queues, so only the manager and packet encoding work is
+measured. With the python-socketio release pinned by the socket service
+(5.3.0) the regular manager encodes the packet once per recipient socket, the
+fanout manager once per message. Later releases encode once per emit as well
+and FanoutRedisManager refuses them, so the benchmark needs the socket
+service's requirements (pip install -r flask/backend-socket/requirements.txt).
+"""
+import os
+import json
+import time
+import uuid
+import random
+import pickle
+import logging
+import argparse
+import importlib.util
+from datetime import datetime
+
+import socketio
+from socketio import packet
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# load the module on its own, importing the socket app would start eventlet
+FANOUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask', 'backend-socket',
+                           'app', 'utils', 'fanout.py')
+spec = importlib.util.spec_from_file_location('fanout', FANOUT_PATH)
+fanout = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fanout)
+
+class CountingJSON:
+    """json module for the packets that counts encodes"""
+    dumps_calls = 0
+
+    @classmethod
+    def dumps(cls, *args, **kwargs):
+        cls.dumps_calls += 1
+        return json.dumps(*args, **kwargs)
+
+    loads = staticmethod(json.loads)
+
+class QueueSocket:
+    """stands in for an engine.io socket, keeps what the writer task would send"""
+    def __init__(self):
+        self.sent = []
+
+    def send(self, pkt):
+        self.sent.append(pkt.encode())
+
+def make_server(manager_class, room_size):
+    """server with room_size sockets in one room, publishing through a loopback instead of redis"""
+    manager = manager_class('redis://localhost:6379/0', channel='flask-socketio')
+    manager._publish = lambda data: manager._handle_emit(pickle.loads(pickle.dumps(data)))
+    server = socketio.Server(client_manager=manager, async_mode='threading', json=CountingJSON)
+
+    sockets = {}
+    server.eio._get_socket = lambda eio_sid: sockets[eio_sid]
+    # the regular manager sends through eio.send, which looks up the same sockets
+    server.eio.send = lambda eio_sid, data: sockets[eio_sid].send(
+        fanout.eio_packet.Packet(fanout.eio_packet.MESSAGE, data=data))
+
+    for i in range(room_size):
+        eio_sid = f'eio{i}'
+        sockets[eio_sid] = QueueSocket()
+        sid = manager.connect(eio_sid, '/')
+        manager.enter_room(sid, '/', 'conversation')
+    return server, sockets
+
+def message(i):
+    """the same payloads for both managers, so their packets can be compared"""
+    rng = random.Random(i)
+    return {
+        'message_id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        'sender_id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        'conversation_id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+        'content': f"benchmark message {i} " + 'x' * 100,
+        'timestamp': datetime(2025, 1, 1, 12, 0, i % 60).isoformat(),
+        'is_read': False
+    }
+
+def run(manager_class, room_size, messages):
+    server, sockets = make_server(manager_class, room_size)
+    payloads = [message(i) for i in range(messages)]
+    CountingJSON.dumps_calls = 0
+
+    start = time.process_time()
+    for payload in payloads:
+        server.emit('conversation_message', payload, room='conversation')
+    elapsed = time.process_time() - start
+
+    writes = sum(len(s.sent) for s in sockets.values())
+    return {
+        'encodes': CountingJSON.dumps_calls / messages,
+        'writes': writes / messages,
+        'ms': elapsed * 1000 / messages,
+        'first': next(iter(sockets.values())).sent[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rooms', type=int, nargs='+', default=[10, 100, 1000, 10000], help='room sizes')
+    parser.add_argument('--messages', type=int, default=20, help='messages per room size')
+    args = parser.parse_args()
+
+    if not fanout.fanout_supported():
+        logger.error(f"python-socketio {fanout.version('python-socketio')} is installed, "
+                     f"the benchmark needs {fanout.SUPPORTED_VERSION}")
+        return
+
+    # the packets would otherwise use the json module of the last server created
+    packet.Packet.json = CountingJSON
+
+    logger.info(f"{'room':>6} {'manager':>8} {'encodes/msg':>12} {'writes/msg':>11} {'cpu ms/msg':>11} {'speedup':>8}")
+    for room_size in args.rooms:
+        regular = run(socketio.RedisManager, room_size, args.messages)
+        shared = run(fanout.FanoutRedisManager, room_size, args.messages)
+        # both managers must put the same bytes on the wire
+        if regular['first'] != shared['first']:
+            logger.error("The managers encoded different packets")
+            return
+        for name, r in (('regular', regular), ('fanout', shared)):
+            speedup = regular['ms'] / r['ms'] if r['ms'] else 0
+            logger.info(f"{room_size:>6} {name:>8} {r['encodes']:>12.0f} {r['writes']:>11.0f} {r['ms']:>11.2f} "
+                        f"{speedup:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
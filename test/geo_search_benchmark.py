@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Listing location search benchmark
+
+Builds a SQLite database with the current schema and seeds it with generated
+listings (1M by default) at synthetic locations: a quarter around the UCSB
+campus, the rest spread over California. For radius and bounding box searches
+it compares an exact check over every address with the geohash search of the
+API, which prunes by cell on ix_addresses_geohash first, and checks both find
+the same addresses. Then it times GET /api/listings with the same searches,
+dense ones around campus and sparse ones far from it, and prints the plan the
+planner chose for each. SQLite only keeps an average row count per index
+prefix, so its plans can differ from MariaDB's, which estimates each range.
+"""
+import os
+import time
+import random
+import logging
+import argparse
+import tempfile
+import statistics
+
+from sqlalchemy import text
+
+from api_harness import TestConfig, create_test_app, db, seed_listings, QueryCounter
+from app.models.property import Address
+from app.services.listing_service import in_cells, box_check, radius_check, within_box, within_radius
+from app.utils.geohash import radius_box
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CAMPUS = (34.4140, -119.8489)
+CALIFORNIA = ((32.5, -124.4), (42.0, -114.1))
+
+SCENARIOS = [
+    ('radius 1 km', {'near': (*CAMPUS, 1.0)}),
+    ('radius 5 km', {'near': (*CAMPUS, 5.0)}),
+    ('radius 25 km', {'near': (*CAMPUS, 25.0)}),
+    ('bbox Isla Vista', {'bbox': (34.405, -119.875, 34.418, -119.850)}),
+    ('bbox Santa Barbara', {'bbox': (34.38, -119.90, 34.47, -119.60)}),
+    # a handful of listings, far from campus
+    ('sparse radius 1 km', {'near': (33.0, -123.5, 1.0)}),
+    ('sparse bbox', {'bbox': (33.0, -123.5, 33.02, -123.48)}),
+]
+
+def generate_points(count, seed):
+    rng = random.Random(seed)
+    points = []
+    for _ in range(count):
+        if rng.random() < 0.25:
+            points.append((rng.gauss(CAMPUS[0], 0.05), rng.gauss(CAMPUS[1], 0.05)))
+        else:
+            points.append((rng.uniform(CALIFORNIA[0][0], CALIFORNIA[1][0]),
+                           rng.uniform(CALIFORNIA[0][1], CALIFORNIA[1][1])))
+    return points
+
+def exact_filter(search):
+    """the exact check of the API search, without the cell pruning"""
+    if 'near' in search:
+        return radius_check(*search['near'])
+    return box_check(*search['bbox'])
+
+def cell_filter(search):
+    """the API search"""
+    if 'near' in search:
+        return within_radius(*search['near'])
+    return within_box(*search['bbox'])
+
+def covering_filter(search):
+    """addresses in the covering cells, the rows the exact check runs on"""
+    box = radius_box(*search['near']) if 'near' in search else search['bbox']
+    return in_cells(*box)
+
+def time_query(query, repeat):
+    """(median ms, address ids) of a query"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ids = {address_id for (address_id,) in query.all()}
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), ids
+
+def search_url(search):
+    if 'near' in search:
+        latitude, longitude, radius_km = search['near']
+        return f'/api/listings?lat={latitude}&lng={longitude}&radius_km={radius_km}'
+    return '/api/listings?bbox=' + ','.join(str(value) for value in search['bbox'])
+
+def time_request(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return statistics.median(timings), len(response.get_json()['data'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--listings', type=int, default=1000000, help='number of listings to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario')
+    parser.add_argument('--seed', type=int, default=7, help='random seed of the locations')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='homelette-geo-'), 'listings.db')
+
+    class BenchmarkConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+
+    app = create_test_app(BenchmarkConfig)
+    with app.app_context():
+        logger.info(f"Generating {args.listings} listings in {db_path}...")
+        start = time.perf_counter()
+        seed_listings(args.listings, points=generate_points(args.listings, args.seed))
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+        logger.info(f"Generated in {time.perf_counter() - start:.1f} s")
+
+        logger.info(f"{'scenario':<20} {'matches':>8} {'scan ms':>9} {'cells ms':>9} {'speedup':>8} {'candidates':>11}")
+        for name, search in SCENARIOS:
+            ids_query = db.session.query(Address.address_id)
+            scan_ms, expected = time_query(ids_query.filter(exact_filter(search)), args.repeat)
+            cells_ms, found = time_query(ids_query.filter(cell_filter(search)), args.repeat)
+            if found != expected:
+                logger.error(f"{name}: the cell search found {len(found)} addresses, the scan {len(expected)}")
+                return
+            candidates = ids_query.filter(covering_filter(search)).count()
+            logger.info(f"{name:<20} {len(expected):>8} {scan_ms:>9.2f} {cells_ms:>9.2f} "
+                        f"{scan_ms / cells_ms:>7.1f}x {candidates:>11}")
+
+        logger.info("=== GET /api/listings, newest first (median ms) ===")
+        client = app.test_client()
+        for name, search in SCENARIOS:
+            url = search_url(search)
+            latency, rows = time_request(client, url, args.repeat)
+            with QueryCounter(db.engine) as counter:
+                client.get(url)
+            with db.engine.connect() as connection:
+                plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {counter.statements[-1]}',
+                                                  counter.parameters[-1]).fetchall()
+            logger.info(f"{name}: {latency:.2f} ms, {rows} listings, {counter.count} queries")
+            for row in plan:
+                logger.info(f"    {row[-1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Listing response cache test
+
+Runs the API in-process against an in-memory SQLite database and a Redis
+database (db 15 of the local Redis unless --redis-url is given, it is flushed
+first), and checks that repeated listing searches and detail requests are
+served from the cache without queries, from the local tier and from Redis, and
+that creating, updating and deleting listings invalidates the cached responses.
+"""
+import sys
+import logging
+import argparse
+
+from flask_jwt_extended import create_access_token
+
+from api_harness import TestConfig, create_test_app, seed_listings, QueryCounter, db
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class Checker:
+    """Issues requests and records failed expectations"""
+    def __init__(self, client, headers):
+        self.client = client
+        self.headers = headers
+        self.failures = 0
+
+    def expect(self, condition, message):
+        if not condition:
+            logger.error(message)
+            self.failures += 1
+
+    def get(self, url, expected_cache, max_queries):
+        with QueryCounter(db.engine) as counter:
+            response = self.client.get(url)
+        cache_status = response.headers.get('X-Cache')
+        logger.info(f"{url}: {response.status_code} {cache_status}, {counter.count} queries")
+        self.expect(cache_status == expected_cache, f"{url} was a cache {cache_status}, expected {expected_cache}")
+        self.expect(counter.count <= max_queries,
+                    f"{url} executed {counter.count} queries, expected at most {max_queries}")
+        return response
+
+def price_of(response, listing_id):
+    body = response.get_json()
+    rows = body['data'] if 'data' in body else [body]
+    return next(float(row['price']) for row in rows if row['listing_id'] == listing_id)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--listings', type=int, default=1000, help='number of listings to seed')
+    parser.add_argument('--redis-url', default='redis://localhost:6379/15', help='redis database to use, flushed first')
+    args = parser.parse_args()
+
+    class CacheConfig(TestConfig):
+        RESPONSE_CACHE_ENABLED = True
+        REDIS_URL = args.redis_url
+
+    from app.services import cache
+    from app.utils.redis_client import get_redis
+
+    app = create_test_app(CacheConfig)
+    with app.app_context():
+        get_redis().flushdb()
+        logger.info(f"Seeding {args.listings} listings...")
+        author_id = seed_listings(args.listings)
+        check = Checker(app.test_client(), {'Authorization': f'Bearer {create_access_token(identity=author_id)}'})
+
+        # reads: database, then local tier, then redis once the local tier is gone
+        page = '/api/listings?sort=price_desc&limit=50'
+        check.get(page, 'MISS', 1)
+        check.get(page, 'HIT', 0)
+        # the same normalized filters share one entry
+        check.get('/api/listings?price_min=800&city=Goleta', 'MISS', 1)
+        check.get('/api/listings?city=Goleta&price_min=800.0', 'HIT', 0)
+        check.get('/api/listings/1', 'MISS', 1)
+        check.get('/api/listings/1', 'HIT', 0)
+        cache._local.clear()
+        check.get(page, 'HIT', 0)
+        check.get('/api/listings/1', 'HIT', 0)
+
+        # errors are not cached
+        check.get('/api/listings/999999999', None, 1)
+        check.get('/api/listings/999999999', None, 1)
+
+        # updates reach both the detail and every search page
+        response = check.get(page, 'HIT', 0)
+        listing_id = response.get_json()['data'][0]['listing_id']
+        check.get(f'/api/listings/{listing_id}', 'MISS', 1)
+        response = check.client.put(f'/api/listings/{listing_id}', headers=check.headers,
+                                    json={'listing': {'price': 99999}})
+        check.expect(response.status_code == 200, f"update returned {response.status_code}")
+        check.expect(price_of(check.get(page, 'MISS', 1), listing_id) == 99999, "search shows the old price")
+        check.expect(price_of(check.get(f'/api/listings/{listing_id}', 'MISS', 1), listing_id) == 99999,
+                     "detail shows the old price")
+        check.get('/api/listings/1', 'HIT', 0)
+
+        # so do creations and deletions
+        response = check.client.post('/api/listings', headers=check.headers, json={
+            'address': {'street_address': '1 Cache St', 'city': 'Goleta', 'state': 'CA', 'zip_code': '93117'},
+            'property': {'area': 500, 'bathrooms': 1, 'bedrooms': 1, 'property_type': 'studio'},
+            'listing': {'price': 100000, 'start_date': '2025-01-01', 'end_date': '2025-12-31'}
+        })
+        check.expect(response.status_code == 201, f"create returned {response.status_code}")
+        created_id = response.get_json()['listing_id']
+        response = check.get(page, 'MISS', 1)
+        check.expect(response.get_json()['data'][0]['listing_id'] == created_id, "search misses the new listing")
+
+        response = check.client.delete(f'/api/listings/{created_id}', headers=check.headers)
+        check.expect(response.status_code == 200, f"delete returned {response.status_code}")
+        response = check.get(page, 'MISS', 1)
+        check.expect(response.get_json()['data'][0]['listing_id'] == listing_id, "search shows the deleted listing")
+
+        # hit ratios are reported per worker
+        ratios = check.client.get('/metrics').get_json()['hit_ratios']
+        logger.info(f"Hit ratios: {ratios}")
+        check.expect(ratios.get('listings_cache_local') and ratios.get('listings_cache_redis'),
+                     "/metrics is missing the listing cache hit ratios")
+
+    if check.failures:
+        logger.error(f"{check.failures} check(s) failed")
+        sys.exit(1)
+    logger.info("All cache checks passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Listing search index benchmark
+
+Builds a SQLite database with the initial schema (f805228cec50, plus the
+address location columns of 7c4b9e2d1a35 and the listing description and
+search index of b3f1d8a6c927 the models need), seeds it with
+generated listings (500k by default), then prints the EXPLAIN QUERY PLAN and
+the median latency of typical GET /api/listings requests before and after the
+listing search index migrations (3e7d714f80e2, and d2a7c4e81f03 for
+listings.property_id, which serves city filters matching few addresses).
+"""
+import os
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+
+from sqlalchemy import text
+
+from api_harness import TestConfig, create_app, db, seed_listings, run_migration, QueryCounter
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INITIAL_REVISION = 'f805228cec50'
+INDEX_REVISION = '3e7d714f80e2'
+PROPERTY_INDEX_REVISION = 'd2a7c4e81f03'
+# columns the listing models need, applied with the initial schema
+LOCATION_REVISION = '7c4b9e2d1a35'
+SEARCH_REVISION = 'b3f1d8a6c927'
+
+SCENARIOS = [
+    ('newest, no filters', '/api/listings'),
+    ('city', '/api/listings?city=Goleta'),
+    ('city, no matches', '/api/listings?city=Nowhere'),
+    ('city + bedrooms', '/api/listings?city=Isla%20Vista&bedrooms=2'),
+    ('bedrooms + price_max', '/api/listings?bedrooms=2&price_max=1500'),
+    ('price range, cheapest first', '/api/listings?price_min=900&price_max=1000&sort=price_asc'),
+    ('date window', '/api/listings?start_date=2025-06-01&end_date=2025-09-01'),
+    ('all filters', '/api/listings?price_min=800&price_max=1200&bedrooms=3&city=Isla%20Vista'
+                    '&start_date=2025-03-01&end_date=2025-06-01'),
+]
+
+def explain(url, client):
+    """Return the query plan of the SQL executed for url"""
+    with QueryCounter(db.engine) as counter:
+        client.get(url)
+    statement, parameters = counter.statements[-1], counter.parameters[-1]
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    return [row[-1] for row in rows]
+
+def time_request(url, client, repeat):
+    """Return the median latency of url in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return statistics.median(timings)
+
+def run_scenarios(client, repeat):
+    results = {}
+    for name, url in SCENARIOS:
+        plan = explain(url, client)
+        latency = time_request(url, client, repeat)
+        results[name] = latency
+        logger.info(f"{name}: {latency:.2f} ms")
+        for step in plan:
+            logger.info(f"    {step}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--listings', type=int, default=500000, help='number of listings to generate')
+    parser.add_argument('--repeat', type=int, default=20, help='requests per scenario')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='homelette-bench-'), 'listings.db')
+
+    class BenchmarkConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+
+    # the schema comes from the migrations rather than create_all, which already has the new indexes
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        run_migration(INITIAL_REVISION)
+        run_migration(LOCATION_REVISION)
+        run_migration(SEARCH_REVISION)
+
+        logger.info(f"Generating {args.listings} listings in {db_path}...")
+        start = time.perf_counter()
+        seed_listings(args.listings)
+        logger.info(f"Generated in {time.perf_counter() - start:.1f} s")
+
+        client = app.test_client()
+
+        logger.info("=== Before index migration ===")
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+        before = run_scenarios(client, args.repeat)
+
+        logger.info(f"Applying migrations {INDEX_REVISION} and {PROPERTY_INDEX_REVISION}...")
+        start = time.perf_counter()
+        run_migration(INDEX_REVISION)
+        run_migration(PROPERTY_INDEX_REVISION)
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+        logger.info(f"Migrations applied in {time.perf_counter() - start:.1f} s")
+
+        logger.info("=== After index migration ===")
+        after = run_scenarios(client, args.repeat)
+
+    logger.info("=== Summary (median ms) ===")
+    logger.info(f"{'scenario':<30} {'before':>10} {'after':>10} {'speedup':>9}")
+    for name, _ in SCENARIOS:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        logger.info(f"{name:<30} {before[name]:>10.2f} {after[name]:>10.2f} {speedup:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
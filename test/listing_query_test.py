@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Query-count regression test for listing search
+
+Seeds thousands of listings into an in-memory SQLite database and checks that
+GET /api/listings and GET /api/listings/<id> run a fixed number of queries,
+no matter how many listings match, that keyset pagination visits every
+listing exactly once, and that GET /api/listings/facets counts the same
+listings as a count in Python, in a single aggregate query.
+"""
+import sys
+import logging
+import argparse
+
+from api_harness import create_test_app, seed_listings, QueryCounter, db
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# maximum number of SQL statements allowed per request
+MAX_SEARCH_QUERIES = 1
+MAX_DETAIL_QUERIES = 1
+MAX_FACET_QUERIES = 1
+
+def count_queries(client, url):
+    """Request url and return (response, number of queries executed)"""
+    with QueryCounter(db.engine) as counter:
+        response = client.get(url)
+    return response, counter.count
+
+def test_search_query_count(client):
+    """Every filter combination must be served by a single query"""
+    failures = 0
+    for url in [
+        '/api/listings',
+        '/api/listings?city=Goleta',
+        '/api/listings?bedrooms=2&price_max=2000',
+        '/api/listings?price_min=800&price_max=2500&city=Isla%20Vista&start_date=2025-06-01&end_date=2025-09-01',
+    ]:
+        response, queries = count_queries(client, url)
+        if response.status_code != 200:
+            logger.error(f"{url} returned {response.status_code}")
+            failures += 1
+            continue
+
+        rows = response.get_json()['data']
+        logger.info(f"{url}: {len(rows)} listings, {queries} queries")
+        if queries > MAX_SEARCH_QUERIES:
+            logger.error(f"{url} executed {queries} queries, expected at most {MAX_SEARCH_QUERIES}")
+            failures += 1
+        if rows and ('property' not in rows[0] or 'address' not in rows[0]):
+            logger.error(f"{url} is missing property/address details")
+            failures += 1
+    return failures
+
+def test_pagination(client, total):
+    """Walking every page must return each listing exactly once, one query per page"""
+    for sort in ['newest', 'price_asc', 'price_desc']:
+        seen = set()
+        cursor = None
+        pages = 0
+        while True:
+            url = f'/api/listings?sort={sort}&limit=100'
+            if cursor:
+                url += f'&cursor={cursor}'
+            response, queries = count_queries(client, url)
+            if response.status_code != 200 or queries > MAX_SEARCH_QUERIES:
+                logger.error(f"{url} returned {response.status_code} after {queries} queries")
+                return 1
+
+            body = response.get_json()
+            seen.update(row['listing_id'] for row in body['data'])
+            pages += 1
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+
+        logger.info(f"sort={sort}: {pages} pages, {len(seen)} listings")
+        if len(seen) != total:
+            logger.error(f"sort={sort} returned {len(seen)} distinct listings, expected {total}")
+            return 1
+    return 0
+
+def test_detail_query_count(client):
+    """Listing details must be loaded together with property and address"""
+    response, queries = count_queries(client, '/api/listings/1')
+    if response.status_code != 200:
+        logger.error(f"/api/listings/1 returned {response.status_code}")
+        return 1
+
+    logger.info(f"/api/listings/1: {queries} queries")
+    if queries > MAX_DETAIL_QUERIES:
+        logger.error(f"/api/listings/1 executed {queries} queries, expected at most {MAX_DETAIL_QUERIES}")
+        return 1
+    return 0
+
+def expected_facets(rows, price_edges, bedrooms=None, city=None, price_max=None):
+    """facet counts of (bedrooms, price, city, property_type) rows, every facet without its own filter"""
+    def matching(skip):
+        return [row for row in rows
+                if (bedrooms is None or 'bedrooms' in skip or row[0] == bedrooms)
+                and (price_max is None or 'price' in skip or row[1] <= price_max)
+                and (city is None or 'city' in skip or row[2] == city)]
+
+    def counts(values):
+        return {value: values.count(value) for value in set(values)}
+
+    def bucket(price):
+        return next((index for index, edge in enumerate(price_edges) if price < edge), len(price_edges))
+
+    return {
+        'total': len(matching([])),
+        'bedrooms': counts([row[0] for row in matching(['bedrooms'])]),
+        'price': counts([bucket(row[1]) for row in matching(['price'])]),
+        'city': counts([row[2] for row in matching(['city'])]),
+        'property_type': counts([row[3] for row in matching([])])
+    }
+
+def test_facets(client, price_edges):
+    """Facet counts must match a count over every listing, in a single aggregate query"""
+    from app.models.listing import Listing
+    from app.models.property import Property, Address
+
+    rows = Listing.query.join(Listing.property).join(Property.address).with_entities(
+        Property.bedrooms, Listing.price, Address.city, Property.property_type
+    ).all()
+    failures = 0
+    for params in [{}, {'bedrooms': 2}, {'city': 'Goleta', 'price_max': 2000}, {'bedrooms': 3, 'city': 'Isla Vista'}]:
+        url = '/api/listings/facets?' + '&'.join(f'{key}={value}' for key, value in params.items())
+        response, queries = count_queries(client, url)
+        if response.status_code != 200:
+            logger.error(f"{url} returned {response.status_code}")
+            failures += 1
+            continue
+
+        body = response.get_json()
+        found = {
+            'total': body['total'],
+            'bedrooms': {facet['value']: facet['count'] for facet in body['bedrooms']},
+            'price': {index: facet['count'] for index, facet in enumerate(body['price']) if facet['count']},
+            'city': {facet['value']: facet['count'] for facet in body['city']},
+            'property_type': {facet['value']: facet['count'] for facet in body['property_type']}
+        }
+        logger.info(f"{url}: {body['total']} listings, {queries} queries")
+        if found != expected_facets(rows, price_edges, **params):
+            logger.error(f"{url} returned wrong counts: {found}")
+            failures += 1
+        if queries > MAX_FACET_QUERIES:
+            logger.error(f"{url} executed {queries} queries, expected at most {MAX_FACET_QUERIES}")
+            failures += 1
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--listings', type=int, default=5000, help='number of listings to seed')
+    args = parser.parse_args()
+
+    app = create_test_app()
+    with app.app_context():
+        logger.info(f"Seeding {args.listings} listings...")
+        seed_listings(args.listings)
+
+        client = app.test_client()
+        failures = test_search_query_count(client)
+        failures += test_pagination(client, args.listings)
+        failures += test_detail_query_count(client)
+        failures += test_facets(client, app.config['LISTING_PRICE_BUCKETS'])
+
+    if failures:
+        logger.error(f"{failures} check(s) failed")
+        sys.exit(1)
+    logger.info("All query-count checks passed")
+
+if __name__ == "__main__":
+    main()
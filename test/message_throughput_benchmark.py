@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Chat message throughput benchmark
+
+Connects 1, 10 and 100 concurrent senders to the socket service. Each sender
+sends private messages back to back, waiting for the callback ack of one
+message before sending the next. Reports messages per second, ack latency,
+and how long it takes until the last message can be read back from the API
+(the write-behind lag).
+
+Run it against a build with and without write-behind to compare. With
+--batch-size N the senders use batch_message instead, N messages per event,
+and the latency column is the ack latency of a whole batch.
+"""
+import time
+import uuid
+import logging
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import socketio
+
+from socket_test import UserClient
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# the per-message logging of the harness would drown the report
+logging.getLogger('socket_test').setLevel(logging.WARNING)
+
+API_URL = "http://localhost:5001/api"
+
+class SenderClient(UserClient):
+    """UserClient sending messages one at a time and timing their acks"""
+    def __init__(self, name):
+        super().__init__(name)
+        self.latencies = []
+        self.last_message_id = None
+
+    def send_messages(self, recipient_id, count, timeout=10):
+        self.latencies = []
+        for i in range(count):
+            start = time.perf_counter()
+            try:
+                ack = self.sio.call('private_message', {
+                    'message_id': str(uuid.uuid4()),
+                    'recipient_id': recipient_id,
+                    'content': f"benchmark message {i}"
+                }, timeout=timeout)
+            except socketio.exceptions.TimeoutError:
+                logger.error(f"User {self.name} got no ack for message {i}")
+                return
+            if not ack.get('success'):
+                logger.error(f"User {self.name} message {i} failed: {ack.get('error')}")
+                return
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            self.last_message_id = ack['data']['message_id']
+
+    def send_batches(self, recipient_id, count, batch_size, timeout=10):
+        self.latencies = []
+        self.sent = 0
+        for first in range(0, count, batch_size):
+            messages = [{
+                'message_id': str(uuid.uuid4()),
+                'recipient_id': recipient_id,
+                'content': f"benchmark message {i}"
+            } for i in range(first, min(first + batch_size, count))]
+            start = time.perf_counter()
+            try:
+                ack = self.sio.call('batch_message', {'messages': messages}, timeout=timeout)
+            except socketio.exceptions.TimeoutError:
+                logger.error(f"User {self.name} got no ack for batch {first // batch_size}")
+                return
+            if not ack.get('success'):
+                logger.error(f"User {self.name} batch {first // batch_size} failed: {ack.get('error')}")
+                return
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            self.sent += len(ack['data'])
+            self.last_message_id = ack['data'][-1]['message_id']
+
+def wait_until_stored(sender, recipient_id, timeout=30):
+    """Seconds until the sender's last message is returned by the API"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        response = requests.get(
+            f"{API_URL}/chat/messages/direct",
+            params={'user_id': recipient_id, 'limit': 1},
+            headers={'Authorization': f'Bearer {sender.token}'}
+        )
+        data = response.json().get('data', [])
+        if data and data[-1]['message_id'] == sender.last_message_id:
+            return time.perf_counter() - start
+        time.sleep(0.05)
+    return None
+
+def run_level(senders, recipient, messages, batch_size=1):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(senders)) as pool:
+        if batch_size > 1:
+            list(pool.map(lambda s: s.send_batches(recipient.user_id, messages, batch_size), senders))
+        else:
+            list(pool.map(lambda s: s.send_messages(recipient.user_id, messages), senders))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(l for s in senders for l in s.latencies)
+    sent = sum(s.sent for s in senders) if batch_size > 1 else len(latencies)
+    lag = wait_until_stored(senders[-1], recipient.user_id)
+    return {
+        'messages': sent,
+        'throughput': sent / elapsed if elapsed else 0,
+        'p50': statistics.median(latencies) if latencies else 0,
+        'p95': latencies[int(len(latencies) * 0.95) - 1] if latencies else 0,
+        'lag': lag
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--senders', type=int, nargs='+', default=[1, 10, 100], help='concurrency levels')
+    parser.add_argument('--messages', type=int, default=200, help='messages per sender')
+    parser.add_argument('--batch-size', type=int, default=1, help='messages per batch_message event, 1 sends one by one')
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:6]
+    recipient = SenderClient(f"bench{run_id}_recipient")
+    if not recipient.register() or not recipient.login():
+        return
+
+    senders = [SenderClient(f"bench{run_id}_{i}") for i in range(max(args.senders))]
+    with ThreadPoolExecutor(max_workers=50) as pool:
+        ready = list(pool.map(lambda s: s.register() and s.login() and s.connect_socket(), senders))
+    if not all(ready):
+        logger.error("Not all senders could connect")
+        return
+
+    results = {}
+    for level in args.senders:
+        logger.info(f"Running {level} concurrent senders x {args.messages} messages...")
+        results[level] = run_level(senders[:level], recipient, args.messages, args.batch_size)
+
+    logger.info("=== Summary ===")
+    logger.info(f"{'senders':>8} {'messages':>9} {'msg/s':>9} {'ack p50 ms':>11} {'ack p95 ms':>11} {'stored after s':>15}")
+    for level, r in results.items():
+        lag = f"{r['lag']:.2f}" if r['lag'] is not None else 'timeout'
+        logger.info(f"{level:>8} {r['messages']:>9} {r['throughput']:>9.0f} {r['p50']:>11.1f} {r['p95']:>11.1f} {lag:>15}")
+
+    for sender in senders:
+        sender.disconnect_socket()
+
+if __name__ == "__main__":
+    main()
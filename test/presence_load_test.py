@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Presence load test
+
+Registers a few thousand users (5k by default) through the API, puts them in
+small group conversations, connects them all to the socket service, then
+disconnects and reconnects everyone at once like after a deploy. Reports
+connect latency and how many presence events each client received.
+
+With presence scoped to contacts and batched, every client should only hear
+about its own group, in a handful of presence_diff events per storm.
+"""
+import time
+import uuid
+import logging
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from socket_test import UserClient
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# the per-client logging of the harness would drown the report
+logging.getLogger('socket_test').setLevel(logging.WARNING)
+
+API_URL = "http://localhost:5001/api"
+
+class LoadClient(UserClient):
+    """UserClient counting the presence events it receives"""
+    def __init__(self, name):
+        super().__init__(name)
+        self.lock = threading.Lock()
+        self.presence_events = 0
+        self.presence_users = 0
+        self.online_users_events = 0
+        self.connect_latency = None
+
+        @self.sio.on('presence_diff')
+        def on_presence_diff(data):
+            with self.lock:
+                self.presence_events += 1
+                self.presence_users += len(data.get('online', [])) + len(data.get('offline', []))
+
+        @self.sio.on('online_users')
+        def on_online_users(data):
+            with self.lock:
+                self.online_users_events += 1
+
+    def reset_counters(self):
+        with self.lock:
+            self.presence_events = 0
+            self.presence_users = 0
+            self.online_users_events = 0
+
+    def timed_connect(self):
+        start = time.perf_counter()
+        try:
+            self.sio.connect(
+                f'http://localhost:5002?token={self.token}',
+                socketio_path='socket',
+                transports=['websocket'],
+                wait_timeout=30
+            )
+        except Exception as e:
+            logger.error(f"User {self.name} connection failed: {str(e)}")
+            return False
+        self.connect_latency = (time.perf_counter() - start) * 1000
+        return True
+
+def create_group(members):
+    """Create a conversation between the members, as its first member"""
+    response = requests.post(
+        f"{API_URL}/chat/conversations",
+        json={'participants': [m.user_id for m in members[1:]], 'title': 'load test'},
+        headers={'Authorization': f'Bearer {members[0].token}'}
+    )
+    return response.status_code == 201
+
+def run_parallel(func, items, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(func, items))
+
+def report(phase, clients, elapsed):
+    latencies = sorted(c.connect_latency for c in clients if c.connect_latency is not None)
+    events = [c.presence_events for c in clients]
+    users = [c.presence_users for c in clients]
+    logger.info(f"=== {phase}: {len(clients)} clients in {elapsed:.1f} s ===")
+    if latencies:
+        logger.info(f"connect latency p50 {statistics.median(latencies):.0f} ms, "
+                    f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.0f} ms, max {latencies[-1]:.0f} ms")
+    logger.info(f"presence_diff events: total {sum(events)}, per client avg {statistics.mean(events):.1f}, max {max(events)}")
+    logger.info(f"presence changes received: total {sum(users)}, per client avg {statistics.mean(users):.1f}, max {max(users)}")
+    logger.info(f"online_users events: total {sum(c.online_users_events for c in clients)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=5000, help='number of simulated clients')
+    parser.add_argument('--group-size', type=int, default=10, help='users per group conversation')
+    parser.add_argument('--concurrency', type=int, default=200, help='parallel connects / API calls')
+    parser.add_argument('--settle', type=float, default=5, help='seconds to wait for presence batches')
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:6]
+    clients = [LoadClient(f"load{run_id}_{i}") for i in range(args.clients)]
+
+    logger.info(f"Registering {args.clients} users...")
+    ok = run_parallel(lambda c: c.register() and c.login(), clients, args.concurrency)
+    clients = [c for c, success in zip(clients, ok) if success]
+    logger.info(f"{len(clients)} users ready")
+
+    groups = [clients[i:i + args.group_size] for i in range(0, len(clients), args.group_size)]
+    logger.info(f"Creating {len(groups)} group conversations...")
+    run_parallel(create_group, groups, args.concurrency)
+
+    # initial connect, one client after another would take too long
+    start = time.perf_counter()
+    run_parallel(LoadClient.timed_connect, clients, args.concurrency)
+    time.sleep(args.settle)
+    report("initial connect", clients, time.perf_counter() - start)
+
+    # reconnect storm, everyone drops and comes back at once
+    logger.info("Disconnecting all clients...")
+    run_parallel(LoadClient.disconnect_socket, clients, args.concurrency)
+    for client in clients:
+        client.reset_counters()
+        client.connect_latency = None
+
+    start = time.perf_counter()
+    run_parallel(LoadClient.timed_connect, clients, args.concurrency)
+    time.sleep(args.settle)
+    report("reconnect storm", clients, time.perf_counter() - start)
+
+    # each client can only hear about its own group
+    bound = (args.group_size - 1) * 2
+    noisy = [c for c in clients if c.presence_users > bound]
+    if noisy:
+        logger.error(f"{len(noisy)} clients received presence changes outside their group (> {bound})")
+    else:
+        logger.info(f"All clients received at most {bound} presence changes")
+
+    run_parallel(LoadClient.disconnect_socket, clients, args.concurrency)
+
+if __name__ == "__main__":
+    main()
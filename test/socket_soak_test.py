@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Socket service soak test for multi-worker scaling
+
+Starts the socket service locally with 1, 2 and 4 worker processes behind the
+sticky proxy (flask/backend-socket/cluster.py), against the Redis and MariaDB
+of docker-compose, and ramps up connected clients in steps. After every step a
+sample of clients sends a round-trip event; the ramp stops when connects fail
+or the round-trip p95 goes over --max-latency. The clients connected at the
+last healthy step are the capacity of that worker count; each eventlet worker
+accepts at most 1000 connections (gunicorn's worker_connections), see the
+socket service README for measured numbers.
+
+Needs `docker compose up -d redis mariadb flask-api` (users are registered
+through the API) and the packages of flask/backend-socket/requirements.txt.
+Raise the open file limit first, e.g. ulimit -n 65536.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import socket
+import logging
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import socketio
+
+from socket_test import UserClient
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# the per-client logging of the harness would drown the report
+logging.getLogger('socket_test').setLevel(logging.WARNING)
+
+SOCKET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask', 'backend-socket')
+
+class SoakClient(UserClient):
+    """UserClient connecting to the local cluster and timing a round-trip event"""
+    def connect_to(self, port):
+        try:
+            self.sio.connect(
+                f'http://localhost:{port}?token={self.token}',
+                socketio_path='socket',
+                transports=['websocket'],
+                wait_timeout=30
+            )
+            return True
+        except Exception as e:
+            logger.debug(f"User {self.name} connection failed: {str(e)}")
+            return False
+
+    def round_trip(self, timeout=10):
+        """ms until the worker acks an event that does no I/O, None if it does not"""
+        start = time.perf_counter()
+        try:
+            # stopping to type without having started is only checked and dropped
+            self.sio.call('typing', {'recipient_id': self.user_id, 'is_typing': False}, timeout=timeout)
+        except socketio.exceptions.SocketIOError:
+            # timed out, or the socket dropped
+            return None
+        return (time.perf_counter() - start) * 1000
+
+def port_in_use(port):
+    with socket.socket() as s:
+        return s.connect_ex(('localhost', port)) == 0
+
+def wait_for_worker(port, process, timeout=120):
+    """wait until the worker answers an Engine.IO handshake, gunicorn listens before the app is imported"""
+    start = time.time()
+    while time.time() - start < timeout and process.poll() is None:
+        try:
+            response = requests.get(f'http://localhost:{port}/socket/?EIO=4&transport=polling', timeout=5)
+            if response.status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+def start_cluster(workers, port, worker_port):
+    # a cluster left over from an earlier run would answer in place of this one
+    busy = [p for p in [port] + list(range(worker_port, worker_port + workers)) if port_in_use(p)]
+    if busy:
+        logger.error(f"Ports {busy} are already in use, stop the process listening on them")
+        return None
+
+    env = dict(os.environ, REDIS_IP=os.environ.get('REDIS_IP', 'localhost'),
+               MARIADB_IP=os.environ.get('MARIADB_IP', 'localhost'))
+    process = subprocess.Popen([sys.executable, 'cluster.py', '--workers', str(workers), '--port', str(port),
+                                '--worker-port', str(worker_port)], cwd=SOCKET_DIR, env=env)
+    # the proxy listens at once, the workers take a moment to import the app
+    for p in range(worker_port, worker_port + workers):
+        if not wait_for_worker(p, process):
+            process.terminate()
+            process.wait()
+            return None
+    return process
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def ramp(clients, port, step, max_latency, sample, concurrency):
+    """connect clients step by step, return the clients connected at the last healthy step"""
+    connected = []
+    capacity = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for first in range(0, len(clients), step):
+            batch = clients[first:first + step]
+            ok = list(pool.map(lambda c: c.connect_to(port), batch))
+            connected.extend(c for c, success in zip(batch, ok) if success)
+            failures = len(batch) - sum(ok)
+
+            probes = random.sample(connected, min(sample, len(connected)))
+            latencies = list(pool.map(SoakClient.round_trip, probes))
+            timeouts = sum(1 for l in latencies if l is None)
+            p95 = percentile([l for l in latencies if l is not None], 0.95) if len(latencies) > timeouts else None
+            logger.info(f"  {len(connected):>6} connected, {failures} failed, round trip p95 "
+                        f"{'-' if p95 is None else f'{p95:.0f} ms'}, {timeouts} timeouts")
+
+            if failures or timeouts or p95 is None or p95 > max_latency:
+                break
+            capacity = len(connected)
+
+        list(pool.map(UserClient.disconnect_socket, connected))
+    return capacity
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='worker counts to test')
+    parser.add_argument('--clients', type=int, default=8000, help='most clients to connect')
+    parser.add_argument('--step', type=int, default=250, help='clients connected per step')
+    parser.add_argument('--max-latency', type=float, default=500, help='round trip p95 limit in ms')
+    parser.add_argument('--sample', type=int, default=50, help='clients probed after each step')
+    parser.add_argument('--concurrency', type=int, default=200, help='parallel connects / API calls')
+    parser.add_argument('--port', type=int, default=5102, help='port of the sticky proxy')
+    parser.add_argument('--worker-port', type=int, default=5110, help='port of the first worker')
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:6]
+    clients = [SoakClient(f"soak{run_id}_{i}") for i in range(args.clients)]
+    logger.info(f"Registering {args.clients} users...")
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        ok = list(pool.map(lambda c: c.register() and c.login(), clients))
+    clients = [c for c, success in zip(clients, ok) if success]
+    logger.info(f"{len(clients)} users ready")
+
+    results = {}
+    for workers in args.workers:
+        logger.info(f"Starting {workers} workers...")
+        process = start_cluster(workers, args.port, args.worker_port)
+        if not process:
+            logger.error("Workers did not start, is the socket service's environment set up?")
+            return
+        try:
+            results[workers] = ramp(clients, args.port, args.step, args.max_latency, args.sample, args.concurrency)
+        finally:
+            process.terminate()
+            process.wait()
+        # let the ports be released before the next cluster binds them
+        time.sleep(2)
+
+    logger.info("=== Summary ===")
+    logger.info(f"{'workers':>8} {'capacity':>9} {'per worker':>11} {'scaling':>8}")
+    # capacity relative to the per-worker capacity of the smallest run, linear scaling matches the workers
+    smallest = min(results)
+    per_worker = results[smallest] / smallest
+    for workers, capacity in results.items():
+        scaling = f"{capacity / per_worker:.2f}" if per_worker else '-'
+        logger.info(f"{workers:>8} {capacity:>9} {capacity / workers:>11.0f} {scaling:>8}")
+    if len(clients) in results.values():
+        logger.info("Some worker counts handled every client, raise --clients to find their capacity")
+
+if __name__ == "__main__":
+    main()
@@ -39,15 +39,9 @@ class UserClient:
         def connect_error(data):
             logger.error(f"User {self.name} connection error: {data}")
         
-        @self.sio.on('user_online')
-        def on_user_online(data):
-            logger.info(f"User {self.name} received user online notification: {data}")
-            # Store the real user ID
-            if not self.real_user_id:
-                user_id = data.get('user_id')
-                if user_id:
-                    logger.info(f"User {self.name} using real ID assigned by server: {user_id}")
-                    self.real_user_id = user_id
+        @self.sio.on('presence_diff')
+        def on_presence_diff(data):
+            logger.info(f"User {self.name} received presence update: {data}")
         
         @self.sio.on('online_users')
         def on_online_users(data):
@@ -61,10 +55,6 @@ class UserClient:
         def on_conversation_message(data):
             logger.info(f"User {self.name} received conversation message: {data}")
         
-        @self.sio.on('message_delivered')
-        def on_message_delivered(data):
-            logger.info(f"User {self.name} message delivered: {data}")
-        
         @self.sio.on('user_typing')
         def on_user_typing(data):
             logger.info(f"User {self.name} received user typing notification: {data}")
@@ -130,7 +120,8 @@ class UserClient:
                 self.token = response_data.get("access_token")
                 
                 if "user" in response_data and isinstance(response_data["user"], dict):
-                    self.user_id = response_data["user"].get("user_id")
+                    self.user_id = response_data["user"].get("id")
+                    self.real_user_id = self.user_id
                 
                 logger.info(f"User {self.name} logged in successfully!")
                 if self.user_id:
@@ -180,36 +171,28 @@ class UserClient:
             return False
     
     def send_private_message(self, recipient_id, content):
-        """Send private message"""
-        # Use real user ID
-        sender_id = self.real_user_id if self.real_user_id else self.user_id
-        
+        """Send private message, the server takes the sender from the socket session"""
         try:
             logger.info(f"User {self.name} sending private message to {recipient_id}: {content}")
-            logger.info(f"Using sender ID: {sender_id}")
             
+            # the client picks the message id, so a retry after a timeout is not stored twice
             self.sio.emit('private_message', {
-                'sender_id': sender_id,
+                'message_id': str(uuid.uuid4()),
                 'recipient_id': recipient_id,
                 'content': content
-            })
+            }, callback=lambda ack: logger.info(f"User {self.name} message acknowledged: {ack}"))
             return True
         except Exception as e:
             logger.error(f"Error sending private message for user {self.name}: {str(e)}")
             return False
     
     def send_typing_status(self, recipient_id, is_typing=True):
-        """Send typing status"""
-        # Use real user ID
-        user_id = self.real_user_id if self.real_user_id else self.user_id
-        
+        """Send typing status, the server takes the user from the socket session"""
         try:
             status = "started" if is_typing else "stopped"
             logger.info(f"User {self.name} {status} typing to {recipient_id}")
-            logger.info(f"Using user ID: {user_id}")
             
             self.sio.emit('typing', {
-                'user_id': user_id,
                 'recipient_id': recipient_id,
                 'is_typing': is_typing
             })
@@ -248,6 +231,38 @@ def test_conversation_between_users(user1, user2):
     # User 2 stops typing
     user2.send_typing_status(user1.real_user_id, False)
 
+def test_unknown_recipient(user):
+    """A message to a user that does not exist must be refused, not acked"""
+    ack = user.sio.call('private_message', {
+        'message_id': str(uuid.uuid4()),
+        'recipient_id': str(uuid.uuid4()),
+        'content': "Hello nobody"
+    }, timeout=10)
+    if ack.get('success'):
+        logger.error(f"Message to an unknown recipient was acked: {ack}")
+    else:
+        logger.info(f"Message to an unknown recipient refused: {ack.get('error')}")
+
+def test_logout(user):
+    """After logout the token must be refused by the API and by socket connects"""
+    response = requests.post("http://localhost:5001/api/auth/logout",
+                             headers={"Authorization": f"Bearer {user.token}"})
+    if response.status_code != 200:
+        logger.error(f"User {user.name} logout failed: {response.status_code} - {response.text}")
+        return
+    
+    response = requests.get(f"http://localhost:5001/api/users/{user.user_id}",
+                            headers={"Authorization": f"Bearer {user.token}"})
+    if response.status_code != 401:
+        logger.error(f"Revoked token of user {user.name} was accepted by the API: {response.status_code}")
+    
+    user.disconnect_socket()
+    if user.connect_socket():
+        logger.error(f"Revoked token of user {user.name} was accepted by the socket service")
+        user.disconnect_socket()
+    else:
+        logger.info(f"User {user.name} logged out, token refused by the API and the socket service")
+
 def main():
     # Create two user clients
     user1 = UserClient("Alice")
@@ -271,11 +286,15 @@ def main():
     
     # Test conversation between users
     test_conversation_between_users(user1, user2)
+    test_unknown_recipient(user1)
     
     # Keep connection for a while
     logger.info("Keeping connection for 10 seconds...")
     time.sleep(10)
     
+    # Log out user 1, its token no longer works
+    test_logout(user1)
+    
     # Disconnect
     logger.info("Disconnecting all connections...")
     user1.disconnect_socket()
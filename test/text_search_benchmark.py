@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Listing full-text search benchmark
+
+Builds a SQLite database with the current schema, seeds it with generated
+listings (200k by default) with short descriptions and fills the listing_search
+index. For typical searches it compares the full-text index with LIKE '%...%'
+scans over the same street, city, property details and description text,
+checks every indexed match is also found by the scan, and times both for all
+matches and for the first page. Then it times GET /api/listings/search.
+"""
+import os
+import time
+import random
+import logging
+import argparse
+import tempfile
+import statistics
+
+from sqlalchemy import select, and_, or_
+
+from api_harness import TestConfig, create_test_app, db, seed_listings, QueryCounter
+from app.models.listing import Listing
+from app.models.property import Property
+from app.services.search_index import rebuild_search_index, search_terms, matching_listings, document_columns
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PHRASES = ['near campus', 'furnished', 'unfurnished', 'ocean view', 'quiet street', 'pet friendly',
+           'parking included', 'in-unit laundry', 'bike to class', 'utilities included', 'summer sublet',
+           'balcony', 'recently renovated', 'walk to the beach', 'shared kitchen', 'private bathroom',
+           'close to the bus', 'roommates wanted', 'no smoking', 'hardwood floors']
+
+SEARCHES = ['near campus 2br furnished', 'ocean view', 'pet friendly parking', 'isla vista studio',
+            'renovated goleta 5br', 'balc']
+
+PAGE_SIZE = 20
+
+def generate_descriptions(count, seed):
+    rng = random.Random(seed)
+    return ['. '.join(rng.sample(PHRASES, rng.randint(2, 5))).capitalize() for _ in range(count)]
+
+def like_filter(terms):
+    """every term somewhere in the listing text, the scan a search without an index does"""
+    return and_(*[or_(*[text.like(f'%{term}%') for text in document_columns()]) for term in terms])
+
+def documents():
+    return select(Listing.listing_id).join(Listing.property).join(Property.address)
+
+def time_ids(statement, repeat):
+    """(median ms, listing ids) of a statement"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ids = [listing_id for listing_id, in db.session.execute(statement)]
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), ids
+
+def time_request(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--listings', type=int, default=200000, help='number of listings to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per search')
+    parser.add_argument('--seed', type=int, default=7, help='random seed of the descriptions')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='homelette-search-'), 'listings.db')
+
+    class BenchmarkConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+
+    app = create_test_app(BenchmarkConfig)
+    with app.app_context():
+        logger.info(f"Generating {args.listings} listings in {db_path}...")
+        start = time.perf_counter()
+        seed_listings(args.listings, descriptions=generate_descriptions(args.listings, args.seed))
+        logger.info(f"Generated in {time.perf_counter() - start:.1f} s")
+        start = time.perf_counter()
+        rebuild_search_index()
+        logger.info(f"Indexed in {time.perf_counter() - start:.1f} s")
+
+        logger.info(f"{'search':<28} {'matches':>8} {'like':>8} {'like ms':>9} {'index ms':>9} "
+                    f"{'like page ms':>13} {'index page ms':>14}")
+        for search in SEARCHES:
+            terms = search_terms(search)
+            hits = matching_listings(terms)
+            like_ms, like_ids = time_ids(documents().where(like_filter(terms)), args.repeat)
+            index_ms, index_ids = time_ids(select(hits.c.listing_id), args.repeat)
+            # the last term is a prefix for the index, every term a substring for LIKE
+            if not set(index_ids) <= set(like_ids):
+                logger.error(f"{search}: the index found {len(set(index_ids) - set(like_ids))} listings LIKE did not")
+                return
+            # first page: newest matches for LIKE, which cannot rank, best matches for the index
+            like_page_ms, _ = time_ids(documents().where(like_filter(terms))
+                                       .order_by(Listing.created_at.desc(), Listing.listing_id.desc())
+                                       .limit(PAGE_SIZE), args.repeat)
+            index_page_ms, _ = time_ids(select(hits.c.listing_id)
+                                        .order_by(hits.c.score.desc(), hits.c.listing_id).limit(PAGE_SIZE), args.repeat)
+            logger.info(f"{search:<28} {len(index_ids):>8} {len(like_ids):>8} {like_ms:>9.2f} {index_ms:>9.2f} "
+                        f"{like_page_ms:>13.2f} {index_page_ms:>14.2f}")
+
+        logger.info("=== GET /api/listings/search, first page (median ms) ===")
+        client = app.test_client()
+        for search in SEARCHES:
+            url = f'/api/listings/search?q={search}&limit={PAGE_SIZE}'
+            latency = time_request(client, url, args.repeat)
+            with QueryCounter(db.engine) as counter:
+                client.get(url)
+            with db.engine.connect() as connection:
+                plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {counter.statements[-1]}',
+                                                  counter.parameters[-1]).fetchall()
+            logger.info(f"{search}: {latency:.2f} ms, {counter.count} queries")
+            for row in plan:
+                logger.info(f"    {row[-1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Typing throttle benchmark
+
+Replays a synthetic typing workload through the socket service's TypingThrottle
+with a simulated clock, and compares the Redis publishes (one per relayed
+user_typing emit) and client deliveries with relaying every typing event.
+
+Each typer alternates bursts of keystrokes, one typing event every 150-400 ms,
+with pauses; at the end of a burst the client sends is_typing=False most of the
+time and otherwise just goes quiet, which the throttle's timeout handles.
+"""
+import os
+import random
+import logging
+import argparse
+import importlib.util
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# load the module on its own, importing the socket app would start eventlet
+THROTTLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask', 'backend-socket',
+                             'app', 'services', 'typing_throttle.py')
+spec = importlib.util.spec_from_file_location('typing_throttle', THROTTLE_PATH)
+typing_throttle = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(typing_throttle)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def typing_events(rng, typers, duration):
+    """(time, user, is_typing) events of all typers, in time order"""
+    events = []
+    for user in range(typers):
+        t = rng.uniform(0, 5)
+        while t < duration:
+            burst_end = t + rng.uniform(2, 15)
+            while t < min(burst_end, duration):
+                events.append((t, user, True))
+                t += rng.uniform(0.15, 0.4)
+            if rng.random() < 0.7:
+                events.append((t, user, False))
+            t += rng.uniform(1, 10)
+    events.sort()
+    return events
+
+def simulate(group_size, typers, duration, seed):
+    rng = random.Random(seed)
+    clock = FakeClock()
+    throttle = typing_throttle.TypingThrottle(clock=clock)
+    events = typing_events(rng, typers, duration)
+
+    relayed = 0
+    next_expiry = 1.0
+    for t, user, is_typing in events:
+        # the expiry task runs once per second
+        while next_expiry <= t:
+            clock.now = next_expiry
+            relayed += len(throttle.expire())
+            next_expiry += 1.0
+        clock.now = t
+        if throttle.update(user, 'target', is_typing):
+            relayed += 1
+    clock.now = duration + throttle.timeout
+    relayed += len(throttle.expire())
+
+    recipients = group_size - 1
+    return {
+        'events': len(events),
+        'naive': len(events),
+        'throttled': relayed,
+        'naive_deliveries': len(events) * recipients,
+        'throttled_deliveries': relayed * recipients
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=300, help='simulated seconds')
+    parser.add_argument('--groups', type=int, nargs='+', default=[2, 10, 100, 1000], help='group sizes')
+    parser.add_argument('--typing-share', type=float, default=0.1, help='share of members typing, at least one')
+    args = parser.parse_args()
+
+    logger.info(f"{'group':>6} {'typers':>7} {'events':>8} {'publishes':>10} {'throttled':>10} {'saved':>7} "
+                f"{'deliveries':>11} {'throttled':>10}")
+    for group_size in args.groups:
+        typers = max(1, int(group_size * args.typing_share))
+        r = simulate(group_size, typers, args.duration, seed=group_size)
+        saved = 1 - r['throttled'] / r['naive'] if r['naive'] else 0
+        logger.info(f"{group_size:>6} {typers:>7} {r['events']:>8} {r['naive']:>10} {r['throttled']:>10} {saved:>6.1%} "
+                    f"{r['naive_deliveries']:>11} {r['throttled_deliveries']:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Wire format benchmark
+
+Encodes 10k chat messages as Socket.IO event packets, the way the socket
+service sends them, in the default JSON format and in the compact MessagePack
+format (short keys, binary UUIDs, epoch millisecond timestamps). Reports bytes
+on the wire and the CPU time to encode the packets on the server and to decode
+them on the client, both for single private_message events and for
+message_batch events.
+"""
+import os
+import json
+import time
+import uuid
+import random
+import string
+import logging
+import argparse
+import importlib.util
+from datetime import datetime, timedelta
+
+import msgpack
+from socketio import packet
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# load the module on its own, importing the socket app would start eventlet
+WIRE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'flask', 'backend-socket',
+                         'app', 'utils', 'wire.py')
+spec = importlib.util.spec_from_file_location('wire', WIRE_PATH)
+wire = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(wire)
+
+def make_messages(rng, count):
+    """payloads in the format of Message.to_dict, half direct and half conversation messages"""
+    users = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(100)]
+    conversations = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(20)]
+    start = datetime(2025, 1, 1)
+    messages = []
+    for i in range(count):
+        message_data = {
+            'message_id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            'sender_id': rng.choice(users),
+            'content': ''.join(rng.choice(string.ascii_letters + ' ') for _ in range(rng.randint(10, 200))),
+            'timestamp': (start + timedelta(milliseconds=i * 731)).isoformat(),
+            'is_read': False
+        }
+        if i % 2:
+            message_data['conversation_id'] = rng.choice(conversations)
+        else:
+            message_data['recipient_id'] = rng.choice(users)
+        messages.append(message_data)
+    return messages
+
+def packet_bytes(encoded):
+    """bytes on the wire of an encoded packet, binary packets are a text frame plus attachments"""
+    if isinstance(encoded, list):
+        return len(encoded[0].encode()) + sum(len(attachment) for attachment in encoded[1:])
+    return len(encoded.encode())
+
+def encode_json(event, payload):
+    return packet.Packet(packet.EVENT, data=[event, payload]).encode()
+
+def encode_compact(event, payload):
+    return packet.Packet(packet.EVENT, data=[event, wire.encode(payload)]).encode()
+
+def decode_json(encoded):
+    return json.loads(encoded[encoded.index('['):])
+
+def decode_compact(encoded):
+    return msgpack.unpackb(encoded[1])
+
+def measure(events, encoder, decoder, repeat):
+    """(bytes, encode ms, decode ms) for the events, CPU time per pass"""
+    encoded = [encoder(event, payload) for event, payload in events]
+    size = sum(packet_bytes(e) for e in encoded)
+
+    start = time.process_time()
+    for _ in range(repeat):
+        for event, payload in events:
+            encoder(event, payload)
+    encode_ms = (time.process_time() - start) * 1000 / repeat
+
+    start = time.process_time()
+    for _ in range(repeat):
+        for e in encoded:
+            decoder(e)
+    decode_ms = (time.process_time() - start) * 1000 / repeat
+    return size, encode_ms, decode_ms
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=10000, help='messages to encode')
+    parser.add_argument('--batch-size', type=int, default=100, help='messages per message_batch event')
+    parser.add_argument('--repeat', type=int, default=5, help='passes per timing')
+    args = parser.parse_args()
+
+    messages = make_messages(random.Random(42), args.messages)
+    workloads = {
+        'single': [('private_message', m) for m in messages],
+        'batch': [('message_batch', {'messages': messages[i:i + args.batch_size]})
+                  for i in range(0, len(messages), args.batch_size)]
+    }
+
+    logger.info(f"{args.messages} messages, {args.batch_size} per batch")
+    logger.info(f"{'events':>7} {'format':>8} {'bytes':>10} {'per msg':>8} {'encode ms':>10} {'decode ms':>10}")
+    for name, events in workloads.items():
+        results = {
+            'json': measure(events, encode_json, decode_json, args.repeat),
+            'compact': measure(events, encode_compact, decode_compact, args.repeat)
+        }
+        for wire_format, (size, encode_ms, decode_ms) in results.items():
+            logger.info(f"{name:>7} {wire_format:>8} {size:>10} {size / args.messages:>8.1f} "
+                        f"{encode_ms:>10.1f} {decode_ms:>10.1f}")
+        saved = 1 - results['compact'][0] / results['json'][0]
+        logger.info(f"{name:>7} compact saves {saved:.1%} of the bytes")
+
+if __name__ == "__main__":
+    main()